@@ -0,0 +1,5 @@
+"""Tools for extracting and analysing CMIP5 and CMIP6 energy budget data.
+
+The notebooks in ``notebooks/`` use these modules; the extraction entry point
+is ``python -m cmip56forcing.extract``.
+"""
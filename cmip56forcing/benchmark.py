@@ -0,0 +1,152 @@
+"""Time the extraction over a synthetic archive, without access to the real one.
+
+A synthetic archive (see ``synthetic``) is written to a temporary directory, or
+an existing one is used with ``--archive``, and the stages of the extraction
+are timed over it with a fresh catalogue, weights cache and output directory:
+cataloguing the archive, planning the units and extracting them. The input
+files read per second and GB per second of the extraction, the peak resident
+memory of this process and of the largest worker, and the time of each stage,
+with the extraction divided into the stages recorded by ``instrument``, are
+reported, and with ``--results`` appended as a JSON line so that runs can be
+compared over time. Example::
+
+    python -m cmip56forcing.benchmark --years 165 --grid 144x192 --workers 4 --results bench.jsonl
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from . import instrument, synthetic
+from .catalogue import open_catalogue
+from .extract import plan_units, run_units
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of the largest child process waited for, in MB."""
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    scale = 2**20 if sys.platform == 'darwin' else 2**10
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    )
+
+
+def run_benchmark(archive, work, experiments, models, workers=1, reader='auto', chunk_mb=None, timeout=None):
+    """Catalogue, plan and extract the units of archive, using work for everything written.
+
+    returns: dict of the measurements
+    """
+    events = os.path.join(work, 'events.jsonl')
+    if os.path.exists(events):
+        os.remove(events)
+    stages = {}
+    start = time.perf_counter()
+    catalogue = open_catalogue(archive, os.path.join(work, 'catalogue.sqlite'))
+    stages['catalogue'] = time.perf_counter() - start
+
+    units = {}
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')), instrument.record(events):
+        for experiment in experiments:
+            units[experiment] = plan_units(experiment, catalogue, models)
+    stages['plan'] = time.perf_counter() - start
+
+    files = [file for experiment in experiments for _, _, filelists in units[experiment]
+             for var in filelists for file in filelists[var]]
+    nbytes = sum(os.path.getsize(file) for file in files)
+    results = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        for experiment in experiments:
+            results.extend(run_units(
+                units[experiment], experiment, workers, timeout=timeout, output=os.path.join(work, 'output'),
+                chunk_mb=chunk_mb, cache_dir=os.path.join(work, 'grid_weights'), reader=reader, events=events,
+            )[0])
+    stages['extract'] = time.perf_counter() - start
+
+    rss_main, rss_worker = peak_rss_mb()
+    return {
+        'runs': len(results),
+        'failed': sum(1 for result in results if not result[2]),
+        'files': len(files),
+        'gb': nbytes / 1e9,
+        'files_per_s': len(files) / stages['extract'],
+        'gb_per_s': nbytes / 1e9 / stages['extract'],
+        'peak_rss_mb': rss_main,
+        'peak_worker_rss_mb': rss_worker,
+        'stages': stages,
+        # summed over runs, so process time rather than wall time when there are several workers
+        'extract_stages': instrument.summarise(instrument.read_events(events))['stages']['seconds'].to_dict(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', help='existing synthetic archive to use instead of writing one')
+    parser.add_argument('--work', help='directory for the catalogue, cache and outputs (default: temporary)')
+    parser.add_argument('--experiments', nargs='+', default=['historical', 'piControl'], choices=sorted(synthetic.START))
+    parser.add_argument('--models', nargs='+', choices=[spec.name for spec in synthetic.SPECS])
+    parser.add_argument('--years', type=int, default=20, help='length of the historical runs')
+    parser.add_argument('--control-years', type=int, default=30, help='length of the piControl runs')
+    parser.add_argument('--years-per-file', type=int, default=10)
+    parser.add_argument('--members', type=int, default=1, help='historical runs per model')
+    parser.add_argument('--grid', type=synthetic.grid_size, help='NLATxNLON for every model, e.g. 144x192')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--reader', choices=['auto', 'iris'], default='auto')
+    parser.add_argument('--chunk-mb', type=float)
+    parser.add_argument('--timeout', type=float, help='seconds after which a run is abandoned')
+    parser.add_argument('--results', help='append the measurements to this JSON-lines file')
+    args = parser.parse_args(argv)
+
+    models = args.models or [spec.name for spec in synthetic.SPECS]
+    work = args.work or tempfile.mkdtemp(prefix='cmip56forcing-benchmark-')
+    try:
+        archive = args.archive
+        generate = None
+        if archive is None:
+            archive = os.path.join(work, 'archive')
+            start = time.perf_counter()
+            synthetic.write_archive(
+                archive, [spec for spec in synthetic.SPECS if spec.name in models], args.experiments, args.years,
+                args.control_years, args.years_per_file, args.members, args.grid,
+            )
+            generate = time.perf_counter() - start
+        measured = run_benchmark(
+            archive, work, args.experiments, models, args.workers, args.reader, args.chunk_mb, args.timeout
+        )
+    finally:
+        if args.work is None:
+            shutil.rmtree(work, ignore_errors=True)
+
+    print('%d runs (%d failed), %d files, %.3f GB' % (measured['runs'], measured['failed'], measured['files'], measured['gb']))
+    print('extraction: %.1f files/s, %.3f GB/s' % (measured['files_per_s'], measured['gb_per_s']))
+    print('peak RSS: %.0f MB main process, %.0f MB largest worker' % (measured['peak_rss_mb'], measured['peak_worker_rss_mb']))
+    if generate is not None:
+        print('%-10s %8.2f s' % ('generate', generate))
+    for stage, seconds in measured['stages'].items():
+        print('%-10s %8.2f s' % (stage, seconds))
+    for stage, seconds in measured['extract_stages'].items():
+        print('  %-18s %8.2f s' % (stage, seconds))
+
+    if args.results:
+        record = dict(measured)
+        record.update({
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'host': platform.node(),
+            'options': {key: value for key, value in vars(args).items() if key not in ['results', 'work']},
+        })
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
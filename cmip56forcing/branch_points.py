@@ -0,0 +1,413 @@
+"""Rows of the piControl that each run branches from.
+
+Each run's ``branch_time_in_parent`` and ``parent_time_units`` from its
+meta JSON give the year of the piControl it branched from; the row of that
+year in the piControl's annual means is its branch point. Each piControl is
+read once and indexed by year, so that a branch year is found with one array
+lookup, and all runs of an experiment are resolved at once. Branch times are
+converted to years with the length of year of the calendar recorded in the
+meta JSON at extraction; for outputs extracted before calendars were recorded
+the calendars known for each model are used.
+
+Models known to report their branch times inconsistently are corrected by the
+rules in ``data_input/branch_time_corrections.json`` before the lookup.
+
+This replaces the search in ``notebooks/find_branch_points.ipynb``;
+``python -m cmip56forcing.branch_points`` updates ``data_output/branch_points.json``.
+Only the runs whose meta JSON, or whose piControl, has been modified since the
+last build are read again and merged into the existing JSON, which is replaced
+atomically; ``--full`` reads them all. The time of the last build is kept in
+``cache/``, and the JSON is built in full when there is none or the corrections
+have changed since.
+"""
+
+import argparse
+import fnmatch
+import functools
+import glob
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import config
+
+DEFAULT_PATH = os.path.join(config.DATA_OUTPUT, 'branch_points.json')
+DEFAULT_CORRECTIONS = os.path.join(config.DATA_INPUT, 'branch_time_corrections.json')
+# what the branch points JSON was last built from, and when
+STATE_PATH = os.path.join(config.CACHE, 'branch_points_state.json')
+
+EXPERIMENTS = [
+    'historical', 'hist-nat', 'hist-GHG', 'hist-aer', 'historical-cmip5', 'hist-nat-cmip5', 'hist-GHG-cmip5',
+    'hist-aer-cmip5', 'abrupt-4xCO2',
+]
+
+# the piControl run that each model's experiments are compared against
+PICONTROL_RUNS = {
+    'ACCESS-CM2': 'r1i1p1f1',
+    'ACCESS-ESM1-5': 'r1i1p1f1',
+    'AWI-CM-1-1-MR': 'r1i1p1f1',
+    'CAMS-CSM1-0': 'r1i1p1f1',
+    'CanESM5': 'r1i1p1f1',
+    'CESM2': 'r1i1p1f1',
+    'CESM2-FV2': 'r1i1p1f1',
+    'CESM2-WACCM': 'r1i1p1f1',
+    'CESM2-WACCM-FV2': 'r1i1p1f1',
+    'CIESM': 'r1i1p1f1',
+    'CMCC-CM2-SR5': 'r1i1p1f1',
+    'CMCC-ESM2': 'r1i1p1f1',
+    'CNRM-CM6-1': 'r1i1p1f2',
+    'CNRM-ESM2-1': 'r1i1p1f2',
+    'EC-Earth3': 'r1i1p1f1',
+    'EC-Earth3-AerChem': 'r1i1p1f1',
+    'FGOALS-g3': 'r1i1p1f1',
+    'GFDL-CM4': 'r1i1p1f1',
+    'GFDL-ESM4': 'r1i1p1f1',
+    'GISS-E2-1-G': 'r1i1p1f2',
+    'HadGEM3-GC31-LL': 'r1i1p1f1',
+    'HadGEM3-GC31-MM': 'r1i1p1f1',
+    'INM-CM4-8': 'r1i1p1f1',
+    'INM-CM5-0': 'r1i1p1f1',
+    'IPSL-CM6A-LR': 'r1i1p1f1',
+    'MIROC6': 'r1i1p1f1',
+    'MIROC-ES2L': 'r1i1p1f2',
+    'MPI-ESM-1-2-HAM': 'r1i1p1f1',
+    'MPI-ESM1-2-HR': 'r1i1p1f1',
+    'MRI-ESM2-0': 'r1i1p1f1',
+    'NESM3': 'r1i1p1f1',
+    'NorESM2-LM': 'r1i1p1f1',
+    'NorESM2-MM': 'r1i1p1f1',
+    'TaiESM1': 'r1i1p1f1',
+    'UKESM1-0-LL': 'r1i1p1f2',
+}
+
+# the variant whose runs are used: r*i1p1f1 and so on
+VARIANTS = dict(PICONTROL_RUNS, **{'HadGEM3-GC31-LL': 'r1i1p1f3', 'HadGEM3-GC31-MM': 'r1i1p1f3'})
+
+# runs compared against a piControl other than their model's usual one: (experiment, model, run, piControl run)
+EXTRA_PAIRS = [
+    # GISS f1 4xCO2 with piControl f1
+    ('abrupt-4xCO2', 'GISS-E2-1-G', 'r1i1p1f1', 'r1i1p1f1'),
+]
+
+DAYS_PER_YEAR = {
+    '360_day': 360,
+    '365_day': 365,
+    'noleap': 365,
+    '366_day': 366,
+    'all_leap': 366,
+    'julian': 365.25,
+    'gregorian': 365.2425,
+    'standard': 365.2425,
+    'proleptic_gregorian': 365.2425,
+}
+
+# days per year of each model, for meta JSON written before the calendar was recorded
+KNOWN_DAYS_PER_YEAR = {
+    'ACCESS-CM2': 365.2425,
+    'ACCESS-ESM1-5': 365.2425,
+    'AWI-CM-1-1-MR': 365.2425,
+    'CAMS-CSM1-0': 365,
+    'CanESM5': 365,
+    'CESM2': 365,
+    'CESM2-FV2': 365,
+    'CESM2-WACCM': 365,
+    'CESM2-WACCM-FV2': 365,
+    'CIESM': 365,
+    'CMCC-CM2-SR5': 365,
+    'CMCC-ESM2': 365,
+    'CNRM-CM6-1': 365.2425,
+    'CNRM-ESM2-1': 365.2425,
+    'EC-Earth3': 365.2425,
+    'EC-Earth3-AerChem': 365.2425,
+    'FGOALS-g3': 365,
+    'GFDL-CM4': 365,
+    'GFDL-ESM4': 365,
+    'GISS-E2-1-G': 365,
+    'HadGEM3-GC31-LL': 360,
+    'HadGEM3-GC31-MM': 360,
+    'INM-CM4-8': 365,
+    'INM-CM5-0': 365,
+    'IPSL-CM6A-LR': 365.2425,
+    'KACE-1-0-G': 360,
+    'MIROC6': 365.2425,
+    'MIROC-ES2L': 365.2425,
+    'MPI-ESM-1-2-HAM': 365.2425,
+    'MPI-ESM1-2-HR': 365.2425,
+    'MRI-ESM2-0': 365.2425,
+    'NESM3': 365.2425,
+    'NorESM2-LM': 365,
+    'NorESM2-MM': 365,
+    'TaiESM1': 365,
+    'UKESM1-0-LL': 360,
+}
+
+# years a run has to overlap with the piControl from its branch point
+LENGTH = 165
+
+
+def control_experiment(experiment):
+    return 'piControl-cmip5' if experiment.endswith('-cmip5') else 'piControl'
+
+
+class Control:
+    """The years of a piControl's annual means, indexed for lookup.
+
+    years: integer year of each row
+    """
+
+    def __init__(self, years):
+        self.years = np.asarray(years, dtype=int)
+        self.first = self.years.min() if len(self.years) else 0
+        span = self.years.max() - self.first + 1 if len(self.years) else 0
+        # row of each year from first, -1 where there is none and -2 where there are several
+        self.rows = np.full(span, -1)
+        counts = np.bincount(self.years - self.first, minlength=span)
+        self.rows[self.years - self.first] = np.arange(len(self.years))
+        self.rows[counts > 1] = -2
+
+    def __len__(self):
+        return len(self.years)
+
+    def rows_of(self, years):
+        """Row of each of years, -1 where the year is missing or not unique."""
+        years = np.asarray(years) - self.first
+        inside = (years >= 0) & (years < len(self.rows))
+        rows = np.full(years.shape, -1)
+        rows[inside] = np.maximum(self.rows[years[inside]], -1)
+        return rows
+
+
+def read_years(path):
+    """Integer years of an annual means CSV, from its year column or its dates."""
+    frame = pd.read_csv(path, usecols=lambda column: column in ['time', 'year'], dtype={'time': str})
+    if 'year' in frame:
+        return frame['year'].to_numpy()
+    return frame['time'].str.split('-').str[0].astype(int).to_numpy()
+
+
+def load_control(model, run, experiment='piControl', output=config.DATA_OUTPUT):
+    """The piControl of a model, read once for as long as its CSV is unchanged."""
+    path = os.path.join(output, 'cmip6', model, run, '%s.csv' % experiment)
+    return _read_control(path, os.stat(path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_control(path, mtime_ns):
+    return Control(read_years(path))
+
+
+def load_corrections(path=DEFAULT_CORRECTIONS):
+    """Corrections to the branch time metadata of models known to report it inconsistently."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def apply_exceptions(meta, model, experiment, run, corrections):
+    """Correct a run's meta dict in place.
+
+    corrections: list of rules, as in load_corrections, applied in order to the runs matching all of
+    the rule's 'models', 'experiments' and 'runs' patterns (all runs where one is left out). A rule
+    can 'parse' fields given as Fortran double precision strings such as '0.0D0', 'set' fields to a
+    value and 'add' a value to fields.
+    """
+    for rule in corrections:
+        names = [('models', model), ('experiments', experiment), ('runs', run)]
+        if not all(any(fnmatch.fnmatchcase(name, pattern) for pattern in rule.get(key, ['*'])) for key, name in names):
+            continue
+        for field in rule.get('parse', []):
+            if isinstance(meta[field], str):
+                meta[field] = float(meta[field].split('D')[0])
+        meta.update(rule.get('set', {}))
+        for field, value in rule.get('add', {}).items():
+            meta[field] = meta[field] + value
+    return meta
+
+
+def days_per_year(meta, model, run):
+    """Length of year of the run's calendar, as recorded at extraction or else as known for the model."""
+    if 'calendar' in meta:
+        if meta['calendar'] not in DAYS_PER_YEAR:
+            raise ValueError('calendar %s of %s %s' % (meta['calendar'], model, run))
+        return DAYS_PER_YEAR[meta['calendar']]
+    if model not in KNOWN_DAYS_PER_YEAR:
+        raise ValueError('no calendar recorded for %s %s' % (model, run))
+    return KNOWN_DAYS_PER_YEAR[model]
+
+
+def branch_years(metas, models, runs):
+    """Year of the piControl each run branched from, for lists of corrected meta dicts and their models and runs."""
+    times = np.array([meta['branch_time_in_parent'] for meta in metas], dtype=float)
+    divisors = np.empty(len(metas))
+    offsets = np.empty(len(metas), dtype=int)
+    for n, (meta, model, run) in enumerate(zip(metas, models, runs)):
+        unit, _, since = meta['parent_time_units'].split()[:3]
+        if unit == 'days':
+            divisors[n] = days_per_year(meta, model, run)
+        elif unit == 'years':
+            divisors[n] = 1
+        else:
+            raise ValueError('parent_time_units of %s in %s' % (unit, model))
+        offsets[n] = int(since[:4])
+    return np.round(times / divisors).astype(int) + offsets
+
+
+def resolve(runs, output=config.DATA_OUTPUT, length=LENGTH):
+    """Branch rows of many runs at once.
+
+    runs: list of (model, run, piControl run, piControl experiment, corrected meta dict)
+    length: years the run must overlap the piControl for from the branch point
+
+    returns: array of the row of each run's branch point, -1 where there is none
+    """
+    rows = np.full(len(runs), -1)
+    if len(runs) == 0:
+        return rows
+    years = branch_years([meta for *_, meta in runs], [model for model, *_ in runs], [run for _, run, *_ in runs])
+    controls = {}
+    for n, (model, _, control_run, control_experiment, _) in enumerate(runs):
+        controls.setdefault((model, control_run, control_experiment), []).append(n)
+    for (model, control_run, control_experiment), members in controls.items():
+        control = load_control(model, control_run, control_experiment, output)
+        found = control.rows_of(years[members])
+        found[found + length > len(control)] = -1
+        rows[members] = found
+    return rows
+
+
+def read_meta(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, obj, **kwargs):
+    """Write JSON to path atomically, so that it is never seen half written."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(obj, f, **kwargs)
+    os.replace(tmp, path)
+
+
+def meta_paths(experiment, output=config.DATA_OUTPUT, models=None):
+    """(model, run, piControl run, meta JSON path) of the runs of an experiment to resolve.
+
+    These are all runs of each model's variant with a meta JSON, then the EXTRA_PAIRS.
+    """
+    found = []
+    for model in models or PICONTROL_RUNS:
+        if experiment.endswith('-cmip5') and model not in ['CanESM5']:
+            continue
+        pattern = os.path.join(output, 'cmip6', model, 'r*%s' % VARIANTS[model][-6:], 'meta_%s.json' % experiment)
+        for path in sorted(glob.glob(pattern)):
+            found.append((model, os.path.basename(os.path.dirname(path)), PICONTROL_RUNS[model], path))
+    for pair_experiment, model, run, control_run in EXTRA_PAIRS:
+        path = os.path.join(output, 'cmip6', model, run, 'meta_%s.json' % experiment)
+        if pair_experiment == experiment and (models is None or model in models) and os.path.exists(path):
+            found.append((model, run, control_run, path))
+    return found
+
+
+def modified_since(path, since):
+    """Whether path exists and was modified at or after the time since."""
+    try:
+        return os.stat(path).st_mtime >= since
+    except FileNotFoundError:
+        return False
+
+
+def update_branch_points(results, experiments=EXPERIMENTS, output=config.DATA_OUTPUT, models=None, corrections=None,
+                         since=None):
+    """Bring branch points up to date with the meta JSON under output, in place.
+
+    results: dict of experiment to model to run to branch row, as from an earlier call
+    since: only resolve runs whose meta JSON or piControl CSV was modified at or after this time
+    (seconds since the epoch), keeping the rows in results for the others; None to resolve all runs
+
+    Runs whose meta JSON has gone are dropped. Experiments not in results are resolved in full.
+
+    returns: results and the number of meta JSON read
+    """
+    corrections = load_corrections() if corrections is None else corrections
+    read = 0
+    for experiment in experiments:
+        found = meta_paths(experiment, output, models)
+        previous = results.get(experiment)
+        current = {}
+        runs = []
+        for model, run, control_run, path in found:
+            control = os.path.join(output, 'cmip6', model, control_run, '%s.csv' % control_experiment(experiment))
+            if previous is None or since is None or modified_since(path, since) or modified_since(control, since):
+                meta = apply_exceptions(read_meta(path), model, experiment, run, corrections)
+                runs.append((model, run, control_run, control_experiment(experiment), meta))
+                row = None
+            else:
+                row = previous.get(model, {}).get(run)
+            # None for no branch row, keeping the runs in the order of a full build
+            current.setdefault(model, {})[run] = row
+        for (model, run, *_), row in zip(runs, resolve(runs, output)):
+            current[model][run] = int(row) if row >= 0 else None
+        results[experiment] = {
+            model: {run: row for run, row in rows.items() if row is not None} for model, rows in current.items()
+        }
+        read = read + len(runs)
+    return results, read
+
+
+def find_branch_points(experiments=EXPERIMENTS, output=config.DATA_OUTPUT, models=None, corrections=None):
+    """dict of experiment to model to run to branch row, for the runs that have one.
+
+    Models with runs in an experiment are listed even if none of their runs has a branch row.
+    """
+    return update_branch_points({}, experiments, output, models, corrections)[0]
+
+
+def update(path=DEFAULT_PATH, output=config.DATA_OUTPUT, corrections_path=DEFAULT_CORRECTIONS, state_path=STATE_PATH,
+           full=False):
+    """Update the branch points JSON at path, reading only the meta JSON modified since it was last built.
+
+    The time of each build is kept in state_path with what it was built from. The branch points are
+    rebuilt in full when asked, when there is no earlier build, or when the JSON, the output tree or
+    the corrections differ from those of the last build.
+
+    returns: the branch points and the number of meta JSON read
+    """
+    started = time.time()
+    corrections = load_corrections(corrections_path)
+    state = {'path': os.path.abspath(path), 'output': os.path.abspath(output), 'corrections': corrections}
+    results = {}
+    since = None
+    if not full and os.path.exists(state_path) and os.path.exists(path):
+        last = read_meta(state_path)
+        if all(last.get(key) == value for key, value in state.items()):
+            results = read_meta(path)
+            since = last['built']
+    results, read = update_branch_points(results, output=output, corrections=corrections, since=since)
+    write_json(path, results, indent=4)
+    # the start of this build, so that meta JSON written while it ran are read again next time
+    state['built'] = started
+    write_json(state_path, state)
+    return results, read
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find the piControl row each run branches from.')
+    parser.add_argument('--output', default=config.DATA_OUTPUT, help='top of the extracted CSV tree')
+    parser.add_argument('--path', default=DEFAULT_PATH, help='branch points JSON to write')
+    parser.add_argument('--corrections', default=DEFAULT_CORRECTIONS, help='branch time corrections JSON')
+    parser.add_argument('--state', default=STATE_PATH, help='record of the last build')
+    parser.add_argument('--full', action='store_true',
+                        help='read every meta JSON, not just those modified since the last build')
+    args = parser.parse_args(argv)
+
+    results, read = update(args.path, args.output, args.corrections, args.state, args.full)
+    print('%d meta JSON read, %d branch points written to %s' % (
+        read, sum(len(runs) for models in results.values() for runs in models.values()), args.path))
+
+
+if __name__ == '__main__':
+    main()
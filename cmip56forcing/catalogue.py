@@ -0,0 +1,186 @@
+"""SQLite catalogue of the netCDF files in the CMIP6 archive.
+
+Globbing the DRS tree on NFS once per variable per model, and again per run,
+is slower than some of the reads. The archive is instead walked once and every
+file recorded as (model, experiment, member, table, variable, version, path,
+size, mtime). Directory modification times are stored too, so a rescan only
+lists directories whose mtime has changed; directories that have not changed
+are only stat-ed on the way down.
+
+Example::
+
+    python -m cmip56forcing.catalogue scan
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+from . import config
+
+DEFAULT_DB = os.path.join(config.CACHE, 'catalogue.sqlite')
+
+# <model>/<experiment>/<member>/<table>/<variable>/<version>/<file>.nc
+DRS = ['model', 'experiment', 'member', 'tbl', 'variable', 'version']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    model TEXT NOT NULL,
+    experiment TEXT NOT NULL,
+    member TEXT NOT NULL,
+    tbl TEXT NOT NULL,
+    variable TEXT NOT NULL,
+    version TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_lookup ON files (model, experiment, variable, tbl, member);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+"""
+
+
+class Catalogue:
+    """Index of the archive rooted at archive, stored in the SQLite file db."""
+
+    def __init__(self, archive=config.ARCHIVE, db=DEFAULT_DB):
+        self.archive = os.path.abspath(archive)
+        self.db = db
+        if os.path.dirname(db):
+            os.makedirs(os.path.dirname(db), exist_ok=True)
+        self.conn = sqlite3.connect(db)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def is_empty(self):
+        return self.conn.execute('SELECT COUNT(*) FROM dirs').fetchone()[0] == 0
+
+    def scan(self, full=False):
+        """Walk the archive and bring the catalogue up to date.
+
+        full: list every directory even if its mtime is unchanged
+        returns: dict with numbers of directories stat-ed and listed and files added and removed
+        """
+        stats = {'stat': 0, 'listed': 0, 'added': 0, 'removed': 0}
+        with self.conn:
+            self._scan_dir(self.archive, None, full, stats)
+        return stats
+
+    def _scan_dir(self, path, parent, full, stats):
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._forget_dir(path, stats)
+            return
+        stats['stat'] = stats['stat'] + 1
+        row = self.conn.execute('SELECT mtime_ns FROM dirs WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[0] == mtime_ns and not full:
+            subdirs = [r[0] for r in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,))]
+        else:
+            subdirs = self._list_dir(path, stats)
+            self.conn.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)', (path, parent, mtime_ns))
+        for subdir in subdirs:
+            self._scan_dir(subdir, path, full, stats)
+
+    def _list_dir(self, path, stats):
+        """Record the netCDF files in path and return its subdirectories."""
+        stats['listed'] = stats['listed'] + 1
+        subdirs = []
+        files = {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif entry.name.endswith('.nc'):
+                    files[entry.path] = entry.stat()
+        parts = os.path.relpath(path, self.archive).split(os.sep)
+        known = set(r[0] for r in self.conn.execute('SELECT path FROM files WHERE dir = ?', (path,)))
+        if len(parts) == len(DRS):
+            for file, st in files.items():
+                if file not in known:
+                    stats['added'] = stats['added'] + 1
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [file, path] + parts + [st.st_size, st.st_mtime],
+                )
+        gone = known - set(files)
+        stats['removed'] = stats['removed'] + len(gone)
+        self.conn.executemany('DELETE FROM files WHERE path = ?', [(file,) for file in gone])
+        for subdir in set(r[0] for r in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,))) - set(subdirs):
+            self._forget_dir(subdir, stats)
+        return sorted(subdirs)
+
+    def _forget_dir(self, path, stats):
+        for subdir in [r[0] for r in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,))]:
+            self._forget_dir(subdir, stats)
+        stats['removed'] = stats['removed'] + self.conn.execute('DELETE FROM files WHERE dir = ?', (path,)).rowcount
+        self.conn.execute('DELETE FROM dirs WHERE path = ?', (path,))
+
+    def files(self, model, experiment, variable, member=None, table='Amon'):
+        """Sorted paths of the files for a variable, for one member or all of them."""
+        query = 'SELECT path FROM files WHERE model = ? AND experiment = ? AND variable = ? AND tbl = ?'
+        args = [model, experiment, variable, table]
+        if member is not None:
+            query = query + ' AND member = ?'
+            args.append(member)
+        return [r[0] for r in self.conn.execute(query + ' ORDER BY path', args)]
+
+    def members(self, model, experiment, variables, table='Amon'):
+        """Sorted members that have files for any of the variables."""
+        query = 'SELECT DISTINCT member FROM files WHERE model = ? AND experiment = ? AND tbl = ? AND variable IN (%s)' % (
+            ', '.join('?' * len(variables))
+        )
+        return sorted(r[0] for r in self.conn.execute(query, [model, experiment, table] + list(variables)))
+
+    def stat(self, paths):
+        """Catalogued (size, mtime) of each of paths that is in the catalogue."""
+        stats = {}
+        for path in paths:
+            row = self.conn.execute('SELECT size, mtime FROM files WHERE path = ?', (path,)).fetchone()
+            if row is not None:
+                stats[path] = tuple(row)
+        return stats
+
+
+def open_catalogue(archive=config.ARCHIVE, db=DEFAULT_DB, rescan=False):
+    """Open the catalogue, scanning the archive first if it is empty or rescan is set."""
+    catalogue = Catalogue(archive, db)
+    if rescan or catalogue.is_empty():
+        _report_scan(catalogue)
+    return catalogue
+
+
+def _report_scan(catalogue, full=False):
+    start = time.perf_counter()
+    stats = catalogue.scan(full)
+    print(
+        'catalogue: stat %d directories, listed %d, %d files added, %d removed in %.1f s'
+        % (stats['stat'], stats['listed'], stats['added'], stats['removed'], time.perf_counter() - start)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['scan'])
+    parser.add_argument('--archive', default=config.ARCHIVE)
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--full', action='store_true', help='list every directory, not just changed ones')
+    args = parser.parse_args(argv)
+
+    catalogue = Catalogue(args.archive, args.db)
+    _report_scan(catalogue, args.full)
+    catalogue.close()
+
+
+if __name__ == '__main__':
+    main()
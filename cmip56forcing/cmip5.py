@@ -0,0 +1,173 @@
+"""CMIP5 runs of Forster et al. (2013), from their IDL save files.
+
+``data_input/cmip5_Forster_etal_2013`` holds one save file per variable and
+run, ``<variable>_<model>_<experiment>_<run>.idlsave``, of the run's monthly
+global means ('time' in fractional years and the variable) and those of its
+piControl over the same months ('ctrl'). Each file is converted once into an
+uncompressed ``.npz`` under ``cache/`` and read from there afterwards, until
+the save file changes.
+
+Runs are annualized 12 months at a time with a reshape, into years 1850 to
+2005 as ``notebooks/produce_results.ipynb`` aligned them: a run's first year
+is the year its first month falls in; HadGEM runs, which start in December,
+take their years 11 months earlier and from one year later, leaving their first
+year empty, and a final partial year is the mean of the months there are.
+Runs missing a variable, with variables of different lengths, or whose
+piControl is shorter than the run, are left out. The runs and their piControls
+are returned as two Ensembles laid out as the CMIP6 data, with the piControl of
+each member aligned year for year.
+"""
+
+import glob
+import os
+import tempfile
+
+import numpy as np
+
+from . import config, implied_erf
+from .ensemble import Ensemble
+
+DIRECTORY = os.path.join(config.DATA_INPUT, 'cmip5_Forster_etal_2013')
+CACHE_DIR = os.path.join(config.CACHE, 'cmip5_Forster_etal_2013')
+
+EXPERIMENTS = ['historical', 'historicalNat', 'historicalGHG']
+FIRST_YEAR = 1850
+YEARS = 156
+
+# models left out: CCSM4 is sick
+EXCLUDE = ['CCSM4']
+
+
+def parse_name(path):
+    """(variable, model, experiment, run) of a save file."""
+    variable, model, experiment, run = os.path.basename(path)[:-len('.idlsave')].split('_')
+    return variable, model, experiment, run
+
+
+def read_save(path, cache_dir=CACHE_DIR):
+    """dict of 'time', 'values' and 'ctrl' of a save file, converted once to a cached .npz."""
+    cached = os.path.join(cache_dir, os.path.basename(path)[:-len('.idlsave')] + '.npz')
+    if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(path):
+        from scipy.io import readsav
+
+        variable = parse_name(path)[0]
+        save = readsav(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, time=save['time'], values=save[variable], ctrl=save['ctrl'])
+        os.replace(tmp, cached)
+    with np.load(cached) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def alignment(model, first_time):
+    """Year index of a run's first year from FIRST_YEAR, and the months its years are offset by."""
+    first = int(first_time - FIRST_YEAR)
+    if model.startswith('Had'):
+        return first + 1, -11
+    return first, 0
+
+
+def annual_means(monthly, first, offset, years=YEARS):
+    """Means of 12 months at a time, in years first to years from FIRST_YEAR; NaN where there are none.
+
+    The months of year first + n start at 12 n + offset; years starting before the series are empty,
+    and a year running past its end is the mean of the months there are.
+    """
+    means = np.full(years, np.nan)
+    starts = 12 * np.arange(max(years - first, 0)) + offset
+    whole = np.flatnonzero((starts >= 0) & (starts + 12 <= len(monthly)))
+    if len(whole):
+        block = monthly[starts[whole[0]]:starts[whole[-1]] + 12]
+        means[first + whole] = block.reshape(-1, 12).mean(axis=1)
+    partial = np.flatnonzero((starts >= 0) & (starts < len(monthly)) & (starts + 12 > len(monthly)))
+    for n in partial:
+        means[first + n] = np.mean(monthly[starts[n]:])
+    return means
+
+
+def find_runs(directory=DIRECTORY, experiments=EXPERIMENTS, models=None, exclude=EXCLUDE):
+    """dict of experiment to model to sorted list of runs with a save file of any variable."""
+    runs = {experiment: {} for experiment in experiments}
+    for path in sorted(glob.glob(os.path.join(directory, '*.idlsave'))):
+        _, model, experiment, run = parse_name(path)
+        if experiment not in runs or model in exclude or (models is not None and model not in models):
+            continue
+        names = runs[experiment].setdefault(model, [])
+        if run not in names:
+            names.append(run)
+    return {experiment: {model: sorted(runs[experiment][model]) for model in sorted(runs[experiment])}
+            for experiment in experiments}
+
+
+def read_run(model, experiment, run, directory=DIRECTORY, variables=config.VARIABLES, cache_dir=CACHE_DIR):
+    """Annual means of a run and of its piControl, each years x variable; None if the run is incomplete."""
+    saves = {}
+    for variable in variables:
+        path = os.path.join(directory, '%s_%s_%s_%s.idlsave' % (variable, model, experiment, run))
+        if not os.path.exists(path):
+            return None
+        saves[variable] = read_save(path, cache_dir)
+    # as long as tas, as the piControl of every variable is compared over the months of tas
+    length = len(saves['tas']['values'])
+    if any(len(save['values']) != length or len(save['ctrl']) < length for save in saves.values()):
+        return None
+    first, offset = alignment(model, saves['tas']['time'][0])
+    values = np.stack([annual_means(saves[variable]['values'], first, offset) for variable in variables], axis=-1)
+    ctrl = np.stack([annual_means(saves[variable]['ctrl'], first, offset) for variable in variables], axis=-1)
+    return values, ctrl
+
+
+def load(experiments=EXPERIMENTS, directory=DIRECTORY, models=None, exclude=EXCLUDE, variables=config.VARIABLES,
+         cache_dir=CACHE_DIR):
+    """Ensembles of the runs and of their piControls, year for year from FIRST_YEAR.
+
+    models: models to load, by default all those with save files
+    """
+    found = find_runs(directory, experiments, models, exclude)
+    complete = {}
+    for experiment in experiments:
+        for model, names in found[experiment].items():
+            for run in names:
+                series = read_run(model, experiment, run, directory, variables, cache_dir)
+                if series is not None:
+                    complete[experiment, model, run] = series
+    labels = sorted({model for experiment, model, _ in complete})
+    members = max([sum(1 for key in complete if key[:2] == (experiment, model))
+                   for experiment in experiments for model in labels] + [1])
+
+    shape = (len(experiments), len(labels), members)
+    names = np.full(shape, '', dtype=object)
+    data = np.full(shape + (YEARS, len(variables)), np.nan)
+    ctrl = np.full(shape + (YEARS, len(variables)), np.nan)
+    slots = np.zeros(shape[:2], dtype=int)
+    for (experiment, model, run), (values, control) in complete.items():
+        e, m = experiments.index(experiment), labels.index(model)
+        k = slots[e, m]
+        slots[e, m] = k + 1
+        names[e, m, k] = run
+        data[e, m, k] = values
+        ctrl[e, m, k] = control
+    names = names.astype(str)
+    first_year = np.where(names != '', FIRST_YEAR, -1)
+    return (
+        Ensemble(experiments, labels, variables, names, data, ~np.isnan(data).all(axis=-1), first_year),
+        Ensemble(experiments, labels, variables, names, ctrl, ~np.isnan(ctrl).all(axis=-1), first_year),
+    )
+
+
+def ensemble_erf(runs, controls, feedbacks, baseline='pointwise'):
+    """Implied ERF of each experiment, as implied_erf.ensemble_erf, from runs and their aligned piControls.
+
+    feedbacks: dict of model to λ; models without one give NaN
+    baseline: one of implied_erf.BASELINES; the save files have only the piControl years parallel to each run,
+        so the drift is fitted to those
+    """
+    feedback = np.array([feedbacks.get(model, np.nan) for model in runs.models])
+    starts = np.where(runs.runs != '', 0, -1)
+    return {
+        experiment: implied_erf.implied_erf(
+            runs.data[e], controls.data[e], starts[e], feedback[:, None], YEARS, runs.variables, baseline)
+        for e, experiment in enumerate(runs.experiments)
+    }
@@ -0,0 +1,76 @@
+"""Paths, models and experiments shared by the extraction and analysis code."""
+
+import json
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_INPUT = os.path.join(ROOT, 'data_input')
+DATA_OUTPUT = os.path.join(ROOT, 'data_output')
+# Derived files that can be regenerated at any time
+CACHE = os.path.join(ROOT, 'cache')
+
+# Local mirror of the CMIP6 archive in DRS layout:
+# <model>/<experiment>/<member>/<table>/<variable>/<version>/<file>.nc
+ARCHIVE = '/nfs/b0110/Data/cmip6'
+
+# Energy budget variables
+VARIABLES = ['rsdt', 'rlut', 'rsut', 'tas']
+
+EXPERIMENTS = [
+    'piControl',
+    'historical',
+    'hist-GHG',
+    'hist-nat',
+    'hist-aer',
+    'abrupt-4xCO2',
+    'piControl-cmip5',
+    'historical-cmip5',
+    'hist-GHG-cmip5',
+    'hist-nat-cmip5',
+    'hist-aer-cmip5',
+]
+
+# These are a small number of models that I know well, so we can be explicit in which runs
+# we want to use. For CanESM5 and GISS-E2-1-G we always use r1i1p1f1 for overall
+# consistency with the other experiments.
+ABRUPT_4XCO2_RUNS = {
+    'CanESM5': 'r1i1p1f1',
+    'CNRM-CM6-1': 'r1i1p1f2',
+    'GFDL-CM4': 'r1i1p1f1',
+    'GISS-E2-1-G': 'r1i1p1f1',
+    'HadGEM3-GC31-LL': 'r1i1p1f3',
+    'IPSL-CM6A-LR': 'r1i1p1f1',
+    'MIROC6': 'r1i1p1f1',
+    'NorESM2-LM': 'r1i1p1f1',
+}
+
+
+def load_feedbacks():
+    """Mark Zelinka's forcing, feedback and ECS results for CMIP5 and CMIP6."""
+    with open(os.path.join(DATA_INPUT, 'cmip56_forcing_feedback_ecs.json'), 'rb') as f:
+        return json.load(f)
+
+
+def experiment_models(experiment):
+    """Default list of models to extract for an experiment.
+
+    We only care about models where Mark has crunched the data, the RFMIP-ERF
+    models for abrupt-4xCO2, and CanESM5 for the CMIP5-forcing experiments.
+    """
+    if experiment.endswith('-cmip5'):
+        return ['CanESM5']
+    if experiment == 'abrupt-4xCO2':
+        return list(ABRUPT_4XCO2_RUNS)
+    return list(load_feedbacks()['CMIP6'])
+
+
+def experiment_runs(experiment, model):
+    """Runs fixed in advance for this experiment and model, or None to use all found."""
+    if experiment == 'abrupt-4xCO2':
+        return [ABRUPT_4XCO2_RUNS[model]]
+    return None
+
+
+def writes_meta(experiment):
+    """Whether to dump the global attributes; we don't need branch times from controls."""
+    return not experiment.startswith('piControl')
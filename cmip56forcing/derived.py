@@ -0,0 +1,116 @@
+"""Experiments defined as weighted sums of others, such as hist-otheranthro.
+
+A derived experiment is a dict of the experiments it combines to their
+weights. Its members are the runs found in every one of them, matched by run
+name within each model, in the order of the first; its series are the weighted
+sum of theirs, formed for all models and members in one array operation the
+first time the experiment is asked for and kept after that. Derived
+experiments can themselves be combined::
+
+    erf = derived.ExperimentSet.from_ensemble(runs, implied_erf.ensemble_erf(runs, controls, points, feedbacks))
+    erf['hist-otheranthro'].delta_F  # model x member x year
+    erf.runs('hist-otheranthro')     # the run in each member slot
+
+Weights of 1 and -1 give exactly the differences the notebooks formed run by run.
+"""
+
+import numpy as np
+
+DEFINITIONS = {
+    # forcings other than well-mixed greenhouse gases and natural, mostly aerosols and ozone
+    'hist-otheranthro': {'historical': 1, 'hist-GHG': -1, 'hist-nat': -1},
+    'hist-otheranthro-cmip5': {'historical-cmip5': 1, 'hist-GHG-cmip5': -1, 'hist-nat-cmip5': -1},
+    # what the single-forcing experiments do not add up to: other forcings, such as ozone and land use, and
+    # the nonlinearity of the response
+    'hist-residual': {'hist-otheranthro': 1, 'hist-aer': -1},
+    'hist-residual-cmip5': {'hist-otheranthro-cmip5': 1, 'hist-aer-cmip5': -1},
+    # the CMIP5 experiments of Forster et al. (2013)
+    'historicalOther': {'historical': 1, 'historicalGHG': -1, 'historicalNat': -1},
+}
+
+
+def _gather(values, members, found):
+    """Members of values, model x member x ..., by an index of model x member; NaN where not found."""
+    if isinstance(values, tuple):
+        return type(values)(*(_gather(field, members, found) for field in values))
+    rows = np.arange(values.shape[0])[:, None]
+    picked = values[rows, members]
+    return np.where(found.reshape(found.shape + (1,) * (picked.ndim - 2)), picked, np.nan)
+
+
+def _weighted_sum(terms):
+    """Sum of weight * values over a list of (weight, values), in order; values may be tuples of arrays."""
+    weight, values = terms[0]
+    if isinstance(values, tuple):
+        return type(values)(*(
+            _weighted_sum([(weight, field[n]) for weight, field in terms]) for n in range(len(values))
+        ))
+    total = weight * values
+    for weight, values in terms[1:]:
+        total = total + weight * values
+    return total
+
+
+class ExperimentSet:
+    """Series of the members of experiments, with derived experiments formed when first asked for.
+
+    models: labels of the model axis, shared by all experiments
+    runs: dict of experiment to str array of model x member of the run in each slot, '' where none
+    values: dict of experiment to an array of model x member x ..., or a tuple of such arrays
+    definitions: dict of derived experiment to dict of the experiments it combines to their weights
+    """
+
+    def __init__(self, models, runs, values, definitions=DEFINITIONS):
+        self.models = list(models)
+        self.definitions = definitions
+        self._runs = dict(runs)
+        self._values = dict(values)
+
+    @classmethod
+    def from_ensemble(cls, ensemble, values, definitions=DEFINITIONS):
+        """The experiments of an Ensemble, with values a dict of experiment to its series."""
+        runs = {experiment: ensemble.runs[e] for e, experiment in enumerate(ensemble.experiments)}
+        return cls(ensemble.models, runs, values, definitions)
+
+    def __contains__(self, experiment):
+        return experiment in self._values or (
+            experiment in self.definitions and all(part in self for part in self.definitions[experiment]))
+
+    def __getitem__(self, experiment):
+        if experiment not in self._values:
+            self._derive(experiment)
+        return self._values[experiment]
+
+    def runs(self, experiment):
+        """str array of model x member of the run in each slot of experiment."""
+        if experiment not in self._runs:
+            self._derive(experiment)
+        return self._runs[experiment]
+
+    def _derive(self, experiment):
+        if experiment not in self.definitions:
+            raise KeyError('%s is neither given nor defined' % experiment)
+        weights = self.definitions[experiment]
+        parts = list(weights)
+        part_runs = [self.runs(part) for part in parts]
+        # runs of each model in every part, in the order of the first
+        matched = []
+        for m in range(len(self.models)):
+            common = [run for run in part_runs[0][m] if run and all(run in names[m] for names in part_runs[1:])]
+            matched.append(common)
+        width = max([len(common) for common in matched] + [1])
+        runs = np.full((len(self.models), width), '', dtype=part_runs[0].dtype)
+        found = np.zeros(runs.shape, dtype=bool)
+        for m, common in enumerate(matched):
+            runs[m, :len(common)] = common
+            found[m, :len(common)] = True
+        terms = []
+        for part, names in zip(parts, part_runs):
+            # member slot of each matched run in this part
+            members = np.zeros(runs.shape, dtype=int)
+            for m, common in enumerate(matched):
+                slots = {run: k for k, run in enumerate(names[m]) if run}
+                members[m, :len(common)] = [slots[run] for run in common]
+            terms.append((weights[part], _gather(self[part], members, found)))
+        self._runs[experiment] = runs
+        self._values[experiment] = _weighted_sum(terms)
@@ -0,0 +1,198 @@
+"""Annual means of many runs held in one dense, labelled array.
+
+Every run of the experiments asked for is read once into an array of
+experiment x model x member x year x variable, NaN-filled where there is no
+run or no year, with a mask of the years each run has. Years count from the
+first of each run, as the analysis indexes its series by position; the first
+calendar year of each run is kept alongside. Members are packed from the first
+slot of the member axis, so a model with fewer runs leaves the last slots empty.
+
+Selections by experiment, model or run name give smaller ensembles, and
+ensemble means and counts respect the mask, so that the notebooks index into
+one array instead of reading each CSV where it is used::
+
+    runs = ensemble.load(['historical', 'hist-GHG'], length=165)
+    rfmip = runs.select(models=['GISS-E2-1-G', 'MIROC6', 'CanESM5'], runs='r*i1p1f*')
+    tas = rfmip.mean('tas')  # experiment x model x year
+
+By default the runs of an experiment are those with a branch point in
+``data_output/branch_points.json``, and for a piControl each model's control
+run from ``branch_points.PICONTROL_RUNS``. piControls are far longer than the
+other experiments, so are best loaded as an ensemble of their own.
+"""
+
+import fnmatch
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import branch_points, config
+
+
+def is_control(experiment):
+    return experiment.startswith('piControl')
+
+
+def ensemble_runs(experiments, path=branch_points.DEFAULT_PATH, output=config.DATA_OUTPUT, models=None, points=None):
+    """dict of experiment to model to list of runs to load.
+
+    These are the runs with a branch point in the branch points JSON at path, or in points if
+    given, and for a piControl the control run of each model that has one under output.
+    """
+    runs = {}
+    for experiment in experiments:
+        if is_control(experiment):
+            candidates = ['CanESM5'] if experiment.endswith('-cmip5') else list(branch_points.PICONTROL_RUNS)
+            runs[experiment] = {
+                model: [branch_points.PICONTROL_RUNS[model]] for model in candidates
+                if (models is None or model in models) and os.path.exists(
+                    os.path.join(output, 'cmip6', model, branch_points.PICONTROL_RUNS[model], '%s.csv' % experiment))
+            }
+            continue
+        if points is None:
+            with open(path) as f:
+                points = json.load(f)
+        runs[experiment] = {
+            model: list(points[experiment][model]) for model in points.get(experiment, {})
+            if (models is None or model in models) and points[experiment][model]
+        }
+    return runs
+
+
+def read_run(path, variables):
+    """First calendar year and array of year x variable of an annual means CSV, NaN for missing variables."""
+    frame = pd.read_csv(path, usecols=lambda column: column in variables or column in ['time', 'year'],
+                        dtype={'time': str})
+    if 'year' in frame:
+        first = int(frame['year'].iloc[0]) if len(frame) else -1
+    else:
+        first = int(frame['time'].iloc[0].split('-')[0]) if len(frame) else -1
+    return first, frame.reindex(columns=variables).to_numpy(dtype=float)
+
+
+class Ensemble:
+    """Annual means of runs as a dense array with a validity mask.
+
+    experiments, models, variables: labels of the experiment, model and variable axes
+    runs: str array of experiment x model x member of the run in each slot, '' where there is none
+    data: float array of experiment x model x member x year x variable, NaN where not valid
+    valid: bool array of experiment x model x member x year of the years each run has
+    first_year: int array of experiment x model x member of each run's first calendar year, -1 for none
+    """
+
+    def __init__(self, experiments, models, variables, runs, data, valid, first_year):
+        self.experiments = list(experiments)
+        self.models = list(models)
+        self.variables = list(variables)
+        self.runs = runs
+        self.data = data
+        self.valid = valid
+        self.first_year = first_year
+
+    def __repr__(self):
+        return '<Ensemble of %d runs: %s>' % (
+            (self.runs != '').sum(), ' x '.join('%d %s' % (n, axis) for n, axis in zip(
+                self.data.shape, ['experiments', 'models', 'members', 'years', 'variables'])))
+
+    @property
+    def years(self):
+        return self.data.shape[3]
+
+    def values(self, variable):
+        """Array of experiment x model x member x year of one variable, a view of data."""
+        return self.data[..., self.variables.index(variable)]
+
+    def count(self):
+        """Number of runs of each experiment and model."""
+        return (self.runs != '').sum(axis=2)
+
+    def mean(self, variable):
+        """Ensemble mean of each experiment and model, experiment x model x year, NaN where no run has the year."""
+        members = self.valid.sum(axis=2)
+        total = np.where(self.valid, self.values(variable), 0).sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(members > 0, total / members, np.nan)
+
+    def slot(self, experiment, model, run):
+        """(experiment, model, member) indices of a run; KeyError if it is not in the ensemble."""
+        e = self.experiments.index(experiment)
+        m = self.models.index(model)
+        members = np.flatnonzero(self.runs[e, m] == run)
+        if len(members) == 0:
+            raise KeyError('%s %s %s is not in the ensemble' % (experiment, model, run))
+        return e, m, members[0]
+
+    def run(self, experiment, model, run):
+        """DataFrame of the variables of one run, for the years it has."""
+        e, m, k = self.slot(experiment, model, run)
+        return pd.DataFrame(self.data[e, m, k][self.valid[e, m, k]], columns=self.variables)
+
+    def select(self, experiments=None, models=None, runs=None):
+        """The ensemble of a subset of experiments, models and runs.
+
+        experiments, models: labels to keep, in the order given
+        runs: fnmatch pattern, or list of them, of the run names to keep, e.g. 'r*i1p1f1'
+        """
+        e = [self.experiments.index(experiment) for experiment in experiments] if experiments is not None \
+            else list(range(len(self.experiments)))
+        m = [self.models.index(model) for model in models] if models is not None else list(range(len(self.models)))
+        names = self.runs[np.ix_(e, m)]
+        data = self.data[np.ix_(e, m)]
+        valid = self.valid[np.ix_(e, m)]
+        first_year = self.first_year[np.ix_(e, m)]
+        if runs is not None:
+            patterns = [runs] if isinstance(runs, str) else list(runs)
+            keep = np.zeros(names.shape, dtype=bool)
+            for index in np.ndindex(names.shape):
+                keep[index] = names[index] != '' and any(fnmatch.fnmatchcase(names[index], p) for p in patterns)
+            # pack the runs kept into the first member slots
+            order = np.argsort(~keep, axis=2, kind='stable')[..., :max(keep.sum(axis=2).max(initial=0), 1)]
+            keep = np.take_along_axis(keep, order, axis=2)
+            names = np.where(keep, np.take_along_axis(names, order, axis=2), '')
+            first_year = np.where(keep, np.take_along_axis(first_year, order, axis=2), -1)
+            valid = np.take_along_axis(valid, order[..., None], axis=2) & keep[..., None]
+            data = np.where(valid[..., None], np.take_along_axis(data, order[..., None, None], axis=2), np.nan)
+        return Ensemble(
+            [self.experiments[i] for i in e], [self.models[i] for i in m], self.variables, names, data, valid,
+            first_year,
+        )
+
+
+def load(experiments, runs=None, output=config.DATA_OUTPUT, variables=config.VARIABLES, length=None,
+         path=branch_points.DEFAULT_PATH, models=None, points=None):
+    """Read the annual means of many runs into an Ensemble.
+
+    runs: dict of experiment to model to list of runs, by default as from ensemble_runs
+    length: years to keep from the start of each run, by default those of the longest run
+    path, models, points: branch points JSON, models and branch points for the default runs
+    """
+    if runs is None:
+        runs = ensemble_runs(experiments, path, output, models, points)
+    model_labels = list(dict.fromkeys(model for experiment in experiments for model in runs.get(experiment, {})))
+    members = max([len(names) for experiment in experiments for names in runs.get(experiment, {}).values()] + [1])
+    series = {}
+    for experiment in experiments:
+        for model, names in runs.get(experiment, {}).items():
+            for run in names:
+                path_csv = os.path.join(output, 'cmip6', model, run, '%s.csv' % experiment)
+                series[experiment, model, run] = read_run(path_csv, variables)
+    years = length if length is not None else max([len(values) for _, values in series.values()] + [0])
+
+    shape = (len(experiments), len(model_labels), members)
+    names = np.full(shape, '', dtype=object)
+    data = np.full(shape + (years, len(variables)), np.nan)
+    valid = np.zeros(shape + (years,), dtype=bool)
+    first_year = np.full(shape, -1)
+    for e, experiment in enumerate(experiments):
+        for model, model_runs in runs.get(experiment, {}).items():
+            m = model_labels.index(model)
+            for k, run in enumerate(model_runs):
+                first, values = series[experiment, model, run]
+                n = min(len(values), years)
+                names[e, m, k] = run
+                data[e, m, k, :n] = values[:n]
+                valid[e, m, k, :n] = True
+                first_year[e, m, k] = first
+    return Ensemble(experiments, model_labels, variables, names.astype(str), data, valid, first_year)
@@ -0,0 +1,449 @@
+"""Extract global annual means of the energy budget variables from the CMIP6 archive.
+
+This replaces the old per-experiment ``get_cmip6_*_global_annual_means.py``
+scripts. Each (model, run) is an independent unit of work, run in a worker
+process of its own with a time limit so that one bad run cannot stop the batch.
+The model specific fixes needed to read it come from ``fixes.FIXES``. Outputs
+are written to
+``data_output/cmip6/<model>/<run>/<experiment>.csv`` along with
+``meta_<experiment>.json`` holding the global attributes, and/or to the
+consolidated Parquet store in ``data_output/cmip6_store`` (``--format``).
+
+Example::
+
+    python -m cmip56forcing.extract historical hist-GHG --workers 8
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import traceback
+import warnings
+
+import numpy as np
+import pandas as pd
+from climateforcing.utils import mkdir_p
+
+from . import config, fastread, instrument, shard, store, weights
+from .catalogue import DEFAULT_DB, open_catalogue
+from .fixes import apply_netcdf_fixes, fixes_for
+from .instrument import stage
+from .isolate import Isolated
+from .load import TimeMismatch, TimePlan, load_run
+from .manifest import DEFAULT_PATH as DEFAULT_MANIFEST
+from .manifest import Manifest, describe_inputs
+from .prefetch import Prefetcher
+from .reduce import global_mean
+
+
+# ta https://stackoverflow.com/questions/11942364
+# (TypeError: integer is not JSON serializable when serializing JSON in Python)
+def convert(obj):
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+
+
+def output_files(model, run, experiment, formats=('csv',)):
+    """Paths written for a unit, relative to the output directory.
+
+    formats: any of 'csv' (the per-run files) and 'parquet' (the store's partition for the experiment)
+    """
+    outputs = []
+    if 'csv' in formats:
+        outputs.append(os.path.join('cmip6', model, run, '%s.csv' % experiment))
+        if config.writes_meta(experiment):
+            outputs.append(os.path.join('cmip6', model, run, 'meta_%s.json' % experiment))
+    if 'parquet' in formats:
+        outputs.append(os.path.join(store.STORE_DIR, 'annual', 'experiment=%s' % experiment))
+    return outputs
+
+
+def process_run(
+    model, run, experiment, filelists, output=config.DATA_OUTPUT, chunk_mb=None, cache_dir=None, reader='auto',
+    formats=('csv',), month_weights=False, time_axis='date',
+):
+    """Extract one (model, run) unit and write its CSV and metadata.
+
+    filelists: dict of variable name to the run's files for that variable
+    reader: 'auto' reads with netCDF4 where the files allow and iris otherwise; 'iris' always uses iris
+    formats: write the per-run CSV files ('csv'), append to the store under output ('parquet'), or both
+    month_weights: weight each time step by its length in the annual means
+    time_axis: label each year by its integer 'year' or the 'date' of its midpoint
+
+    returns: (model, run, succeeded, message)
+    """
+    warnings.simplefilter('ignore')
+    print(' --- attempting processing for %s, %s' % (model, run))
+    variables = list(filelists)
+    for var in variables:
+        # check any files exist before we try and open them else iris throws error
+        if len(filelists[var]) == 0:
+            return model, run, False, 'no %s variables found' % var
+
+    fast = None
+    if reader == 'auto':
+        try:
+            fast = fastread.open_run(filelists)
+        except fastread.Unsupported as exc:
+            print(' --- %s, %s: %s, reading with iris' % (model, run, exc))
+        else:
+            _report_fixes(model, run, [fix.name for fix in fixes_for(model, experiment) if fix.netcdf is not None])
+            for var in variables:
+                apply_netcdf_fixes(fast[var], model, experiment)
+    if fast is not None:
+        times = {var: fast[var].time for var in variables}
+    else:
+        _report_fixes(model, run, [fix.name for fix in fixes_for(model, experiment) if fix.cubes is not None])
+        cubes = load_run(filelists, model, experiment)
+        times = {var: cubes[var].coord('time') for var in variables}
+
+    # check that all of the variables have the same time points.
+    # If they do not, there are some missing variable slices and
+    # the outputs will not make sense, so don't write results for that model/run combination
+    # it's sufficient to check everything relative to tas
+    plan = TimePlan(times['tas'], month_weights)
+    try:
+        for var in variables:
+            plan.check(var, times[var])
+    except TimeMismatch as exc:
+        return model, run, False, str(exc)
+
+    # The one thing we do need from the historical is the branch time from the piControl.
+    # this is not always consistently reported, so basically dump all of the attributes and
+    # try and make sense of it manually in the data analysis stage :)
+    annual = {}
+    if fast is not None:
+        with stage('weights'):
+            grid_weights = fast['tas'].weights()
+        for var in variables:
+            monthly = fast[var].global_mean(grid_weights, chunk_mb)
+            with stage('annual_mean', variable=var):
+                annual[var] = plan.annual_mean(monthly)
+        global_attributes = fast['tas'].attributes
+    else:
+        cache = weights.get_cache(cache_dir)
+        for var in variables:
+            with stage('weights', variable=var):
+                grid_weights = cache.weights(cubes[var])
+            monthly = global_mean(cubes[var], grid_weights, chunk_mb)
+            with stage('annual_mean', variable=var):
+                annual[var] = plan.annual_mean(monthly)
+        global_attributes = cubes['tas'].attributes
+    # keep the column order of the existing outputs
+    columns = [var for var in ['rsdt', 'rsut', 'rlut', 'tas'] if var in variables]
+    columns = columns + [var for var in variables if var not in columns]
+    if time_axis == 'year':
+        df = pd.DataFrame({'year': plan.unique_years})
+    else:
+        df = pd.DataFrame({'time': plan.dates})
+    for var in columns:
+        df[var] = annual[var]
+
+    with stage('write'):
+        meta = None
+        if config.writes_meta(experiment):
+            attributes = dict(global_attributes)
+            # needed to turn the branch time in days into a year of the parent, see branch_points
+            attributes.setdefault('calendar', str(plan.units.calendar))
+            meta = json.dumps(attributes, default=convert)
+        if 'csv' in formats:
+            outputs = output_files(model, run, experiment)
+            mkdir_p(os.path.join(output, 'cmip6', model, run))
+            df.to_csv(os.path.join(output, outputs[0]), index=False)
+            if meta is not None:
+                with open(os.path.join(output, outputs[1]), 'w') as f:
+                    f.write(meta)
+        if 'parquet' in formats:
+            if 'year' not in df:
+                df.insert(1, 'year', plan.unique_years)
+            store.Store(os.path.join(output, store.STORE_DIR)).append(experiment, model, run, df, meta)
+    return model, run, True, 'successful'
+
+
+def _report_fixes(model, run, names):
+    if names:
+        print(' --- fixes for %s, %s: %s' % (model, run, ', '.join(names)))
+
+
+def plan_units(experiment, catalogue, models=None, variables=config.VARIABLES):
+    """List the (model, run, filelists) units to extract for an experiment."""
+    if models is None:
+        models = config.experiment_models(experiment)
+    units = []
+    for model in models:
+        print(model)
+        runs = config.experiment_runs(experiment, model)
+        if runs is None:
+            runs = catalogue.members(model, experiment, variables)
+            if len(runs) == 0:
+                print(' --- no variables found for %s' % model)
+        with stage('catalogue', model=model):
+            for run in runs:
+                filelists = {var: catalogue.files(model, experiment, var, run) for var in variables}
+                units.append((model, run, filelists))
+    return units
+
+
+def input_stats(filelists):
+    """(size, mtime) of each of a unit's input files that exists, read from the file system.
+
+    The catalogue's values are not used: a file rewritten in place keeps the
+    catalogued size and mtime until its directory is next listed.
+    """
+    stats = {}
+    for var in filelists:
+        for file in filelists[var]:
+            try:
+                st = os.stat(file)
+            except FileNotFoundError:
+                continue
+            stats[file] = (st.st_size, st.st_mtime)
+    return stats
+
+
+def select_units(units, experiment, manifest, output, force=False, retry_failed=False):
+    """Drop units that the manifest shows are up to date, or failed with the same inputs."""
+    selected = []
+    counts = {}
+    for model, run, filelists in units:
+        status = manifest.status(model, run, experiment, input_stats(filelists), output)
+        counts[status] = counts.get(status, 0) + 1
+        if force or status in ['new', 'stale', 'changed'] or (status == 'failed' and retry_failed):
+            selected.append((model, run, filelists))
+    print('%s: %s' % (experiment, ', '.join('%d %s' % (counts[status], status) for status in sorted(counts))))
+    return selected
+
+
+def _work(model, run, experiment, filelists, local=None, checksums=False, events=None, trace_memory=False, **kwargs):
+    """Run process_run in isolation.
+
+    local: prefetched copies of filelists to read instead, if any
+    checksums: checksum the inputs of a successful unit for the manifest, which reads them again;
+    always done from local copies, where reading them again is cheap
+    events, trace_memory: record the stages of the unit to this JSON-lines file, see instrument.record
+
+    returns: the result of process_run, this call's grid weights cache counts and
+    the manifest records of the inputs
+    """
+    cache = weights.get_cache(kwargs.get('cache_dir'))
+    before = cache.stats()
+    with instrument.record(events, trace_memory, model=model, run=run, experiment=experiment):
+        try:
+            with stage('unit'):
+                result = process_run(model, run, experiment, filelists if local is None else local, **kwargs)
+        except Exception as exc:
+            result = (model, run, False, ''.join(traceback.format_exception_only(type(exc), exc)).strip())
+        copies = {}
+        if local is not None:
+            for var in filelists:
+                copies.update(zip(filelists[var], local[var]))
+        with_checksums = (checksums or local is not None) and result[2]
+        with stage('inputs'):
+            inputs = describe_inputs(input_stats(filelists), with_checksums=with_checksums, copies=copies)
+    return result, {key: value - before[key] for key, value in cache.stats().items()}, inputs
+
+
+def run_units(units, experiment, workers=1, manifest=None, prefetcher=None, timeout=None, **kwargs):
+    """Process (model, run, filelists) units, each in a process of its own unless workers == 1.
+
+    Each unit's outcome is recorded in the manifest, if given, as soon as it finishes.
+    A unit whose process runs for longer than timeout seconds is killed, and one
+    whose process dies is recorded as failed; the other units carry on.
+    With a prefetcher, units are read from local copies made while earlier units
+    are processed. At most workers units run at once, so that copies are not
+    made further ahead than needed, and finished units are collected (returning
+    their share of the scratch budget) while waiting for the next copy.
+
+    returns: list of (model, run, succeeded, message) and the summed grid weights cache counts
+    """
+    results = []
+    cache_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def collect(result, stats, inputs):
+        model, run, succeeded, message = _report(result)
+        results.append(result)
+        for key in cache_stats:
+            cache_stats[key] = cache_stats[key] + stats[key]
+        if manifest is not None:
+            outputs = output_files(model, run, experiment, kwargs.get('formats', ('csv',))) if succeeded else []
+            manifest.record(model, run, experiment, succeeded, inputs, outputs, None if succeeded else message)
+        if prefetcher is not None:
+            prefetcher.release(model, run)
+
+    def failed(model, run, filelists, message):
+        # record the inputs so that the unit is not retried until they change
+        inputs = describe_inputs(input_stats(filelists), with_checksums=False)
+        collect((model, run, False, message), {key: 0 for key in cache_stats}, inputs)
+
+    if workers == 1 and timeout is None:
+        staged = ((unit, None) for unit in units) if prefetcher is None else prefetcher.stage(units)
+        for (model, run, filelists), local in staged:
+            if isinstance(local, Exception):
+                failed(model, run, filelists, repr(local))
+                continue
+            collect(*_work(model, run, experiment, filelists, local, **kwargs))
+        return results, cache_stats
+
+    # forking while other threads run, such as the prefetcher's copy threads or those of a pipeline
+    # calling this, can leave a worker with a lock held by a thread that does not exist in the child,
+    # so workers are always started from a fork server
+    running = Isolated(workers, timeout, multiprocessing.get_context('forkserver'))
+
+    def drain(block=True):
+        for (model, run, filelists), succeeded, outcome in running.poll(block):
+            if succeeded:
+                collect(*outcome)
+            else:
+                failed(model, run, filelists, outcome)
+
+    if prefetcher is None:
+        staged = ((unit, None) for unit in units)
+    else:
+        staged = prefetcher.stage(units, idle=lambda: drain(block=False))
+    for (model, run, filelists), local in staged:
+        if isinstance(local, Exception):
+            failed(model, run, filelists, repr(local))
+            continue
+        while running.full():
+            drain()
+        running.submit((model, run, filelists), _work, model, run, experiment, filelists, local, **kwargs)
+    while len(running):
+        drain()
+    return results, cache_stats
+
+
+def _report(result):
+    model, run, succeeded, message = result
+    if succeeded:
+        print(' --- %s, %s was successful' % (model, run))
+    else:
+        print(' --- %s for %s, %s' % (message, model, run))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('experiments', nargs='+', choices=config.EXPERIMENTS)
+    parser.add_argument('--models', nargs='+', help='models to extract (default: all for the experiment)')
+    parser.add_argument('--variables', nargs='+', default=config.VARIABLES)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--archive', default=config.ARCHIVE)
+    parser.add_argument('--catalogue', default=DEFAULT_DB, help='archive catalogue, built on first use')
+    parser.add_argument('--rescan', action='store_true', help='update the catalogue for changed directories first')
+    parser.add_argument('--output', default=config.DATA_OUTPUT)
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='record of extracted and failed units')
+    parser.add_argument(
+        '--shard', type=shard.parse, metavar='I/N',
+        help='extract only shard I (from 0) of N, balanced by input size; the manifest is written to a partial '
+        'manifest, merged afterwards with python -m cmip56forcing.manifest merge',
+    )
+    parser.add_argument('--force', action='store_true', help='extract units even if they are up to date')
+    parser.add_argument('--retry-failed', action='store_true', help='retry units that failed with the same inputs')
+    parser.add_argument(
+        '--checksums', action='store_true',
+        help='record checksums of the inputs, so that touched but unchanged files are not re-extracted',
+    )
+    parser.add_argument(
+        '--timeout', type=float, default=7200,
+        help='seconds after which a run is abandoned and recorded as failed (0 for no limit)',
+    )
+    parser.add_argument(
+        '--reader', choices=['auto', 'iris'], default='auto',
+        help='auto reads with netCDF4 and falls back to iris for files that need it',
+    )
+    parser.add_argument(
+        '--format', choices=['csv', 'parquet', 'both'], default='csv',
+        help='write per-run CSV files, append to the consolidated Parquet store, or both',
+    )
+    parser.add_argument(
+        '--month-weights', action='store_true',
+        help='weight each month by its length in the annual means (default: equal weights, as published)',
+    )
+    parser.add_argument(
+        '--time-axis', choices=['date', 'year'], default='date',
+        help="label the annual means with the midpoint date of each year (the 'time' column) or the integer 'year'",
+    )
+    parser.add_argument('--scratch', help='copy input files to this local directory ahead of processing')
+    parser.add_argument('--prefetch', type=int, default=2, help='number of runs to copy ahead (with --scratch)')
+    parser.add_argument('--scratch-mb', type=float, default=20000, help='limit on the size of the local copies')
+    parser.add_argument('--events', help='append a JSON-lines record of the time and memory of each stage to this file')
+    parser.add_argument(
+        '--trace-memory', action='store_true', help='record the peak memory allocated in each stage (slower)'
+    )
+    parser.add_argument(
+        '--cache', default=os.path.join(config.CACHE, 'grid_weights'), help='grid weights cache directory'
+    )
+    parser.add_argument(
+        '--chunk-mb', type=float,
+        help='stream the spatial mean through memory in blocks of this many MB (default: load whole fields)',
+    )
+    args = parser.parse_args(argv)
+
+    if 'tas' not in args.variables:
+        parser.error('tas is required to define the time axis and metadata')
+    if args.shard is not None and args.rescan:
+        parser.error(
+            '--rescan with --shard would update the catalogue from every shard; update it before starting them'
+        )
+
+    formats = ['csv', 'parquet'] if args.format == 'both' else [args.format]
+    catalogue = open_catalogue(args.archive, args.catalogue, args.rescan)
+    manifest = Manifest(args.manifest)
+    planned = {}
+    for experiment in args.experiments:
+        with instrument.record(args.events, args.trace_memory, experiment=experiment):
+            planned[experiment] = plan_units(experiment, catalogue, args.models, args.variables)
+    if args.shard is not None:
+        nunits = sum(len(units) for units in planned.values())
+        planned, nbytes, total = shard.select(planned, catalogue, *args.shard)
+        print(
+            'shard %d/%d: %d of %d units, %.2f of %.2f GB'
+            % (args.shard + (sum(len(units) for units in planned.values()), nunits, nbytes / 1e9, total / 1e9))
+        )
+        manifest = manifest.shard(*args.shard)
+    for experiment in args.experiments:
+        units = select_units(planned[experiment], experiment, manifest, args.output, args.force, args.retry_failed)
+        prefetcher = None
+        if args.scratch is not None:
+            prefetcher = Prefetcher(args.scratch, args.prefetch, args.scratch_mb, experiment=experiment)
+        try:
+            results, cache_stats = run_units(
+                units, experiment, args.workers, manifest, prefetcher, args.timeout or None,
+                output=args.output, chunk_mb=args.chunk_mb, cache_dir=args.cache, checksums=args.checksums,
+                reader=args.reader, formats=formats, month_weights=args.month_weights, time_axis=args.time_axis,
+                events=args.events, trace_memory=args.trace_memory,
+            )
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+        if 'parquet' in formats and args.shard is None:
+            # shards leave compaction to python -m cmip56forcing.store compact, as they would race
+            store.Store(os.path.join(args.output, store.STORE_DIR)).compact(experiment)
+        nfailed = sum(1 for result in results if not result[2])
+        print('%s: %d of %d runs extracted' % (experiment, len(results) - nfailed, len(results)))
+        if nfailed:
+            print(
+                '%s: %d failed runs recorded in %s, not retried until their inputs change'
+                % (experiment, nfailed, manifest.path)
+            )
+        print(
+            'grid weights cache: %d hits (%d from disk), %d misses'
+            % (cache_stats['hits'], cache_stats['disk_hits'], cache_stats['misses'])
+        )
+        if prefetcher is not None:
+            io = prefetcher.report()
+            print(
+                'prefetch: copied %.1f MB in %.1f s, waited %.1f s for copies, %.0f%% of I/O overlapped; '
+                'copying waited %.1f s for scratch space'
+                % (io['bytes'] / 2**20, io['copy_seconds'], io['wait_seconds'], 100 * io['overlap'],
+                   io['budget_seconds'])
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""Read the energy budget variables of a run with netCDF4 instead of iris.
+
+For small-grid models most of the time in ``load_run`` goes on importing iris
+and on ``iris.load``, ``unify_time_units``, ``equalise_attributes`` and
+``concatenate_cube``. Most runs need none of that: each variable is a plain
+(time, lat, lon) field split in time over a few files on the same grid. Here
+only the data variable, the time axis and the latitude and longitude points and
+bounds are read, the area weights and global means are computed in NumPy, and
+the data are read a block of time steps at a time.
+
+The files of each variable are checked first. Anything unexpected (other
+dimensions, a grid that differs between files, overlapping or unordered time
+steps, a change of calendar) raises Unsupported, and the caller reads the run
+with iris instead. Integer time bounds, as written by CAMS-CSM1-0, IPSL-CM6A-LR
+and KACE-1-0-G, need no fixing here.
+
+Both readers can be timed on the same files with::
+
+    python -m cmip56forcing.fastread historical --models CanESM5 MIROC6
+"""
+
+import argparse
+import os
+import time
+
+import cf_units
+import cftime
+import netCDF4
+import numpy as np
+
+from . import config
+from .instrument import stage
+from .reduce import area_weights_from_bounds, block_mean, chunk_length
+
+# units that identify a coordinate without a standard_name, as in the CF conventions
+HORIZONTAL_UNITS = {
+    'latitude': {'degrees_north', 'degree_north', 'degrees_N', 'degree_N', 'degreesN', 'degreeN'},
+    'longitude': {'degrees_east', 'degree_east', 'degrees_E', 'degree_E', 'degreesE', 'degreeE'},
+}
+
+# attributes of a data variable that iris interprets rather than keeping in cube.attributes
+CF_ATTRS = set([
+    'add_offset', 'ancillary_variables', 'axis', 'bounds', 'calendar', 'cell_measures', 'cell_methods',
+    'climatology', 'compress', 'coordinates', '_FillValue', 'formula_terms', 'grid_mapping', 'leap_month',
+    'leap_year', 'long_name', 'missing_value', 'month_lengths', 'scale_factor', 'standard_error_multiplier',
+    'standard_name', 'units',
+])
+
+
+class Unsupported(ValueError):
+    """The files of a variable need the iris reader."""
+
+
+class TimeAxis:
+    """Time points, bounds and units; the parts of an iris time coordinate that TimePlan uses."""
+
+    def __init__(self, points, units, bounds=None):
+        self.points = points
+        self.units = units
+        self.bounds = bounds
+
+    def has_bounds(self):
+        return self.bounds is not None
+
+
+def guess_bounds(points, circular=False, clip=None):
+    """Bounds halfway between points, as iris's guess_bounds."""
+    if circular:
+        step = 360.0 if points[-1] > points[0] else -360.0
+        diffs = np.diff(np.concatenate([[points[-1] - step], points, [points[0] + step]]))
+    else:
+        diffs = np.diff(points)
+        diffs = np.concatenate([diffs[:1], diffs, diffs[-1:]])
+    bounds = np.array([points - 0.5 * diffs[:-1], points + 0.5 * diffs[1:]]).T
+    if clip is not None and (np.abs(points) <= clip).all():
+        bounds = np.clip(bounds, -clip, clip)
+    return bounds
+
+
+def _is_circular(points):
+    """Whether longitudes go all the way round, as iris decides when loading."""
+    if len(points) < 2:
+        return False
+    step = (points[-1] - points[0]) / (len(points) - 1)
+    return bool(np.isclose(abs(points[-1] - points[0] + step), 360.0))
+
+
+def _calendar(name):
+    # one name for each of the aliases, e.g. gregorian and standard, noleap and 365_day
+    return cftime.datetime(1, 1, 1, calendar=name).calendar
+
+
+def _attributes(ds, var):
+    """Global attributes overridden by the data variable's own, as iris puts in cube.attributes."""
+    attributes = {name: ds.getncattr(name) for name in ds.ncattrs()}
+    for name in ds[var].ncattrs():
+        if name not in CF_ATTRS:
+            attributes[name] = ds[var].getncattr(name)
+    return attributes
+
+
+def _same(a, b):
+    return type(a) is type(b) and np.array_equal(np.asarray(a), np.asarray(b))
+
+
+def _horizontal(ds, dim, kind):
+    """Points and bounds of the latitude or longitude coordinate variable of dimension dim.
+
+    The coordinate must have kind as its standard_name or, without one, the units of kind.
+    """
+    if dim not in ds.variables:
+        raise Unsupported('no coordinate variable for dimension %s' % dim)
+    coord = ds[dim]
+    standard_name = getattr(coord, 'standard_name', None)
+    units = getattr(coord, 'units', '')
+    if standard_name != kind and not (standard_name is None and units in HORIZONTAL_UNITS[kind]):
+        raise Unsupported('dimension %s is not %s' % (dim, kind))
+    if coord.ndim != 1:
+        raise Unsupported('%s is not one-dimensional' % kind)
+    points = np.asarray(coord[:], dtype=np.float64)
+    bounds = None
+    if getattr(coord, 'bounds', None) in ds.variables:
+        bounds = np.asarray(ds[coord.bounds][:], dtype=np.float64)
+    return points, bounds
+
+
+class FastVariable:
+    """One variable of a run, spread in time over a list of files.
+
+    files: the variable's files, in time order
+    units: time units string to put every file's times in; those of the first file if None
+    """
+
+    def __init__(self, files, var, units=None):
+        if len(files) == 0:
+            raise Unsupported('no %s files' % var)
+        self.files = files
+        self.var = var
+        points = []
+        bounds = []
+        attributes = None
+        calendar = None
+        for file in files:
+            with netCDF4.Dataset(file) as ds:
+                if var not in ds.variables:
+                    raise Unsupported('%s is not in %s' % (var, os.path.basename(file)))
+                data = ds[var]
+                if data.ndim != 3:
+                    raise Unsupported('%s has dimensions %s' % (var, data.dimensions))
+                tdim, ydim, xdim = data.dimensions
+                lat, lat_bounds = _horizontal(ds, ydim, 'latitude')
+                lon, lon_bounds = _horizontal(ds, xdim, 'longitude')
+                if tdim not in ds.variables or ' since ' not in getattr(ds[tdim], 'units', ''):
+                    raise Unsupported('first dimension of %s is not time' % var)
+                tcoord = ds[tdim]
+                file_calendar = getattr(tcoord, 'calendar', 'standard')
+                file_units = tcoord.units
+                file_points = np.asarray(tcoord[:], dtype=np.float64)
+                file_bounds = None
+                if getattr(tcoord, 'bounds', None) in ds.variables:
+                    file_bounds = np.asarray(ds[tcoord.bounds][:], dtype=np.float64)
+                file_attributes = _attributes(ds, var)
+            if attributes is None:
+                self.lat, self.lat_bounds, self.lon, self.lon_bounds = lat, lat_bounds, lon, lon_bounds
+                attributes = file_attributes
+                calendar = file_calendar
+                if units is None:
+                    units = file_units
+            else:
+                if not (np.array_equal(lat, self.lat) and np.array_equal(lon, self.lon)):
+                    raise Unsupported('grid of %s changes between files' % var)
+                for first, other in [(self.lat_bounds, lat_bounds), (self.lon_bounds, lon_bounds)]:
+                    if (first is None) != (other is None) or (first is not None and not np.allclose(first, other)):
+                        raise Unsupported('grid bounds of %s change between files' % var)
+                if _calendar(file_calendar) != _calendar(calendar):
+                    raise Unsupported('calendar of %s changes between files' % var)
+                if (file_bounds is None) != (bounds[-1] is None):
+                    raise Unsupported('time bounds of %s in some files only' % var)
+                # keep only the attributes that are the same in every file, as equalise_attributes
+                attributes = {
+                    name: value for name, value in attributes.items()
+                    if name in file_attributes and _same(value, file_attributes[name])
+                }
+            if file_units != units:
+                file_points = cftime.date2num(cftime.num2date(file_points, file_units, file_calendar), units, file_calendar)
+                if file_bounds is not None:
+                    file_bounds = cftime.date2num(
+                        cftime.num2date(file_bounds, file_units, file_calendar), units, file_calendar
+                    )
+            points.append(file_points)
+            bounds.append(file_bounds)
+
+        points = np.concatenate(points)
+        if len(points) > 1 and not (np.diff(points) > 0).all():
+            raise Unsupported('time steps of %s overlap or are out of order' % var)
+        self.time_units = units
+        self.time = TimeAxis(
+            points, cf_units.Unit(units, calendar=calendar), None if bounds[0] is None else np.concatenate(bounds)
+        )
+        self.attributes = attributes
+        if self.lat_bounds is None or self.lon_bounds is None:
+            self.guess_grid_bounds()
+
+    def guess_grid_bounds(self):
+        """Replace the latitude and longitude bounds by guessed ones, as load_run does when they are missing."""
+        self.lat_bounds = guess_bounds(self.lat, clip=90.0)
+        self.lon_bounds = guess_bounds(self.lon, circular=_is_circular(self.lon))
+
+    def weights(self):
+        """2-D (latitude, longitude) area weights."""
+        return area_weights_from_bounds(self.lat_bounds, self.lon_bounds)
+
+    def global_mean(self, weights=None, chunk_mb=None):
+        """Area-weighted global mean of each time step, read a file or a block of time steps at a time."""
+        if weights is None:
+            weights = self.weights()
+        means = []
+        for file in self.files:
+            with netCDF4.Dataset(file) as ds:
+                data = ds[self.var]
+                nt = data.shape[0]
+                step = nt if chunk_mb is None else chunk_length(data, chunk_mb)
+                for start in range(0, nt, step):
+                    with stage('read', variable=self.var, file=os.path.basename(file)):
+                        block = data[start:start + step]
+                    with stage('reduce', variable=self.var):
+                        means.append(block_mean(block, weights))
+        return np.concatenate(means)
+
+
+def open_run(filelists):
+    """Check the files of every variable of a run and read their time axes and grids.
+
+    Times are put in the units of the first file read, for every variable.
+
+    returns: dict of variable name to FastVariable
+    raises: Unsupported if any variable needs the iris reader
+    """
+    variables = {}
+    units = None
+    for var in filelists:
+        with stage('open', variable=var):
+            variables[var] = FastVariable(filelists[var], var, units)
+        units = variables[var].time_units
+    return variables
+
+
+def _benchmark_iris(filelists, model, experiment, chunk_mb):
+    from .load import TimePlan, load_run
+    from .reduce import global_mean
+
+    cubes = load_run(filelists, model, experiment)
+    plan = TimePlan(cubes['tas'].coord('time'))
+    return {var: plan.annual_mean(global_mean(cubes[var], chunk_mb=chunk_mb)) for var in filelists}
+
+
+def _benchmark_fast(filelists, model, experiment, chunk_mb):
+    from .fixes import apply_netcdf_fixes
+    from .load import TimePlan
+
+    # as extract.process_run reads a run
+    variables = open_run(filelists)
+    for var in variables:
+        apply_netcdf_fixes(variables[var], model, experiment)
+    plan = TimePlan(variables['tas'].time)
+    grid_weights = variables['tas'].weights()
+    return {var: plan.annual_mean(variables[var].global_mean(grid_weights, chunk_mb)) for var in filelists}
+
+
+def main(argv=None):
+    import warnings
+
+    from .catalogue import DEFAULT_DB, open_catalogue
+    from .extract import plan_units
+
+    parser = argparse.ArgumentParser(description='Time the netCDF4 and iris readers on the same files.')
+    parser.add_argument('experiment', choices=config.EXPERIMENTS)
+    parser.add_argument('--models', nargs='+')
+    parser.add_argument('--archive', default=config.ARCHIVE)
+    parser.add_argument('--catalogue', default=DEFAULT_DB)
+    parser.add_argument('--runs', type=int, default=3, help='runs per model to time')
+    parser.add_argument('--chunk-mb', type=float)
+    args = parser.parse_args(argv)
+    warnings.simplefilter('ignore')
+
+    catalogue = open_catalogue(args.archive, args.catalogue)
+    units = plan_units(args.experiment, catalogue, args.models)
+    taken = {}
+    selected = []
+    for model, run, filelists in units:
+        if taken.get(model, 0) < args.runs and all(filelists.values()):
+            taken[model] = taken.get(model, 0) + 1
+            selected.append((model, run, filelists))
+
+    start = time.perf_counter()
+    import iris  # noqa: F401
+
+    print('importing iris: %.2f s, once per worker process' % (time.perf_counter() - start))
+    totals = {'iris': [0, 0, 0.0], 'netCDF4': [0, 0, 0.0]}
+    fallbacks = 0
+    for model, run, filelists in selected:
+        files = [file for var in filelists for file in filelists[var]]
+        nbytes = 0
+        for file in files:
+            # read every file once so that both readers see the same, warm, page cache
+            with open(file, 'rb') as f:
+                while f.read(2**24):
+                    pass
+            nbytes = nbytes + os.path.getsize(file)
+        results = {}
+        for name, reader in [('iris', _benchmark_iris), ('netCDF4', _benchmark_fast)]:
+            start = time.perf_counter()
+            try:
+                results[name] = reader(filelists, model, args.experiment, args.chunk_mb)
+            except Unsupported as exc:
+                print(' --- %s, %s needs the iris reader: %s' % (model, run, exc))
+                fallbacks = fallbacks + 1
+                continue
+            except Exception as exc:
+                print(' --- %s reader failed for %s, %s: %r' % (name, model, run, exc))
+                continue
+            seconds = time.perf_counter() - start
+            totals[name] = [totals[name][0] + len(files), totals[name][1] + nbytes, totals[name][2] + seconds]
+            print(' --- %s, %s: %s %.2f s' % (model, run, name, seconds))
+        if len(results) == 2:
+            difference = max(np.max(np.abs(results['iris'][var] - results['netCDF4'][var])) for var in filelists)
+            print(' --- %s, %s: largest difference in annual means %.3g' % (model, run, difference))
+    for name, (nfiles, nbytes, seconds) in totals.items():
+        if seconds > 0:
+            print(
+                '%s: %d files, %.1f MB in %.1f s; %.1f files/s, %.1f MB/s'
+                % (name, nfiles, nbytes / 2**20, seconds, nfiles / seconds, nbytes / 2**20 / seconds)
+            )
+    if fallbacks:
+        print('%d runs needed the iris reader' % fallbacks)
+
+
+if __name__ == '__main__':
+    main()
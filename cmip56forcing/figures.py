@@ -0,0 +1,451 @@
+"""The figures of the paper, each drawn from a small bundle of the arrays it shows.
+
+A bundle is a namedtuple of arrays and labels, built from the results of the
+pipeline stages by the ``*_bundle`` functions; ``FIGURES`` maps each figure to
+the function that draws it, its bundle, its files and its options. Figures with
+the same layout share one drawing function: fig1 and fig1_rfmip7, and fig2 and
+fig2_agu2021.
+
+``render`` draws figures in worker processes with the Agg backend. A figure is
+hashed from its bundle, its options and files, the plotting style and the
+source of its drawing function and the functions of this module it calls; it
+is drawn again only when its hash differs from the one it was last drawn with
+in the same directory (kept in ``cache/figures``, one file for each figure and
+directory), or one of its files is missing. In a notebook,
+``draw`` returns a figure to show::
+
+    fig = figures.draw('fig2', figures.members_bundle(erf))
+    figures.save(fig, 'fig2', '../plots')
+
+``python -m cmip56forcing.pipeline figures`` renders them all from the
+pipeline's results.
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import config, implied_erf, regression, results
+
+PLOTS = os.path.join(config.ROOT, 'plots')
+STATE_DIR = os.path.join(config.CACHE, 'figures')
+HADCRUT5 = os.path.join(config.DATA_INPUT, 'HadCRUT.5.0.1.0.analysis.summary_series.global.annual.csv')
+
+STYLE = {
+    'font.size': 9,
+    'font.family': 'Arial',
+    'xtick.direction': 'out',
+    'xtick.minor.visible': True,
+    'ytick.minor.visible': True,
+    'ytick.right': True,
+    'xtick.top': True,
+}
+
+COLORS = {
+    'cmip5': '#cc2323',
+    'cmip6': '#2551cc',
+}
+
+# arrays of year x model (MultiModel) of the CMIP6 and CMIP5 experiments, with the RFMIP ERF or None, and the
+# HadCRUT5 years and anomalies from 1850-1900
+Historical = collections.namedtuple('Historical', ['cmip6', 'cmip5', 'rfmip', 'hadcrut5'])
+# historical implied ERF of each model's members and ensemble mean, and its RFMIP ERF, None if there is none
+Members = collections.namedtuple('Members', ['models', 'runs', 'members', 'mean', 'rfmip'])
+
+Figure = collections.namedtuple('Figure', ['draw', 'bundle', 'files', 'options'])
+
+# the panels of fig1, from top to bottom, and their CMIP5 experiments
+PANELS = ['historical', 'hist-GHG', 'hist-nat', 'hist-otheranthro']
+CMIP5_NAMES = {
+    'historical': 'historical',
+    'hist-GHG': 'historicalGHG',
+    'hist-nat': 'historicalNat',
+    'hist-otheranthro': 'historicalOther',
+}
+LEGEND_POS = {
+    'historical': 'upper left',
+    'hist-GHG': 'upper left',
+    'hist-nat': 'lower center',
+    'hist-otheranthro': 'lower left'
+}
+TITLES = [
+    ['(a) Total warming ($\\Delta T$)', '(b) Implied total ERF ($\\Delta F$)'],
+    ['(c) Greenhouse gas warming ($\\Delta T_{\\mathrm{GHG}}$)',
+     '(d) Implied greenhouse gas ERF ($\\Delta F_{\\mathrm{GHG}}$)'],
+    ['(e) Natural warming ($\\Delta T_{\\mathrm{nat}}$)', '(f) Implied natural ERF ($\\Delta F_{\\mathrm{nat}}$)'],
+    ['(g) Other anthropogenic warming ($\\Delta T_{\\mathrm{other}}$)',
+     '(h) Implied other anthropogenic ERF ($\\Delta F_{\\mathrm{other}}$)'],
+]
+
+
+def _years(table):
+    """Mid-years of the rows of a year x model array from 1850."""
+    return np.arange(len(table)) + 1850.5
+
+
+def _spread(ax, table, color, label, nan=False):
+    """Mean over models of a year x model array, shaded one standard deviation either side."""
+    mean, std = (np.nanmean, np.nanstd) if nan else (np.mean, np.std)
+    ax.fill_between(
+        _years(table),
+        mean(table, axis=1) - std(table, axis=1),
+        mean(table, axis=1) + std(table, axis=1),
+        color=color,
+        alpha=0.2,
+        edgecolor=None
+    )
+    ax.plot(_years(table), mean(table, axis=1), label=label, color=color)
+
+
+def _label(ax, text, x, y, ha, **kwargs):
+    ax.text(x, y, text, ha=ha, va='bottom', transform=ax.transAxes, backgroundcolor='w',
+            bbox=dict(boxstyle='square,pad=0.1', ec='w', fc='w'), **kwargs)
+
+
+def historical(bundle, ylim):
+    """Warming (left) and implied ERF (right) of CMIP6 and CMIP5 in each experiment of PANELS (fig1).
+
+    ylim: the y limits of each axis, by row and column
+    """
+    import matplotlib.pyplot as pl
+    from matplotlib.patches import Rectangle
+
+    fig, ax = pl.subplots(4, 2, figsize=(19/2.54, 23/2.54))
+    for i, expt in enumerate(PANELS):
+        cmip6 = bundle.cmip6[expt]
+        cmip5 = bundle.cmip5[CMIP5_NAMES[expt]]
+        aer = bundle.cmip6['hist-aer']
+        cmip6_label = 'CMIP6 (%d)' % results.model_count(cmip6.delta_F)
+
+        _spread(ax[i, 1], cmip6.delta_F, COLORS['cmip6'], cmip6_label)
+        if bundle.rfmip is not None and expt in bundle.rfmip:
+            _spread(ax[i, 1], bundle.rfmip[expt], 'k', 'RFMIP (%d)' % results.model_count(bundle.rfmip[expt]))
+        _spread(ax[i, 1], cmip5.delta_F, COLORS['cmip5'], 'CMIP5', nan=True)
+        if i == 3:
+            ax[3, 1].plot(_years(aer.delta_F), np.mean(aer.delta_F, axis=1), color='darkblue', lw=1.0)
+            if bundle.rfmip is not None:
+                rfmip = bundle.rfmip['hist-aer']
+                _spread(ax[3, 1], rfmip, 'k', 'RFMIP (%d)' % results.model_count(rfmip))
+        ax[i, 1].set_ylabel('W m$^{-2}$')
+        ax[i, 1].grid()
+        ax[i, 1].set_xlim(1850, 2015)
+
+        _spread(ax[i, 0], cmip6.delta_T, COLORS['cmip6'], cmip6_label)
+        _spread(ax[i, 0], cmip5.delta_T, COLORS['cmip5'], 'CMIP5 (%d)' % results.model_count(cmip5.delta_F),
+                nan=True)
+        if i == 0:
+            ax[0, 0].plot(*bundle.hadcrut5, color='k', label='HadCRUT5', lw=1.0)
+        if i == 3:
+            ax[3, 0].plot(
+                _years(aer.delta_T),
+                np.mean(aer.delta_T, axis=1),
+                label='CMIP6 aerosol-only (%d)' % results.model_count(aer.delta_F),
+                color='darkblue',
+                lw=1.0,
+            )
+        ax[i, 0].set_ylabel('$^{\\circ}$C')
+        ax[i, 0].grid()
+        ax[i, 0].set_xlim(1850, 2015)
+        ax[i, 0].legend(loc=LEGEND_POS[expt])
+
+    for row in range(4):
+        for col in range(2):
+            ax[row, col].set_ylim(*ylim[row][col])
+            ax[row, col].set_title(TITLES[row][col])
+
+    ax00 = ax[0, 0].axis()
+    rec = Rectangle((ax00[0]-33, ax00[2]-0.4), (ax00[1]-ax00[0])+41, (ax00[3]-ax00[2])+0.8, fill=False, lw=1, ls='--')
+    rec = ax[0, 0].add_patch(rec)
+    rec.set_clip_on(False)
+
+    fig.tight_layout()
+    return fig
+
+
+def members(bundle, shape, figsize):
+    """Historical implied ERF of the members of each RFMIP model, with its ensemble mean and RFMIP ERF (fig2)."""
+    import matplotlib.pyplot as pl
+
+    fig, ax = pl.subplots(*shape, figsize=figsize)
+    for i, model in enumerate(bundle.models):
+        axis = ax.flat[i]
+        for run, series in zip(bundle.runs[i], bundle.members[i]):
+            label = 'implied ERF ensemble members' if model == 'CanESM5' and run == 'r1i1p1f1' else ''
+            axis.plot(_years(series), series, color='0.7', label=label)
+        axis.plot(_years(bundle.mean[i]), bundle.mean[i], color='k', label='implied ERF ensemble mean')
+        axis.set_title('(%s) %s' % (chr(97+i), model))
+        if bundle.rfmip[i] is not None:
+            axis.plot(_years(bundle.rfmip[i]), bundle.rfmip[i], color=COLORS['cmip6'], label='RFMIP ERF')
+        axis.set_xlim(1850, 2015)
+        axis.set_ylim(-2, 3)
+        axis.grid()
+    pl.figtext(0.01, 0.5, 'Historical effective radiative forcing (W m$^{-2}$)', rotation=90, va='center')
+    for y, text, color in [
+        (0.88, 'implied ERF: ensemble members', '0.7'),
+        (0.78, 'implied ERF: ensemble mean', 'k'),
+        (0.68, 'Fixed-SST ERF', COLORS['cmip6']),
+    ]:
+        ax[0, 0].text(0.03, y, text, size=10, transform=ax[0, 0].transAxes, color=color, backgroundcolor='w',
+                      bbox=dict(boxstyle='square,pad=0.13', ec='w', fc='w'))
+    fig.tight_layout(rect=[0.02, 0, 1, 1])
+    return fig
+
+
+def rfmip_scatter(bundle):
+    """Implied against RFMIP fixed-SST historical ERF of each RFMIP model, with the regression line (figS1)."""
+    import matplotlib.pyplot as pl
+    from scipy.stats import linregress
+
+    fig, ax = pl.subplots(4, 2, figsize=(19/2.54, 23/2.54))
+    for i, model in enumerate(bundle.models):
+        axis = ax.flat[i]
+        rfmip, mean = bundle.rfmip[i], bundle.mean[i]
+        axis.scatter(rfmip, mean, color=COLORS['cmip6'])
+        axis.set_title('(%s) %s' % (chr(97+i), model))
+        axis.set_xlabel('RFMIP Fixed-SST ERF (W m$^{-2}$)')
+        axis.set_ylabel('implied ERF (W m$^{-2}$)')
+        axis.grid()
+        regress = linregress(rfmip, mean)
+        x = np.linspace(np.min(rfmip)-0.2, np.max(rfmip)+0.2)
+        axis.plot(x, regress.slope*x+regress.intercept, color='k', label='Best fit')
+        axis.plot(x, x, color='0.4', ls='--', label='1:1 line')
+        axis.set_xlim(-2.3, 3)
+        axis.set_ylim(-2.2, 2.4)
+        axis.legend()
+        _label(axis, 'slope = %.2f' % regress.slope, 0.95, 0.05, 'right')
+        _label(axis, 'r = %.2f' % regress.rvalue, 0.95, 0.17, 'right')
+    fig.tight_layout(rect=[0.02, 0, 1, 1])
+    return fig
+
+
+def gregory(bundle, models, early=20, upper=('GFDL-CM4', 'IPSL-CM6A-LR', 'MIROC6', 'NorESM2-LM', 'GISS-E2-1-G')):
+    """ΔN against ΔT of abrupt-4xCO2, with the regressions of the first early years and of the rest (figS2).
+
+    models: the models in the order drawn
+    upper: models whose feedback parameters are written in the upper right rather than the lower left
+    """
+    import matplotlib.pyplot as pl
+
+    early_fits, late_fits = regression.split_fits(bundle.delta_T, bundle.delta_N, early)
+    fig, ax = pl.subplots(4, 2, figsize=(19/2.54, 23/2.54))
+    for i, model in enumerate(models):
+        axis = ax.flat[i]
+        m = bundle.models.index(model)
+        delta_N = bundle.delta_N[m]
+        delta_T = bundle.delta_T[m]
+        axis.scatter(delta_T, delta_N, color=COLORS['cmip6'])
+        axis.set_title('(%s) %s' % (chr(97+i), model))
+        axis.set_xlabel('$\\Delta T$ (K)')
+        axis.set_ylabel('$\\Delta N$ (W m$^{-2}$)')
+        axis.grid()
+
+        fits = [regression.Fit(*(field[m] for field in fit)) for fit in (early_fits, late_fits)]
+        for fit, part, ls, label in [
+            (fits[0], slice(None, early), '-', 'Years 1-%d' % early),
+            (fits[1], slice(early, None), '--', 'Years %d-%d' % (early + 1, len(delta_T))),
+        ]:
+            x = np.linspace(np.min(delta_T[part])-0.2, np.max(delta_T[part])+0.2)
+            axis.plot(x, fit.slope*x+fit.intercept, color='k', ls=ls, label=label)
+        axis.set_xlim(0, 9)
+        axis.set_ylim(0, 8)
+
+        texts = [
+            r'$\lambda_{1\rightarrow %d} = %4.2f$ W m$^{-2}$ K$^{-1}$' % (early, fits[0].slope),
+            r'$\lambda_{%d\rightarrow %d} = %4.2f$ W m$^{-2}$ K$^{-1}$' % (early + 1, len(delta_T), fits[1].slope),
+            r'curvature = %4.2f' % (fits[0].slope/fits[1].slope),
+        ]
+        if model in upper:
+            for y, text in zip([0.83, 0.69, 0.57], texts):
+                _label(axis, text, 0.98, y, 'right')
+        else:
+            for y, text in zip([0.16, 0.02, 0.32], texts):
+                _label(axis, text, 0.02, y, 'left')
+    fig.tight_layout(rect=[0.02, 0, 1, 1])
+    return fig
+
+
+FIGURES = {
+    'fig1': Figure(historical, 'historical', ['fig1.pdf', 'fig1.png'], {'ylim': [
+        [(-0.5, 1.4), (-2, 2.5)], [(-0.2, 2), (-0.4, 3.2)], [(-0.6, 0.25), (-3, 1)], [(-1.05, 0.2), (-2, 0.7)],
+    ]}),
+    'fig1_rfmip7': Figure(historical, 'historical_rfmip7', ['fig1_rfmip7.png'], {'ylim': [
+        [(-0.5, 1.8), (-2, 2.5)], [(-0.2, 2.3), (-1, 3.2)], [(-0.6, 0.25), (-3, 1)], [(-1.15, 0.3), (-2, 1)],
+    ]}),
+    'fig2': Figure(members, 'members', ['fig2.pdf'], {'shape': (4, 2), 'figsize': (19/2.54, 23/2.54)}),
+    'fig2_agu2021': Figure(members, 'members', ['fig2_agu2021.pdf'], {'shape': (2, 4), 'figsize': (30/2.54, 15/2.54)}),
+    'figS1': Figure(rfmip_scatter, 'members', ['figS1.pdf'], {}),
+    'figS2': Figure(gregory, 'gregory', ['figS2.pdf'], {'models': results.RFMIP_MODELS}),
+}
+
+
+def hadcrut5_anomaly(path=HADCRUT5, last=2020):
+    """Years and HadCRUT5 global mean temperature anomalies from 1850-1900, to last."""
+    hadcrut5 = pd.read_csv(path, index_col=0)
+    anomaly = hadcrut5.loc[:last, 'Anomaly (deg C)'] - hadcrut5.loc[1850:1900, 'Anomaly (deg C)'].mean()
+    return anomaly.index.to_numpy(), anomaly.to_numpy()
+
+
+def historical_bundle(consolidated, hadcrut5=HADCRUT5, rfmip7=False):
+    """Historical bundle of all CMIP6 models, or with rfmip7 of the RFMIP-7 and their RFMIP ERF.
+
+    consolidated: as from results.consolidated_results
+    """
+    if rfmip7:
+        return Historical(consolidated['CMIP6-RFMIP7'], consolidated['CMIP5'], consolidated['RFMIP'],
+                          hadcrut5_anomaly(hadcrut5))
+    return Historical(consolidated['CMIP6'], consolidated['CMIP5'], None, hadcrut5_anomaly(hadcrut5))
+
+
+def members_bundle(erf, rfmip_path=results.RFMIP_ERF, models=results.RFMIP_MODELS, experiment='historical'):
+    """Members bundle of some models from the ExperimentSet of the CMIP6 implied ERF."""
+    delta_F = erf[experiment].delta_F
+    names = erf.runs(experiment)
+    means = implied_erf.ensemble_mean(delta_F, names)
+    frame = pd.read_csv(rfmip_path)
+    runs, series, mean, rfmip = [], [], [], []
+    for model in models:
+        m = erf.models.index(model)
+        slots = np.flatnonzero(names[m] != '')
+        runs.append(tuple(names[m, slots]))
+        series.append(delta_F[m, slots])
+        mean.append(means[m])
+        column = '%s TOT' % model
+        rfmip.append(frame[column].to_numpy()[:delta_F.shape[-1]] if column in frame else None)
+    return Members(list(models), runs, series, np.array(mean), rfmip)
+
+
+def bundles(consolidated, erf, gregory_results, hadcrut5=HADCRUT5, rfmip_path=results.RFMIP_ERF):
+    """dict of the name of each bundle in FIGURES to the bundle."""
+    return {
+        'historical': historical_bundle(consolidated, hadcrut5),
+        'historical_rfmip7': historical_bundle(consolidated, hadcrut5, rfmip7=True),
+        'members': members_bundle(erf, rfmip_path),
+        'gregory': gregory_results,
+    }
+
+
+def _update(sha, obj):
+    """Hash obj into sha by its content: arrays by their dtype, shape and bytes."""
+    if isinstance(obj, np.ndarray):
+        sha.update(('%s%s' % (obj.dtype, obj.shape)).encode())
+        sha.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        sha.update(b'{')
+        for key in sorted(obj):
+            _update(sha, key)
+            _update(sha, obj[key])
+        sha.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        sha.update(('%s[' % type(obj).__name__).encode())
+        for item in obj:
+            _update(sha, item)
+        sha.update(b']')
+    else:
+        sha.update(repr(obj).encode())
+
+
+def code_source(function, seen=None):
+    """Source of function and of the functions of this module it calls, and so on."""
+    seen = set() if seen is None else seen
+    seen.add(function.__name__)
+    sources = [inspect.getsource(function)]
+    for name in function.__code__.co_names:
+        called = globals().get(name)
+        if inspect.isfunction(called) and called.__module__ == __name__ and name not in seen:
+            sources.extend(code_source(called, seen))
+    return sources
+
+
+def figure_key(name, bundle):
+    """Hash of what a figure is drawn from: its bundle, options, files, the style and its code."""
+    figure = FIGURES[name]
+    sha = hashlib.sha1()
+    _update(sha, [name, figure.files, figure.options, STYLE, COLORS, code_source(figure.draw), bundle])
+    return sha.hexdigest()
+
+
+def draw(name, bundle):
+    """The figure name drawn from its bundle in the plotting style."""
+    import matplotlib
+
+    figure = FIGURES[name]
+    with matplotlib.rc_context(STYLE):
+        return figure.draw(bundle, **figure.options)
+
+
+def save(fig, name, directory=PLOTS):
+    """Write a figure drawn by draw to each of its files."""
+    for filename in FIGURES[name].files:
+        fig.savefig(os.path.join(directory, filename))
+
+
+def _render(name, bundle, directory):
+    import matplotlib
+
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as pl
+
+    start = time.perf_counter()
+    fig = draw(name, bundle)
+    save(fig, name, directory)
+    pl.close(fig)
+    return time.perf_counter() - start
+
+
+def _state_path(name, directory, state_dir):
+    """State file of a figure drawn in directory; each directory a figure is drawn in has its own."""
+    where = hashlib.sha1(os.path.abspath(directory).encode()).hexdigest()[:12]
+    return os.path.join(state_dir, '%s-%s.json' % (name, where))
+
+
+def _state(key, directory):
+    return {'key': key, 'directory': os.path.abspath(directory)}
+
+
+def is_current(name, key, directory=PLOTS, state_dir=STATE_DIR):
+    """Whether a figure's files exist in directory and were last drawn there with key."""
+    path = _state_path(name, directory, state_dir)
+    if not os.path.exists(path) or not all(os.path.exists(os.path.join(directory, f)) for f in FIGURES[name].files):
+        return False
+    with open(path) as f:
+        return json.load(f) == _state(key, directory)
+
+
+def render(all_bundles, names=None, directory=PLOTS, workers=None, state_dir=STATE_DIR, force=False, report=print):
+    """Draw the figures whose bundle, style or code changed since they were last drawn, at once in worker processes.
+
+    all_bundles: as from bundles
+    names: figures to render, by default all of FIGURES
+
+    returns: dict of the name of each figure to the seconds it took to draw, or None if it was up to date
+    """
+    start = time.perf_counter()
+    names = list(FIGURES) if names is None else list(names)
+    keys = {name: figure_key(name, all_bundles[FIGURES[name].bundle]) for name in names}
+    stale = [name for name in names if force or not is_current(name, keys[name], directory, state_dir)]
+    drawn = {name: None for name in names}
+    os.makedirs(directory, exist_ok=True)
+    os.makedirs(state_dir, exist_ok=True)
+    if stale:
+        with concurrent.futures.ProcessPoolExecutor(min(workers or os.cpu_count(), len(stale))) as executor:
+            futures = {
+                executor.submit(_render, name, all_bundles[FIGURES[name].bundle], directory): name for name in stale
+            }
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                drawn[name] = future.result()
+                fd, tmp = tempfile.mkstemp(dir=state_dir, suffix='.json')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(_state(keys[name], directory), f)
+                os.replace(tmp, _state_path(name, directory, state_dir))
+                report('%s: drawn in %.1f s' % (name, drawn[name]))
+    report('%d of %d figures drawn in %.1f s' % (len(stale), len(names), time.perf_counter() - start))
+    return drawn
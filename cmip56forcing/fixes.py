@@ -0,0 +1,150 @@
+"""Registry of the model and experiment specific fixes needed to read a run.
+
+Each fix is declared once in FIXES with the models and experiments it applies
+to (shell-style patterns), what it does to the iris cubes of one variable
+before they are concatenated, and what it does to a variable read with the
+netCDF4 reader, if anything. The fixes that apply to a unit are known before
+it is read, so they are applied on the first attempt rather than after a
+failure. ``python -m cmip56forcing.fixes`` lists them.
+"""
+
+import fnmatch
+
+
+class Fix:
+    """A named fix.
+
+    models, experiments: patterns, any of which must match
+    skip_experiments: patterns of experiments the fix does not apply to
+    cubes: function applied to the CubeList of one variable before concatenation
+    netcdf: function applied to a fastread.FastVariable, or None if that reader does not need the fix
+    """
+
+    def __init__(self, name, description, models=('*',), experiments=('*',), skip_experiments=(), cubes=None,
+                 netcdf=None):
+        self.name = name
+        self.description = description
+        self.models = models
+        self.experiments = experiments
+        self.skip_experiments = skip_experiments
+        self.cubes = cubes
+        self.netcdf = netcdf
+
+    def applies(self, model, experiment):
+        def matches(value, patterns):
+            return any(fnmatch.fnmatchcase(value, pattern) for pattern in patterns)
+
+        return (
+            matches(model, self.models)
+            and matches(experiment, self.experiments)
+            and not matches(experiment, self.skip_experiments)
+        )
+
+
+def _integer_time_bounds(cubes):
+    for cube in cubes:
+        cube.coord('time').bounds = cube.coord('time').bounds.astype(int)
+
+
+def _integer_time_points(cubes):
+    for cube in cubes:
+        cube.coord('time').points = cube.coord('time').points.astype(int)
+
+
+def _drop_time_attributes(cubes):
+    for cube in cubes:
+        cube.coord('time').attributes = None  # only causes headaches
+
+
+def _drop_grid_bounds(cubes):
+    for cube in cubes:
+        cube.coord('longitude').bounds = None
+        cube.coord('latitude').bounds = None
+
+
+def _guess_grid_bounds(variable):
+    variable.guess_grid_bounds()
+
+
+def _latitude_long_name(cubes):
+    for cube in cubes:
+        cube.coord('latitude').long_name = 'latitude'
+
+
+# applied in this order
+FIXES = [
+    Fix(
+        'integer-time-bounds',
+        'time bounds differ in type between files',
+        models=['CAMS-CSM1-0', 'IPSL-CM6A-LR', 'KACE-1-0-G'],
+        experiments=['piControl*'],
+        cubes=_integer_time_bounds,
+    ),
+    Fix(
+        'integer-time-points',
+        'time points differ in type between files',
+        models=['KACE-1-0-G'],
+        experiments=['piControl*'],
+        cubes=_integer_time_points,
+    ),
+    Fix(
+        'control-time-attributes',
+        'time coordinate attributes differ between files',
+        models=['CAMS-CSM1-0', 'IPSL-CM6A-LR', 'KACE-1-0-G'],
+        experiments=['piControl*'],
+        cubes=_drop_time_attributes,
+    ),
+    Fix(
+        'guess-grid-bounds',
+        'latitude and longitude bounds differ between files; replaced by guessed bounds',
+        models=['NorESM2-LM'],
+        experiments=['piControl*'],
+        cubes=_drop_grid_bounds,
+        netcdf=_guess_grid_bounds,
+    ),
+    # A problem first identified in AWI but good to turn off in all models
+    Fix(
+        'latitude-long-name',
+        'latitude long_name differs between files',
+        skip_experiments=['piControl*'],
+        cubes=_latitude_long_name,
+    ),
+    Fix(
+        'time-attributes',
+        'time coordinate attributes differ between files',
+        skip_experiments=['piControl*'],
+        cubes=_drop_time_attributes,
+    ),
+]
+
+
+def fixes_for(model, experiment):
+    """The fixes that apply to a model and experiment, in the order they are applied."""
+    return [fix for fix in FIXES if fix.applies(model, experiment)]
+
+
+def apply_cube_fixes(cubes, model, experiment):
+    """Apply the fixes for a model and experiment to the CubeList of one variable."""
+    for fix in fixes_for(model, experiment):
+        if fix.cubes is not None:
+            fix.cubes(cubes)
+
+
+def apply_netcdf_fixes(variable, model, experiment):
+    """Apply the fixes for a model and experiment to a variable read with the netCDF4 reader."""
+    for fix in fixes_for(model, experiment):
+        if fix.netcdf is not None:
+            fix.netcdf(variable)
+
+
+def main():
+    for fix in FIXES:
+        where = 'models %s, experiments %s' % (' '.join(fix.models), ' '.join(fix.experiments))
+        if fix.skip_experiments:
+            where = where + ' except ' + ' '.join(fix.skip_experiments)
+        readers = 'iris' if fix.netcdf is None else 'iris and netCDF4'
+        print('%s: %s (%s; %s)' % (fix.name, fix.description, where, readers))
+
+
+if __name__ == '__main__':
+    main()
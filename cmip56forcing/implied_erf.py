@@ -0,0 +1,187 @@
+"""Implied effective radiative forcing of every run at once.
+
+The implied ERF of a run is ΔF = ΔN − λ·ΔT, where ΔN and ΔT are the
+top-of-atmosphere net flux N = rsdt − rsut − rlut and the surface temperature
+of the run less those of its piControl over the same years, from its branch
+point, and λ is the model's feedback parameter (negative, so that ΔF exceeds
+ΔN as the climate warms).
+
+The piControl window of each member is gathered with one fancy index, from an
+array of branch rows, and ΔN, ΔT and ΔF of every member of every model follow
+from one broadcast expression, element for element as
+``notebooks/produce_results.ipynb`` computed them in a loop over runs. CMIP6
+experiments are compared over 165 years (1850 to 2014) and the CMIP5-style
+experiments over 156 (1850 to 2005).
+
+By default each year of a run is compared with the same year of its piControl
+(the 'pointwise' baseline), which carries the control's year-to-year noise into
+ΔN and ΔT. The 'linear' and 'quadratic' baselines compare it instead with a
+polynomial in time fitted to all years of the piControl, the drift, fitted to
+every model's control by least squares at once.
+"""
+
+import collections
+
+import numpy as np
+
+from . import branch_points, config
+
+CMIP5_LENGTH = 156
+
+# degree of the polynomial fitted to the piControl of each baseline, None to use it as it is
+BASELINES = {'pointwise': None, 'linear': 1, 'quadratic': 2}
+
+ImpliedERF = collections.namedtuple('ImpliedERF', ['delta_N', 'delta_T', 'delta_F'])
+
+
+def window_length(experiment):
+    """Years an experiment is compared with its piControl over."""
+    return CMIP5_LENGTH if experiment.endswith('-cmip5') else branch_points.LENGTH
+
+
+def net_flux(values, variables=config.VARIABLES):
+    """Top-of-atmosphere net downward flux from an array with variables on its last axis."""
+    return (
+        values[..., variables.index('rsdt')] - values[..., variables.index('rsut')]
+        - values[..., variables.index('rlut')]
+    )
+
+
+def control_drift(controls, degree):
+    """Polynomial of degree in time fitted to each variable of each control over all its years.
+
+    controls: array of (..., control years, variable), NaN in years a control does not have
+
+    returns: array of controls' shape of the fitted values, NaN where controls are
+    """
+    valid = ~np.isnan(controls)
+    # powers of time scaled to [-1, 1], for well conditioned normal equations
+    basis = np.linspace(-1, 1, controls.shape[-2])[:, None] ** np.arange(degree + 1)
+    gram = np.einsum('...yv,yi,yj->...vij', valid.astype(float), basis, basis)
+    moments = np.einsum('...yv,yi->...vi', np.where(valid, controls, 0), basis)
+    # controls with too few years to fit are left NaN
+    fitted = valid.sum(axis=-2) > degree
+    gram = np.where(fitted[..., None, None], gram, np.eye(degree + 1))
+    coefficients = np.linalg.solve(gram, moments[..., None])[..., 0]
+    drift = np.einsum('yi,...vi->...yv', basis, coefficients)
+    return np.where(valid & fitted[..., None, :], drift, np.nan)
+
+
+def control_windows(controls, starts, length):
+    """Rows starts to starts + length of the controls.
+
+    controls: array of (..., control years, variable), with leading axes broadcastable against starts
+    starts: int array of the first row of each window, negative for none
+
+    returns: array of (starts' shape, length, variable), NaN where a window is missing or
+    runs beyond the end of its control
+    """
+    years = controls.shape[-2]
+    rows = starts[..., None] + np.arange(length)
+    inside = (starts[..., None] >= 0) & (rows < years)
+    windows = np.take_along_axis(controls, np.clip(rows, 0, years - 1)[..., None], axis=-2)
+    return np.where(inside[..., None], windows, np.nan)
+
+
+def implied_erf(runs, controls, starts, feedback, length, variables=config.VARIABLES, baseline='pointwise'):
+    """ΔN, ΔT and ΔF of every member at once.
+
+    runs: array of (..., years, variable) of the runs' annual means, members on the leading axes
+    controls: array of (..., control years, variable) of each member's piControl, with leading axes
+        broadcastable against those of runs, e.g. one control per model for many members
+    starts: int array of the leading axes of runs of each member's branch row, negative for none
+    feedback: λ of each member, broadcastable against starts
+    length: years from the start of the runs and from the branch rows to compare
+    baseline: one of BASELINES, what the runs are compared with: the piControl year for year, or the
+        drift fitted to all of it
+
+    returns: ImpliedERF of arrays of (..., length), NaN where a member has no run, branch point
+    or piControl window
+    """
+    if baseline not in BASELINES:
+        raise ValueError('baseline %s is not one of %s' % (baseline, ', '.join(BASELINES)))
+    if BASELINES[baseline] is not None:
+        controls = control_drift(controls, BASELINES[baseline])
+    window = control_windows(controls, starts, length)
+    values = runs[..., :length, :]
+    if values.shape[-2] < length:
+        values = np.concatenate(
+            [values, np.full(values.shape[:-2] + (length - values.shape[-2], values.shape[-1]), np.nan)], axis=-2)
+    delta_N = net_flux(values, variables) - net_flux(window, variables)
+    delta_T = values[..., variables.index('tas')] - window[..., variables.index('tas')]
+    delta_F = delta_N - np.asarray(feedback)[..., None] * delta_T
+    return ImpliedERF(delta_N, delta_T, delta_F)
+
+
+def branch_rows(ensemble, points):
+    """int array of experiment x model x member of each run's branch row, -1 for none.
+
+    points: dict of experiment to model to run to branch row, as in branch_points.json
+    """
+    rows = np.full(ensemble.runs.shape, -1)
+    for (e, m, k), run in np.ndenumerate(ensemble.runs):
+        if run:
+            rows[e, m, k] = points.get(ensemble.experiments[e], {}).get(ensemble.models[m], {}).get(run, -1)
+    return rows
+
+
+def ensemble_erf(runs, controls, points, feedbacks, baseline='pointwise'):
+    """Implied ERF of each experiment of an Ensemble.
+
+    runs: Ensemble of the experiments
+    controls: Ensemble of their piControls, as from ``ensemble.load(['piControl', 'piControl-cmip5'])``;
+        CMIP5-style experiments are compared against the piControl-cmip5
+    points: branch points, as in branch_points.json
+    feedbacks: dict of model to λ; models without one give NaN
+    baseline: one of BASELINES
+
+    returns: dict of experiment to ImpliedERF of arrays of model x member x window_length(experiment)
+    """
+    starts = branch_rows(runs, points)
+    feedback = np.array([feedbacks.get(model, np.nan) for model in runs.models])
+    results = {}
+    for e, experiment in enumerate(runs.experiments):
+        control_experiment = branch_points.control_experiment(experiment)
+        # piControl of each model of the runs, NaN for models without one
+        control = np.full((len(runs.models), controls.years, len(runs.variables)), np.nan)
+        c = controls.experiments.index(control_experiment)
+        for m, model in enumerate(runs.models):
+            if model in controls.models:
+                control[m] = controls.data[c, controls.models.index(model), 0]
+        members = np.where(runs.runs[e] != '', starts[e], -1)
+        results[experiment] = implied_erf(
+            runs.data[e], control[:, None], members, feedback[:, None], window_length(experiment), runs.variables,
+            baseline,
+        )
+    return results
+
+
+def ensemble_mean(values, runs):
+    """Mean over the members of each model, from an array of model x member x year, skipping missing years."""
+    present = (runs != '')[..., None] & ~np.isnan(values)
+    count = present.sum(axis=1)
+    total = np.where(present, values, 0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def as_dict(values, runs, labels, models=None):
+    """dict of model to run to series, and 'mean' to the ensemble mean, as the notebooks keep results.
+
+    values: array of model x member x year
+    runs: str array of model x member of the run in each slot, '' where none
+    labels: models of the model axis
+    models: models to list, by default those with runs; those without any have only a NaN mean
+    """
+    means = ensemble_mean(values, runs)
+    if models is None:
+        models = [model for m, model in enumerate(labels) if (runs[m] != '').any()]
+    results = {}
+    for model in models:
+        if model not in labels:
+            results[model] = {'mean': np.full(values.shape[-1], np.nan)}
+            continue
+        m = labels.index(model)
+        results[model] = {run: values[m, k] for k, run in enumerate(runs[m]) if run}
+        results[model]['mean'] = means[m]
+    return results
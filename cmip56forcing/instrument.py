@@ -0,0 +1,210 @@
+"""Timing and memory records of each stage of the extraction, as JSON lines.
+
+While recording, every stage appends one line to the events file:
+
+    {"stage": "iris.load", "model": "CanESM5", "run": "r1i1p1f1", "experiment": "historical",
+     "seconds": 2.31, "bytes_read": 118489088, "rss_peak_mb": 412.0, "start": 1700000000.1, "pid": 4242}
+
+The stages are ``catalogue`` (finding a model's files), ``iris.load``,
+``unify_time_units``, ``fixes``, ``concatenate_cube`` or, with the netCDF4
+reader, ``open``; then ``weights``, ``read`` (realising the data of a block of
+time steps), ``reduce`` (its area-weighted mean), ``annual_mean``, ``write``
+and ``inputs`` (describing the input files for the manifest, with checksums if
+asked for), with a ``unit`` record covering the extraction of each run.
+Stages of one variable carry its name in ``variable``. bytes_read is what the
+process read during the stage (``rchar`` in /proc/self/io, so including any
+prefetch copies running in the same process), rss_peak_mb the process's peak
+resident memory so far (each run has a process of its own unless there is a
+single worker), and with ``trace_memory`` traced_peak_mb the peak of memory
+allocated during the stage, as seen by tracemalloc, which slows the run down.
+A stage that raises is recorded with the exception type in ``error``.
+
+Lines are written with one append each, so the worker processes of a batch
+can share a file on a local disk. ``python -m cmip56forcing.instrument
+events.jsonl`` ranks the slowest stages, models and runs.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+_state = None
+
+
+class _Recorder:
+    def __init__(self, path, trace_memory):
+        self.path = path
+        self.trace_memory = trace_memory
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.context = {}
+        # peak traced memory of each open stage, from its children
+        self.peaks = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def close(self):
+        os.close(self.fd)
+
+    def write(self, event):
+        os.write(self.fd, (json.dumps(event) + '\n').encode())
+
+
+def _bytes_read():
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _rss_peak_mb():
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+def recording():
+    return _state is not None
+
+
+@contextlib.contextmanager
+def record(path, trace_memory=False, **context):
+    """Record stages to path within the block, tagged with context (model, run, experiment).
+
+    Nested calls with the same path add to the context of the enclosing one;
+    a None path records nothing.
+    """
+    global _state
+    if path is None:
+        yield
+        return
+    previous = _state
+    if previous is not None and previous.path == path:
+        saved = dict(previous.context)
+        previous.context.update(context)
+        try:
+            yield
+        finally:
+            previous.context = saved
+        return
+    _state = _Recorder(path, trace_memory)
+    _state.context.update(context)
+    try:
+        yield
+    finally:
+        _state.close()
+        _state = previous
+
+
+@contextlib.contextmanager
+def stage(name, **fields):
+    """Time the block as stage name, with fields (such as variable) added to its record."""
+    recorder = _state
+    if recorder is None:
+        yield
+        return
+    tracing = recorder.trace_memory and tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        recorder.peaks.append(0)
+    error = None
+    start = time.time()
+    started = time.perf_counter()
+    read_before = _bytes_read()
+    try:
+        yield
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        event = {'stage': name}
+        event.update(recorder.context)
+        event.update(fields)
+        event['seconds'] = time.perf_counter() - started
+        read_after = _bytes_read()
+        event['bytes_read'] = None if read_before is None else read_after - read_before
+        event['rss_peak_mb'] = _rss_peak_mb()
+        if tracing:
+            peak = max(tracemalloc.get_traced_memory()[1], recorder.peaks.pop())
+            event['traced_peak_mb'] = peak / 2**20
+            if recorder.peaks:
+                recorder.peaks[-1] = max(recorder.peaks[-1], peak)
+            tracemalloc.reset_peak()
+        if error is not None:
+            event['error'] = error
+        event['start'] = start
+        event['pid'] = os.getpid()
+        recorder.write(event)
+
+
+def read_events(path):
+    """DataFrame of the records in an events file."""
+    import pandas as pd
+
+    with open(path) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def summarise(events):
+    """Tables ranking the stages, models and runs of a batch by time taken.
+
+    events: DataFrame of records, as from read_events
+
+    returns: dict of 'stages', 'models' and 'units' DataFrames, slowest first
+    """
+    events = events.copy()
+    for column in ['model', 'run', 'experiment']:
+        if column not in events:
+            events[column] = None
+    if 'traced_peak_mb' not in events:
+        events['traced_peak_mb'] = float('nan')
+    units = events[events['stage'] == 'unit']
+    parts = events[events['stage'] != 'unit']
+
+    stages = parts.groupby('stage').agg(
+        count=('seconds', 'size'), seconds=('seconds', 'sum'), mean=('seconds', 'mean'), max=('seconds', 'max'),
+        gb_read=('bytes_read', lambda values: values.sum() / 1e9), rss_peak_mb=('rss_peak_mb', 'max'),
+        traced_peak_mb=('traced_peak_mb', 'max'),
+    )
+    stages['share'] = stages['seconds'] / stages['seconds'].sum()
+    stages['gb_per_s'] = stages['gb_read'] / stages['seconds']
+
+    # a model's time is that of its runs, plus finding its files
+    per_model = events[(events['stage'].isin(['unit', 'catalogue'])) & events['model'].notna()]
+    models = per_model.groupby('model').agg(
+        runs=('run', 'nunique'), seconds=('seconds', 'sum'), max=('seconds', 'max'), rss_peak_mb=('rss_peak_mb', 'max'),
+    )
+    by_stage = parts[parts['model'].notna()].groupby(['model', 'stage'])['seconds'].sum().reset_index()
+    models['slowest_stage'] = by_stage.sort_values('seconds').groupby('model').last()['stage']
+    columns = ['model', 'run', 'experiment', 'seconds', 'rss_peak_mb'] + (['error'] if 'error' in units else [])
+    return {
+        'stages': stages.sort_values('seconds', ascending=False),
+        'models': models.sort_values('seconds', ascending=False),
+        'units': units[columns].sort_values('seconds', ascending=False).reset_index(drop=True),
+    }
+
+
+def main(argv=None):
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Rank the slowest stages, models and runs of a batch.')
+    parser.add_argument('events', nargs='+', help='JSON-lines files written with extract --events')
+    parser.add_argument('--top', type=int, default=10, help='number of models and runs to list')
+    args = parser.parse_args(argv)
+
+    tables = summarise(pd.concat([read_events(path) for path in args.events], ignore_index=True))
+    with pd.option_context('display.width', 200, 'display.max_columns', 20, 'display.float_format', '{:.3g}'.format):
+        print('stages, by total time\n%s\n' % tables['stages'])
+        print('slowest models\n%s\n' % tables['models'].head(args.top))
+        print('slowest runs\n%s' % tables['units'].head(args.top))
+
+
+if __name__ == '__main__':
+    main()
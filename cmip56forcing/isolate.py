@@ -0,0 +1,87 @@
+"""Run each unit of work in a process of its own, with a time limit.
+
+A worker that segfaults in a netCDF library, is killed for running out of
+memory, or hangs reading from NFS takes only its own unit with it: the unit is
+reported as failed with the reason and the rest of the batch carries on. A
+process pool cannot give this, because a task that hangs cannot be stopped and
+a worker that dies breaks the whole pool.
+"""
+
+import multiprocessing
+import time
+import traceback
+from multiprocessing.connection import wait
+
+
+def _child(conn, function, args, kwargs):
+    try:
+        outcome = (True, function(*args, **kwargs))
+    except BaseException as exc:
+        outcome = (False, ''.join(traceback.format_exception_only(type(exc), exc)).strip())
+    conn.send(outcome)
+    conn.close()
+
+
+class Isolated:
+    """At most workers calls at once, each in a new process.
+
+    timeout: seconds after which a call's process is killed; None for no limit
+    context: multiprocessing context to start processes with
+    """
+
+    def __init__(self, workers, timeout=None, context=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.context = context or multiprocessing.get_context()
+        self._running = {}
+
+    def __len__(self):
+        return len(self._running)
+
+    def full(self):
+        return len(self._running) >= self.workers
+
+    def submit(self, key, function, *args, **kwargs):
+        """Start function(*args, **kwargs) in a new process; its outcome is reported under key."""
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=_child, args=(sender, function, args, kwargs), daemon=True)
+        process.start()
+        sender.close()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self._running[receiver] = (key, process, deadline)
+
+    def poll(self, block=True):
+        """Outcomes of the calls that have finished, been killed or died.
+
+        block: wait until there is at least one, rather than returning at once
+
+        returns: list of (key, succeeded, result or reason for the failure)
+        """
+        finished = []
+        while self._running:
+            deadlines = [deadline for _, _, deadline in self._running.values() if deadline is not None]
+            wait_for = 0
+            if block:
+                wait_for = None if len(deadlines) == 0 else max(0, min(deadlines) - time.monotonic())
+            ready = wait(list(self._running), timeout=wait_for)
+            for receiver in ready:
+                key, process, _ = self._running.pop(receiver)
+                try:
+                    succeeded, result = receiver.recv()
+                except EOFError:
+                    process.join()
+                    succeeded, result = False, 'worker process died with exit code %s' % process.exitcode
+                receiver.close()
+                process.join()
+                finished.append((key, succeeded, result))
+            now = time.monotonic()
+            for receiver, (key, process, deadline) in list(self._running.items()):
+                if deadline is not None and now >= deadline:
+                    process.kill()
+                    process.join()
+                    receiver.close()
+                    del self._running[receiver]
+                    finished.append((key, False, 'timed out after %g s' % self.timeout))
+            if finished or not block:
+                break
+        return finished
@@ -0,0 +1,122 @@
+"""Load all energy budget variables of one run in a single pass.
+
+The files for every variable are read with one ``iris.load`` call, time units
+are unified once across the lot, and the time axis is planned once from tas.
+Every variable is then reduced against that shared plan and the shared grid
+weights.
+"""
+
+import cftime
+import numpy as np
+
+from .fixes import apply_cube_fixes
+from .instrument import stage
+
+
+class TimeMismatch(ValueError):
+    """A variable's time axis does not match that of tas."""
+
+
+def load_run(filelists, model, experiment):
+    """Load and concatenate every variable of a run.
+
+    filelists: dict of variable name to list of files
+    returns: dict of variable name to (lazy) concatenated cube, with lat/lon bounds
+    """
+    import iris
+    from iris.util import equalise_attributes, unify_time_units
+
+    allfiles = [file for var in filelists for file in filelists[var]]
+    with stage('iris.load'):
+        loaded = iris.load(allfiles)
+    with stage('unify_time_units'):
+        unify_time_units(loaded)
+    cubes = {}
+    for var in filelists:
+        cubelist = loaded.extract(iris.NameConstraint(var_name=var))
+        with stage('fixes', variable=var):
+            equalise_attributes(cubelist)
+            apply_cube_fixes(cubelist, model, experiment)
+        with stage('concatenate_cube', variable=var):
+            cube = cubelist.concatenate_cube()
+        if not cube.coord('longitude').has_bounds():
+            cube.coord('longitude').guess_bounds()
+        if not cube.coord('latitude').has_bounds():
+            cube.coord('latitude').guess_bounds()
+        cubes[var] = cube
+    return cubes
+
+
+def year_of(points, units):
+    """Calendar year of each of points, as integers.
+
+    Only the first of January of each year spanned is converted between dates
+    and numbers; the points are placed between them with a binary search,
+    rather than each made into a date.
+    """
+    first, last = units.num2date([np.min(points), np.max(points)])
+    years = np.arange(first.year, last.year + 2)
+    starts = units.date2num([cftime.datetime(year, 1, 1, calendar=units.calendar) for year in years])
+    return years[np.searchsorted(starts, points, side='right') - 1]
+
+
+class TimePlan:
+    """Grouping of the time steps of a run into calendar years.
+
+    Built once from one time coordinate and applied to every variable. Each
+    step is given to the year its point falls in, as ``add_year`` does. Annual
+    means are the plain mean of each year's steps, as for
+    ``aggregated_by('year', MEAN)``, or with month_weights each step weighted by
+    the length of its bounds, so that February counts for less than January.
+    Each year's date is the midpoint of the group's bounds, as from
+    ``aggregated_by``; only years are needed for the integer year axis.
+    """
+
+    def __init__(self, time_coord, month_weights=False):
+        self.points = time_coord.points
+        self.units = time_coord.units
+        self.years = year_of(self.points, self.units)
+        self.unique_years, self.index, self.counts = np.unique(self.years, return_inverse=True, return_counts=True)
+        if time_coord.has_bounds():
+            self.lower, self.upper = time_coord.bounds[:, 0], time_coord.bounds[:, 1]
+        else:
+            self.lower, self.upper = self.points, self.points
+        self.weights = None
+        self.totals = self.counts
+        if month_weights:
+            if time_coord.has_bounds():
+                self.weights = self.upper - self.lower
+            elif len(self.points) == 1:
+                self.weights = np.ones(1)
+            else:
+                # as far as halfway to the neighbouring points
+                edges = np.concatenate([
+                    [1.5 * self.points[0] - 0.5 * self.points[1]],
+                    0.5 * (self.points[1:] + self.points[:-1]),
+                    [1.5 * self.points[-1] - 0.5 * self.points[-2]],
+                ])
+                self.weights = np.diff(edges)
+            self.totals = np.bincount(self.index, weights=self.weights)
+
+    def __len__(self):
+        return len(self.unique_years)
+
+    @property
+    def dates(self):
+        """cftime date of each year, the midpoint of its first and last bounds."""
+        first = np.searchsorted(self.index, np.arange(len(self.unique_years)), side='left')
+        last = np.searchsorted(self.index, np.arange(len(self.unique_years)), side='right') - 1
+        return list(self.units.num2date(0.5 * (self.lower[first] + self.upper[last])))
+
+    def check(self, var, time_coord):
+        """Raise TimeMismatch unless time_coord has the same points as the plan."""
+        if len(time_coord.points) != len(self.points):
+            raise TimeMismatch('length of %s did not match tas' % var)
+        if not np.allclose(time_coord.points, self.points):
+            raise TimeMismatch('time points of %s did not match tas' % var)
+
+    def annual_mean(self, monthly):
+        """Mean of the time steps in each year, weighted by their length if the plan was made so."""
+        if self.weights is not None:
+            monthly = monthly * self.weights
+        return np.bincount(self.index, weights=monthly) / self.totals
@@ -0,0 +1,198 @@
+"""Record of which (model, run, experiment) outputs have been written, and from what.
+
+Each unit's entry lists its input files with their sizes and mtimes, the
+outputs written and the outcome. On a rerun a unit is skipped if it succeeded
+and its inputs are unchanged. Sizes and mtimes are compared first. Checksumming
+every input means reading it from NFS a second time, so SHA-1 checksums are only
+recorded when asked for; where they are, a file is checksummed again only when
+its size or mtime differs, so a file that has merely been touched or copied is
+not counted as a change. Failures are recorded with the exception text and are
+not retried until their inputs change, unless asked.
+
+A batch split into shards (``extract --shard i/N``) records each shard's units
+in a partial manifest of its own next to the main one, and reads the main one
+for the units recorded before; ``python -m cmip56forcing.manifest merge``
+then folds the partial manifests into the main one.
+"""
+
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+from . import config
+
+DEFAULT_PATH = os.path.join(config.DATA_OUTPUT, 'extraction_manifest.json')
+
+
+def unit_key(model, run, experiment):
+    return '%s/%s/%s' % (model, run, experiment)
+
+
+def checksum(path, blocksize=2**24):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def describe_inputs(stats, with_checksums=False, copies=None):
+    """Input records for the manifest.
+
+    stats: dict of path to (size, mtime)
+    copies: dict of path to an identical local copy to checksum instead
+    """
+    copies = copies or {}
+    inputs = []
+    for path in sorted(stats):
+        size, mtime = stats[path]
+        record = {'path': path, 'size': size, 'mtime': mtime}
+        if with_checksums:
+            record['sha1'] = checksum(copies.get(path, path))
+        inputs.append(record)
+    return inputs
+
+
+def shard_path(path, index, count):
+    """Path of the partial manifest of shard index of count."""
+    stem, ext = os.path.splitext(path)
+    return '%s.shard-%d-of-%d%s' % (stem, index, count, ext)
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class Manifest:
+    """JSON manifest of extraction units, saved atomically after every update.
+
+    base: manifest to look up units not recorded in this one, which is not written to
+    """
+
+    def __init__(self, path=DEFAULT_PATH, base=None):
+        self.path = path
+        self.base = base
+        self.units = {}
+        self._dirty = False
+        if os.path.exists(path):
+            self.units = _load(path)
+
+    def shard(self, index, count):
+        """The partial manifest for shard index of count, backed by this one."""
+        return Manifest(shard_path(self.path, index, count), base=self)
+
+    def entry(self, model, run, experiment):
+        """The unit's record, or None."""
+        key = unit_key(model, run, experiment)
+        if key in self.units or self.base is None:
+            return self.units.get(key)
+        return self.base.entry(model, run, experiment)
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.units, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+    def record(self, model, run, experiment, succeeded, inputs, outputs=(), error=None):
+        key = unit_key(model, run, experiment)
+        previous = self.entry(model, run, experiment) or {}
+        entry = {
+            'status': 'ok' if succeeded else 'failed',
+            'inputs': inputs,
+            'outputs': list(outputs),
+            'attempts': previous.get('attempts', 0) + 1,
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        }
+        if error is not None:
+            entry['error'] = error
+        self.units[key] = entry
+        self.save()
+
+    def _inputs_unchanged(self, entry, stats):
+        recorded = {record['path']: record for record in entry['inputs']}
+        if set(recorded) != set(stats):
+            return False
+        for path, (size, mtime) in stats.items():
+            record = recorded[path]
+            if record['size'] == size and record['mtime'] == mtime:
+                continue
+            # only read the file again if the cheap comparison fails
+            if record.get('sha1') is None or record['size'] != size or checksum(path) != record['sha1']:
+                return False
+            record['mtime'] = mtime
+            self._dirty = True
+        return True
+
+    def status(self, model, run, experiment, stats, output_dir):
+        """One of 'new', 'current', 'stale', 'failed' or 'changed' (failed, but inputs have changed since).
+
+        stats: dict of input path to (size, mtime)
+        output_dir: directory the recorded outputs are relative to
+        """
+        entry = self.entry(model, run, experiment)
+        if entry is None:
+            return 'new'
+        unchanged = self._inputs_unchanged(entry, stats)
+        if self._dirty:
+            self.save()
+        if entry['status'] == 'failed':
+            return 'failed' if unchanged else 'changed'
+        if not unchanged:
+            return 'stale'
+        for output in entry['outputs']:
+            if not os.path.exists(os.path.join(output_dir, output)):
+                return 'stale'
+        return 'current'
+
+    def failures(self):
+        return {key: entry['error'] for key, entry in self.units.items() if entry['status'] == 'failed'}
+
+
+def merge(path=DEFAULT_PATH, parts=None, remove=True):
+    """Fold partial manifests into the manifest at path, keeping the latest record of each unit.
+
+    parts: partial manifest paths; by default all the shards' next to path
+    remove: delete the partial manifests once merged
+
+    returns: number of units taken from the partial manifests
+    """
+    if parts is None:
+        stem, ext = os.path.splitext(path)
+        parts = sorted(glob.glob('%s.shard-*-of-*%s' % (glob.escape(stem), ext)))
+    manifest = Manifest(path)
+    taken = 0
+    for part in parts:
+        for key, entry in _load(part).items():
+            current = manifest.units.get(key)
+            # times are UTC ISO 8601, so compare as strings
+            if current is None or entry['time'] >= current['time']:
+                manifest.units[key] = entry
+                taken = taken + 1
+    manifest.save()
+    if remove:
+        for part in parts:
+            os.remove(part)
+    return taken
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Merge the partial manifests of a sharded extraction.')
+    parser.add_argument('command', choices=['merge'])
+    parser.add_argument('--manifest', default=DEFAULT_PATH)
+    parser.add_argument('--keep', action='store_true', help='keep the partial manifests after merging')
+    args = parser.parse_args(argv)
+
+    print('merged %d units into %s' % (merge(args.manifest, remove=not args.keep), args.manifest))
+
+
+if __name__ == '__main__':
+    main()
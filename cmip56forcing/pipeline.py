@@ -0,0 +1,297 @@
+"""Run the analysis from the archive to the results as stages, recomputing only those that are stale.
+
+Each stage is a function of the outputs of the stages it requires and of its
+parameters. Its output is pickled under ``cache/pipeline`` with a key hashed
+from its name, its parameters, the keys of the stages it requires, the sizes
+and mtimes of the input files it reads directly, and the source of its function
+and of the modules it names. A stage whose key has an output is not run again,
+so after a change only the stages downstream of it are recomputed.
+
+Some stages can not know whether their inputs changed without running: the
+catalogue scan and the extraction are incremental already, so they run every
+time, and their key is the hash of their output instead. The extraction's
+output is the sizes and mtimes of the CSV tree, so stages after it rerun only
+when a file was written.
+
+Stages whose requirements are met run at once, each in a worker process of its
+own; the catalogue and extraction stages, which start worker processes of
+their own, run in threads of this one. All worker processes are started from
+a fork server rather than forked from this process while its threads run. Example::
+
+    python -m cmip56forcing.pipeline                # from the CSV tree in data_output
+    python -m cmip56forcing.pipeline --extract      # from the archive
+    python -m cmip56forcing.pipeline cmip5_erf --force cmip5_erf
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import glob
+import hashlib
+import importlib
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+
+from . import branch_points, cmip5, config, figures, implied_erf, results
+from .catalogue import DEFAULT_DB
+
+CACHE_DIR = os.path.join(config.CACHE, 'pipeline')
+
+Stage = collections.namedtuple(
+    'Stage', ['name', 'function', 'requires', 'params', 'files', 'modules', 'always', 'local'],
+    defaults=((), {}, (), (), False, False),
+)
+Stage.__doc__ = """A step of the pipeline.
+
+name: the stage's name, which is also the keyword its output is passed to later stages by
+function: module-level function called with the outputs of requires and params as keyword arguments
+files: paths or glob patterns of input files the stage reads other than through requires
+modules: names of cmip56forcing modules whose source is part of the key, besides the function's own
+always: run every time, keyed by the hash of the output
+local: run in a thread of this process instead of a worker process
+"""
+
+Outcome = collections.namedtuple('Outcome', ['key', 'ran', 'seconds'])
+
+
+def _sha1(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_stats(patterns):
+    """Sorted list of (path, size, mtime_ns) of the files matching paths or glob patterns."""
+    stats = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            if os.path.isfile(path):
+                info = os.stat(path)
+                stats.append((path, info.st_size, info.st_mtime_ns))
+    return stats
+
+
+def source_hash(stage):
+    """Hash of the source of a stage's function and of the modules it names."""
+    sources = [inspect.getsource(stage.function)]
+    for name in stage.modules:
+        sources.append(inspect.getsource(importlib.import_module('cmip56forcing.' + name)))
+    return _sha1(sources)
+
+
+def stage_key(stage, keys):
+    """Key of a stage from the keys of the stages it requires."""
+    return _sha1({
+        'name': stage.name,
+        'params': stage.params,
+        'requires': {name: keys[name] for name in stage.requires},
+        'files': file_stats(stage.files),
+        'source': source_hash(stage),
+    })[:16]
+
+
+def cache_path(name, key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, '%s-%s.pickle' % (name, key))
+
+
+def load_output(name, key, cache_dir=CACHE_DIR):
+    with open(cache_path(name, key, cache_dir), 'rb') as f:
+        return pickle.load(f)
+
+
+def execute(stage, key, inputs, cache_dir=CACHE_DIR):
+    """Run a stage on the cached outputs of the stages it requires and cache its output.
+
+    inputs: dict of stage name to the key of its output
+    key: the stage's key, or None to key it by the hash of its output
+
+    returns: the key and the seconds taken
+    """
+    start = time.perf_counter()
+    kwargs = {name: load_output(name, input_key, cache_dir) for name, input_key in inputs.items()}
+    kwargs.update(stage.params)
+    output = pickle.dumps(stage.function(**kwargs), protocol=pickle.HIGHEST_PROTOCOL)
+    if key is None:
+        key = hashlib.sha1(output).hexdigest()[:16]
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.pickle')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(output)
+    os.replace(tmp, cache_path(stage.name, key, cache_dir))
+    # outputs of earlier keys are not needed again
+    for path in glob.glob(cache_path(stage.name, '*', cache_dir)):
+        if path != cache_path(stage.name, key, cache_dir):
+            os.remove(path)
+    return key, time.perf_counter() - start
+
+
+def required(stages, targets):
+    """Names of the targets and of every stage they require, in the order of stages."""
+    by_name = {stage.name: stage for stage in stages}
+    needed = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in by_name:
+            raise KeyError('no stage %s' % name)
+        if name not in needed:
+            needed.add(name)
+            pending.extend(by_name[name].requires)
+    return [stage.name for stage in stages if stage.name in needed]
+
+
+def run(stages, targets=None, workers=None, cache_dir=CACHE_DIR, force=(), report=print):
+    """Run the stages needed for targets whose outputs are not cached, independent ones at once.
+
+    stages: list of Stage, each after those it requires
+    targets: names of the stages wanted, by default all
+    force: names of stages to run even if their output is cached
+
+    returns: dict of stage name to Outcome
+    """
+    by_name = {stage.name: stage for stage in stages}
+    pending = required(stages, targets if targets is not None else list(by_name))
+    keys = {}
+    outcomes = {}
+    running = {}
+    # worker processes are started from a fork server, as forking while the threads run could leave a
+    # worker with a lock held by a thread that does not exist in it
+    with concurrent.futures.ProcessPoolExecutor(workers, multiprocessing.get_context('forkserver')) as processes, \
+            concurrent.futures.ThreadPoolExecutor() as threads:
+        while pending or running:
+            for name in [name for name in pending if all(needed in keys for needed in by_name[name].requires)]:
+                pending.remove(name)
+                stage = by_name[name]
+                key = None if stage.always else stage_key(stage, keys)
+                if key is not None and name not in force and os.path.exists(cache_path(name, key, cache_dir)):
+                    keys[name] = key
+                    outcomes[name] = Outcome(key, False, 0.0)
+                    report('%s: up to date' % name)
+                    continue
+                executor = threads if stage.local else processes
+                inputs = {needed: keys[needed] for needed in stage.requires}
+                running[executor.submit(execute, stage, key, inputs, cache_dir)] = name
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                key, seconds = future.result()
+                keys[name] = key
+                outcomes[name] = Outcome(key, True, seconds)
+                report('%s: ran in %.1f s' % (name, seconds))
+    return outcomes
+
+
+def tree_stats(output=config.DATA_OUTPUT):
+    """Sizes and mtimes of the CSV and meta JSON files of the extracted runs under output."""
+    runs = os.path.join(output, 'cmip6', '*', '*')
+    return file_stats([os.path.join(runs, '*.csv'), os.path.join(runs, '*.json')])
+
+
+def catalogue_stage(archive, db, scan):
+    if scan:
+        from .catalogue import open_catalogue
+
+        open_catalogue(archive, db, rescan=True).close()
+    return db
+
+
+def extract_stage(catalogue, experiments, output, workers, run_extraction):
+    if run_extraction:
+        from . import extract
+
+        extract.main(list(experiments) + ['--catalogue', catalogue, '--output', output, '--workers', str(workers)])
+    return tree_stats(output)
+
+
+def branch_points_stage(extract, path, output, corrections):
+    return branch_points.update(path, output, corrections)[0]
+
+
+def cmip6_erf_stage(extract, branch_points, output, baseline):
+    return results.cmip6_erf(branch_points, results.cmip6_feedbacks(), output, baseline=baseline)
+
+
+def cmip5_erf_stage(directory, baseline):
+    return results.cmip5_erf(results.cmip5_feedbacks(), directory, baseline=baseline)
+
+
+def consolidation_stage(cmip6_erf, cmip5_erf):
+    return results.consolidated_results(cmip6_erf, cmip5_erf)
+
+
+def gregory_stage(extract, branch_points, output, baseline):
+    return results.abrupt_4xco2(branch_points, output, baseline=baseline)
+
+
+def figures_stage(consolidation, cmip6_erf, gregory, directory, workers):
+    return figures.render(figures.bundles(consolidation, cmip6_erf, gregory), directory=directory, workers=workers)
+
+
+def build_stages(output=config.DATA_OUTPUT, archive=config.ARCHIVE, catalogue=DEFAULT_DB, run_extraction=False,
+                 experiments=config.EXPERIMENTS, workers=None, plots=figures.PLOTS, baseline='pointwise'):
+    """The stages from the archive to the figures.
+
+    run_extraction: scan the archive and extract from it; otherwise the CSV tree under output is used as it is
+    baseline: what the runs are compared with, one of implied_erf.BASELINES
+    """
+    feedbacks = os.path.join(config.DATA_INPUT, 'cmip56_forcing_feedback_ecs.json')
+    engine = ('ensemble', 'implied_erf', 'derived', 'results')
+    return [
+        Stage('catalogue', catalogue_stage, params={'archive': archive, 'db': catalogue, 'scan': run_extraction},
+              always=True, local=True),
+        Stage('extract', extract_stage, ('catalogue',), params={
+            'experiments': list(experiments), 'output': output, 'workers': workers or os.cpu_count(),
+            'run_extraction': run_extraction,
+        }, always=True, local=True),
+        Stage('branch_points', branch_points_stage, ('extract',), params={
+            'path': os.path.join(output, 'branch_points.json'), 'output': output,
+            'corrections': branch_points.DEFAULT_CORRECTIONS,
+        }, files=(branch_points.DEFAULT_CORRECTIONS,), modules=('branch_points',)),
+        Stage('cmip6_erf', cmip6_erf_stage, ('extract', 'branch_points'), params={
+            'output': output, 'baseline': baseline,
+        }, files=(feedbacks,), modules=engine),
+        Stage('cmip5_erf', cmip5_erf_stage, params={'directory': cmip5.DIRECTORY, 'baseline': baseline},
+              files=(feedbacks, os.path.join(cmip5.DIRECTORY, '*.idlsave')), modules=engine + ('cmip5',)),
+        Stage('consolidation', consolidation_stage, ('cmip6_erf', 'cmip5_erf'), files=(results.RFMIP_ERF,),
+              modules=('results',)),
+        Stage('gregory', gregory_stage, ('extract', 'branch_points'), params={'output': output, 'baseline': baseline},
+              modules=engine),
+        # figures.render skips the figures that are up to date itself
+        Stage('figures', figures_stage, ('consolidation', 'cmip6_erf', 'gregory'), params={
+            'directory': plots, 'workers': workers or os.cpu_count(),
+        }, always=True, local=True),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('targets', nargs='*', help='stages to bring up to date (default: all)')
+    parser.add_argument('--extract', action='store_true',
+                        help='scan the archive and extract from it first (default: use the CSV tree in --output)')
+    parser.add_argument('--archive', default=config.ARCHIVE)
+    parser.add_argument('--catalogue', default=DEFAULT_DB, help='archive catalogue')
+    parser.add_argument('--output', default=config.DATA_OUTPUT)
+    parser.add_argument('--plots', default=figures.PLOTS, help='directory to draw the figures in')
+    parser.add_argument('--baseline', choices=list(implied_erf.BASELINES), default='pointwise',
+                        help='compare the runs with their piControl year for year, or with its fitted drift')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='stages, and runs extracted, at once')
+    parser.add_argument('--cache', default=CACHE_DIR, help='directory of the stage outputs')
+    parser.add_argument('--force', nargs='+', default=[], metavar='STAGE', help='run these stages even if up to date')
+    args = parser.parse_args(argv)
+
+    stages = build_stages(
+        args.output, args.archive, args.catalogue, args.extract, workers=args.workers, plots=args.plots,
+        baseline=args.baseline)
+    start = time.perf_counter()
+    outcomes = run(stages, args.targets or None, args.workers, args.cache, args.force)
+    print('%d of %d stages ran in %.1f s' % (
+        sum(outcome.ran for outcome in outcomes.values()), len(outcomes), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
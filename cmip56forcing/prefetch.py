@@ -0,0 +1,158 @@
+"""Copy the next runs' files from NFS to local scratch while the current ones are reduced.
+
+A background thread works through the units in order, copying each unit's
+files on a small thread pool into ``<model>/<run>/`` of a directory of the
+prefetcher's own under ``scratch``, named after the experiment, so that
+prefetchers of other experiments or other shards sharing a scratch directory
+never touch each other's copies. It stays at
+most ``depth`` units ahead of the consumer and never holds more than
+``budget_mb`` of copies at once (a single unit larger than the budget is still
+copied when nothing else is held). The consumer hands each unit back with
+``release`` once it has been reduced, which deletes the files copied for it,
+and ``close`` removes the prefetcher's directory when it is done.
+
+Time the consumer spends waiting for a unit is I/O that was not hidden behind
+computation; ``report`` gives the fraction of copy time that was. A consumer
+that only releases units when it collects their results must keep doing so
+while it waits for the next one, or the copier can be left waiting for budget
+that is never returned; ``stage`` calls ``idle`` periodically for that.
+"""
+
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Bounded read-ahead of (model, run, filelists) units to local scratch.
+
+    scratch: local directory for the copies, which may be shared with other prefetchers
+    depth: number of copied units allowed to wait for the consumer
+    budget_mb: limit on the size of copies held at once
+    threads: number of files copied in parallel
+    experiment: prefix of the prefetcher's directory under scratch
+    """
+
+    def __init__(self, scratch, depth=2, budget_mb=20000, threads=4, experiment='prefetch'):
+        self.scratch = scratch
+        os.makedirs(scratch, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix=experiment + '-', dir=scratch)
+        self.budget = budget_mb * 2**20
+        self.threads = threads
+        self._ready = queue.Queue(maxsize=depth)
+        self._cond = threading.Condition()
+        self._reserved = 0
+        self._held = {}
+        self._copies = {}
+        self.copy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.budget_seconds = 0.0
+        self.bytes_copied = 0
+        self._error = None
+
+    def _copy_unit(self, pool, model, run, filelists):
+        local_dir = os.path.join(self.directory, model, run)
+        os.makedirs(local_dir, exist_ok=True)
+        local = {}
+        sources = []
+        for var in filelists:
+            local[var] = [os.path.join(local_dir, os.path.basename(file)) for file in filelists[var]]
+            sources.extend(zip(filelists[var], local[var]))
+        self._copies[(model, run)] = [copy for _, copy in sources]
+        list(pool.map(lambda pair: shutil.copy2(*pair), sources))
+        return local
+
+    def _produce(self, units):
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                for model, run, filelists in units:
+                    try:
+                        size = sum(os.path.getsize(file) for var in filelists for file in filelists[var])
+                    except Exception as exc:
+                        self._ready.put(((model, run, filelists), exc))
+                        continue
+                    start = time.perf_counter()
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._reserved == 0 or self._reserved + size <= self.budget)
+                        self._reserved = self._reserved + size
+                        self._held[(model, run)] = size
+                    self.budget_seconds = self.budget_seconds + time.perf_counter() - start
+                    start = time.perf_counter()
+                    try:
+                        local = self._copy_unit(pool, model, run, filelists)
+                    except Exception as exc:
+                        self.release(model, run)
+                        self._ready.put(((model, run, filelists), exc))
+                        continue
+                    self.copy_seconds = self.copy_seconds + time.perf_counter() - start
+                    self.bytes_copied = self.bytes_copied + size
+                    self._ready.put(((model, run, filelists), local))
+        except BaseException as exc:
+            self._error = exc
+        finally:
+            self._ready.put(None)
+
+    def stage(self, units, idle=None, poll=0.5):
+        """Yield ((model, run, filelists), local_filelists) in order as each unit is copied.
+
+        local_filelists is the exception raised instead if a copy failed.
+        idle: called every poll seconds while waiting for the next unit
+        """
+        self._error = None
+        thread = threading.Thread(target=self._produce, args=(list(units),), daemon=True)
+        thread.start()
+        while True:
+            start = time.perf_counter()
+            while True:
+                try:
+                    item = self._ready.get(timeout=poll)
+                    break
+                except queue.Empty:
+                    if idle is not None:
+                        # time spent in idle is not time lost to I/O
+                        idle_start = time.perf_counter()
+                        idle()
+                        start = start + time.perf_counter() - idle_start
+            self.wait_seconds = self.wait_seconds + time.perf_counter() - start
+            if item is None:
+                break
+            yield item
+        thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def release(self, model, run):
+        """Delete the files copied for a unit and return its share of the budget."""
+        for copy in self._copies.pop((model, run), []):
+            if os.path.exists(copy):
+                os.remove(copy)
+        for directory in [os.path.join(self.directory, model, run), os.path.join(self.directory, model)]:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                # not empty, or never made
+                pass
+        with self._cond:
+            self._reserved = self._reserved - self._held.pop((model, run), 0)
+            self._cond.notify_all()
+
+    def close(self):
+        """Remove the prefetcher's directory and any copies left in it."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def report(self):
+        """Bytes and seconds spent copying, waiting for copies and waiting for scratch space, and the overlap."""
+        overlap = 1.0
+        if self.copy_seconds > 0:
+            overlap = max(0.0, 1 - self.wait_seconds / self.copy_seconds)
+        return {
+            'bytes': self.bytes_copied,
+            'copy_seconds': self.copy_seconds,
+            'wait_seconds': self.wait_seconds,
+            'budget_seconds': self.budget_seconds,
+            'overlap': overlap,
+        }
@@ -0,0 +1,74 @@
+"""Area-weighted global means, optionally streamed through memory in time chunks.
+
+``cube.collapsed(['longitude', 'latitude'], MEAN, weights=area_weights(cube))``
+needs the whole field and a weights array of the same shape in memory at once,
+which for high resolution models and long control runs runs to many GB per
+variable. Here the cube's data stays lazy, a single 2-D (latitude, longitude)
+weights array is broadcast against each block of time steps, and only one
+block is realised at a time, so peak memory is set by the chunk size rather
+than the length of the run.
+"""
+
+import numpy as np
+
+from .instrument import stage
+
+
+def chunk_length(cube, chunk_mb):
+    """Number of time steps that fit in chunk_mb megabytes of realised data.
+
+    cube: anything with shape and dtype, such as a cube or a netCDF4 variable
+    """
+    step_bytes = np.prod(cube.shape[1:]) * cube.dtype.itemsize
+    return max(1, int(chunk_mb * 2**20 // step_bytes))
+
+
+def area_weights_from_bounds(lat_bounds, lon_bounds):
+    """Spherical cell areas (up to a constant) from (n, 2) latitude and longitude bounds in degrees.
+
+    The same quantity as iris.analysis.cartography.area_weights.
+    """
+    lat = np.deg2rad(np.asarray(lat_bounds, dtype=np.float64))
+    lon = np.deg2rad(np.asarray(lon_bounds, dtype=np.float64))
+    return np.abs(np.outer(np.sin(lat[:, 1]) - np.sin(lat[:, 0]), lon[:, 1] - lon[:, 0]))
+
+
+def block_mean(block, weights):
+    """Weighted mean over the last two dimensions of a (time, latitude, longitude) block."""
+    # np.ma.average drops masked points from the sum of weights as iris.analysis.MEAN does
+    return np.ma.average(
+        np.ma.masked_invalid(block).reshape(block.shape[0], -1),
+        axis=1,
+        weights=np.broadcast_to(weights.ravel(), (block.shape[0], weights.size)),
+    )
+
+
+def area_weights_2d(cube):
+    """Grid cell area weights for the horizontal grid only, shape (latitude, longitude)."""
+    import iris.analysis.cartography
+
+    return iris.analysis.cartography.area_weights(cube[0])
+
+
+def global_mean(cube, weights=None, chunk_mb=None):
+    """Area-weighted global mean of each time step.
+
+    cube: iris cube with dimensions (time, latitude, longitude), ideally with lazy data
+    weights: 2-D (latitude, longitude) weights; computed from the cube if not given
+    chunk_mb: size of each realised block in megabytes; None realises the whole field at once
+
+    returns: 1-D array with one value per time step
+    """
+    if cube.coord_dims('time') != (0,) or cube.ndim != 3:
+        raise ValueError('expected a (time, latitude, longitude) cube, got %s' % (cube.summary(shorten=True)))
+    if weights is None:
+        weights = area_weights_2d(cube)
+    nt = cube.shape[0]
+    step = nt if chunk_mb is None else chunk_length(cube, chunk_mb)
+    means = np.empty(nt)
+    for start in range(0, nt, step):
+        with stage('read', variable=cube.var_name):
+            block = cube[start:start + step].data
+        with stage('reduce', variable=cube.var_name):
+            means[start:start + step] = block_mean(block, weights)
+    return means
@@ -0,0 +1,96 @@
+"""Ordinary least squares of many series over many windows of years at once.
+
+The fit of y on x over years start to stop (stop exclusive) depends only on the
+sums of x, y, x², y² and xy over those years. These come from cumulative sums
+along the year axis, one subtraction per window, so every window of every series
+is fitted in one closed-form pass rather than one ``scipy.stats.linregress``
+call each. Slopes, intercepts, correlations and the slopes' standard errors are
+those of linregress. Years where x or y is NaN are left out of the windows that
+contain them.
+
+For the Gregory regressions of abrupt-4xCO2, ΔN on ΔT::
+
+    early, late = regression.split_fits(gregory.delta_T, gregory.delta_N, [20])
+    curvature = early.slope / late.slope          # model x split
+
+and ``regression.split_fits(delta_T, delta_N, regression.all_splits(150))``
+scans every split year of every model.
+"""
+
+import collections
+
+import numpy as np
+
+Fit = collections.namedtuple('Fit', ['slope', 'intercept', 'rvalue', 'stderr', 'n'])
+
+
+def _cumulative(a):
+    """Cumulative sums along the last axis, from 0 for none."""
+    return np.concatenate([np.zeros(a.shape[:-1] + (1,)), np.cumsum(a, axis=-1)], axis=-1)
+
+
+def window_fits(x, y, starts, stops):
+    """Fits of y on x over years starts to stops of each series.
+
+    x, y: arrays of (..., year), broadcastable against each other
+    starts, stops: int arrays of the first and one past the last year of each window, broadcastable
+
+    returns: Fit of arrays of (..., starts' and stops' shape); NaN where a window has fewer than 3 years
+    """
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    starts, stops = np.broadcast_arrays(np.asarray(starts), np.asarray(stops))
+    valid = ~(np.isnan(x) | np.isnan(y))
+    # centred on each series' mean, so that the differences of the sums lose no precision
+    with np.errstate(invalid='ignore', divide='ignore'):
+        count = valid.sum(axis=-1, keepdims=True)
+        x0 = np.where(valid, x, 0).sum(axis=-1, keepdims=True) / count
+        y0 = np.where(valid, y, 0).sum(axis=-1, keepdims=True) / count
+    dx = np.where(valid, x - x0, 0)
+    dy = np.where(valid, y - y0, 0)
+
+    def window(values):
+        sums = _cumulative(values)
+        return sums[..., stops.ravel()].reshape(sums.shape[:-1] + stops.shape) - \
+            sums[..., starts.ravel()].reshape(sums.shape[:-1] + starts.shape)
+
+    n = window(valid.astype(float))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = window(dx) / n
+        mean_y = window(dy) / n
+        ssxm = window(dx * dx) / n - mean_x ** 2
+        ssym = window(dy * dy) / n - mean_y ** 2
+        ssxym = window(dx * dy) / n - mean_x * mean_y
+        slope = ssxym / ssxm
+        rvalue = np.clip(ssxym / np.sqrt(ssxm * ssym), -1, 1)
+        stderr = np.sqrt((1 - rvalue ** 2) * ssym / ssxm / (n - 2))
+    intercept = (mean_y + y0.reshape(y0.shape[:-1] + (1,) * starts.ndim)) - \
+        slope * (mean_x + x0.reshape(x0.shape[:-1] + (1,) * starts.ndim))
+    few = n < 3
+    return Fit(*(np.where(few, np.nan, field) for field in (slope, intercept, rvalue, stderr)), n.astype(int))
+
+
+def sliding(length, width):
+    """starts and stops of every window of width years in length years."""
+    starts = np.arange(length - width + 1)
+    return starts, starts + width
+
+
+def all_windows(length, minimum=3):
+    """starts and stops of every window of at least minimum years in length years."""
+    starts, stops = np.triu_indices(length + 1, minimum)
+    return starts, stops
+
+
+def all_splits(length, minimum=3):
+    """Every year at which length years split into two parts of at least minimum years."""
+    return np.arange(minimum, length - minimum + 1)
+
+
+def split_fits(x, y, splits):
+    """Fits of y on x over the years before and from each split year.
+
+    returns: two Fit of arrays of (..., split)
+    """
+    splits = np.asarray(splits)
+    length = np.shape(x)[-1]
+    return window_fits(x, y, np.zeros_like(splits), splits), window_fits(x, y, splits, np.full_like(splits, length))
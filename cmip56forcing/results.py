@@ -0,0 +1,243 @@
+"""Implied ERF of the CMIP6 and CMIP5 ensembles and the multi-model arrays the figures are drawn from.
+
+These are the calculations of ``notebooks/produce_results.ipynb`` as
+functions of their inputs, shared by the notebook and the stages of
+``pipeline``::
+
+    erf = results.cmip6_erf(points, results.cmip6_feedbacks())
+    multi = results.consolidate(erf, results.CONSOLIDATED['CMIP6'])
+    multi['hist-GHG'].delta_F  # year x model of the ensemble mean of each model
+"""
+
+import collections
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import branch_points, cmip5, config, derived, ensemble, implied_erf, statistics
+
+CMIP6_EXPERIMENTS = [
+    'historical', 'hist-GHG', 'hist-nat', 'hist-aer',
+    'historical-cmip5', 'hist-GHG-cmip5', 'hist-nat-cmip5', 'hist-aer-cmip5',
+]
+CMIP6_DERIVED = ['hist-otheranthro', 'hist-otheranthro-cmip5']
+CMIP5_DERIVED = ['historicalOther']
+
+# experiments of the multi-model figures and tables
+CONSOLIDATED = {
+    'CMIP6': ['historical', 'hist-nat', 'hist-GHG', 'hist-aer', 'hist-otheranthro'],
+    'CMIP5': ['historical', 'historicalNat', 'historicalGHG', 'historicalOther'],
+}
+
+# models with RFMIP fixed-SST ERF, by the slope of their implied against their fixed-SST ERF
+RFMIP_MODELS = [
+    'GISS-E2-1-G', 'MIROC6', 'CNRM-CM6-1', 'CanESM5', 'HadGEM3-GC31-LL', 'IPSL-CM6A-LR', 'GFDL-CM4', 'NorESM2-LM',
+]
+# not GFDL, which didn't do all the DAMIPs
+RFMIP7_MODELS = [model for model in RFMIP_MODELS if model != 'GFDL-CM4']
+RFMIP_ERF = os.path.join(config.DATA_INPUT, 'RFMIP-ERF-tier2.csv')
+# column suffix of each experiment's forcing in RFMIP_ERF
+RFMIP_COLUMNS = {'historical': 'TOT', 'hist-GHG': 'GHG', 'hist-nat': 'NAT', 'hist-aer': 'AER'}
+
+# the CanESM5 runs of every experiment, with CMIP6 and with CMIP5 forcing
+CANESM5_RUNS = ['r%di1p1f1' % n for n in range(1, 6)]
+CANESM5_EXPERIMENTS = ['historical', 'hist-nat', 'hist-GHG', 'hist-otheranthro']
+
+# run of abrupt-4xCO2 that Mark Zelinka's feedbacks are from, where it is not the piControl run
+# (EC-Earth3: no, I don't know why either)
+FEEDBACK_RUNS = {
+    'EC-Earth3': 'r8i1p1f1',
+    'GISS-E2-1-G': 'r1i1p1f1',
+    'HadGEM3-GC31-LL': 'r1i1p1f3',
+    'HadGEM3-GC31-MM': 'r1i1p1f3',
+}
+
+# years of abrupt-4xCO2 in the Gregory regressions
+ABRUPT_4XCO2_LENGTH = 150
+
+# ensemble means of each model of an experiment, arrays of year x model
+MultiModel = collections.namedtuple('MultiModel', ['models', 'delta_N', 'delta_T', 'delta_F'])
+# ΔN and ΔT of the abrupt-4xCO2 run of each model, arrays of model x year
+Gregory = collections.namedtuple('Gregory', ['models', 'delta_N', 'delta_T'])
+
+
+def cmip6_feedbacks(feedbacks=None):
+    """dict of CMIP6 model to λ, for the models with a piControl run.
+
+    feedbacks: Mark Zelinka's results, by default from config.load_feedbacks
+    """
+    if feedbacks is None:
+        feedbacks = config.load_feedbacks()
+    return {
+        model: feedbacks['CMIP6'][model][FEEDBACK_RUNS.get(model, branch_points.PICONTROL_RUNS[model])]['NET']
+        for model in feedbacks['CMIP6'] if model in branch_points.PICONTROL_RUNS
+    }
+
+
+def cmip5_feedbacks(feedbacks=None):
+    """dict of CMIP5 model to λ."""
+    if feedbacks is None:
+        feedbacks = config.load_feedbacks()
+    return {model: feedbacks['CMIP5'][model]['r1i1p1']['NET'] for model in feedbacks['CMIP5']}
+
+
+def cmip6_erf(points, feedbacks, output=config.DATA_OUTPUT, experiments=CMIP6_EXPERIMENTS, derive=CMIP6_DERIVED,
+              baseline='pointwise'):
+    """ExperimentSet of the implied ERF of every run with a branch point, and of the derived experiments.
+
+    points: branch points, as in branch_points.json
+    feedbacks: dict of model to λ
+    baseline: one of implied_erf.BASELINES
+    """
+    # piControls are much longer so are kept apart
+    controls = ensemble.load(['piControl', 'piControl-cmip5'], output=output)
+    runs = ensemble.load(experiments, output=output, points=points)
+    erf = derived.ExperimentSet.from_ensemble(
+        runs, implied_erf.ensemble_erf(runs, controls, points, feedbacks, baseline))
+    for experiment in derive:
+        erf[experiment]
+    return erf
+
+
+def cmip5_erf(feedbacks, directory=cmip5.DIRECTORY, cache_dir=cmip5.CACHE_DIR, derive=CMIP5_DERIVED,
+              baseline='pointwise'):
+    """ExperimentSet of the implied ERF of the CMIP5 runs of Forster et al. (2013) with a feedback parameter.
+
+    baseline: one of implied_erf.BASELINES
+    """
+    runs, controls = cmip5.load(directory=directory, models=feedbacks, cache_dir=cache_dir)
+    erf = derived.ExperimentSet.from_ensemble(runs, cmip5.ensemble_erf(runs, controls, feedbacks, baseline))
+    for experiment in derive:
+        erf[experiment]
+    return erf
+
+
+def abrupt_4xco2(points, output=config.DATA_OUTPUT, length=ABRUPT_4XCO2_LENGTH, baseline='pointwise'):
+    """Gregory of the abrupt-4xCO2 run of each model with a branch point, against the piControl it branched from.
+
+    The GISS-E2-1-G run is compared with its own variant's piControl (branch_points.EXTRA_PAIRS).
+    baseline: one of implied_erf.BASELINES
+    """
+    controls = {
+        (model, run): control_run for experiment, model, run, control_run in branch_points.EXTRA_PAIRS
+        if experiment == 'abrupt-4xCO2'
+    }
+    models = []
+    delta_N = []
+    delta_T = []
+    for model, runs in points['abrupt-4xCO2'].items():
+        for run, start in runs.items():
+            control_run = controls.get((model, run), branch_points.PICONTROL_RUNS[model])
+            directory = os.path.join(output, 'cmip6', model)
+            _, values = ensemble.read_run(os.path.join(directory, run, 'abrupt-4xCO2.csv'), config.VARIABLES)
+            _, control = ensemble.read_run(os.path.join(directory, control_run, 'piControl.csv'), config.VARIABLES)
+            erf = implied_erf.implied_erf(values, control, np.array(start), 0.0, length, baseline=baseline)
+            models.append(model)
+            delta_N.append(erf.delta_N)
+            delta_T.append(erf.delta_T)
+    return Gregory(models, np.array(delta_N), np.array(delta_T))
+
+
+def consolidate(erf, experiments, models=None):
+    """dict of experiment to the MultiModel of its ensemble means.
+
+    models: models of the columns, by default those with runs in each experiment; NaN for those without
+    """
+    consolidated = {}
+    for experiment in experiments:
+        runs = erf.runs(experiment)
+        if models is None:
+            columns = [model for m, model in enumerate(erf.models) if (runs[m] != '').any()]
+        else:
+            columns = list(models)
+        fields = []
+        for values in erf[experiment]:
+            means = implied_erf.ensemble_mean(values, runs)
+            table = np.full((means.shape[-1], len(columns)), np.nan)
+            for i, model in enumerate(columns):
+                if model in erf.models:
+                    table[:, i] = means[erf.models.index(model)]
+            fields.append(table)
+        consolidated[experiment] = MultiModel(columns, *fields)
+    return consolidated
+
+
+def model_count(table):
+    """Number of columns of a year x model array with any value."""
+    return int((~np.isnan(table)).any(axis=0).sum())
+
+
+def model_statistics(erf, experiment, field='delta_F', weights=None):
+    """dict of model to the statistics.Accumulator over its members of a field of the implied ERF of an experiment.
+
+    weights: dict of model to dict of run to weight, of the models and runs to include; by default every
+        run of every model, weighted equally
+    """
+    runs = erf.runs(experiment)
+    values = getattr(erf[experiment], field)
+    accumulators = {}
+    for m, model in enumerate(erf.models):
+        if weights is not None and model not in weights:
+            continue
+        accumulator = statistics.Accumulator()
+        for k, run in enumerate(runs[m]):
+            if run and (weights is None or run in weights[model]):
+                accumulator.add(values[m, k], 1.0 if weights is None else weights[model][run])
+        if accumulator.count.any():
+            accumulators[model] = accumulator
+    return accumulators
+
+
+def multi_model_statistics(per_model, models=None, years=None):
+    """statistics.Accumulator over models of the ensemble mean of each, each model weighted equally.
+
+    per_model: dict of model to Accumulator over its members, as from model_statistics
+    models: models to include, by default all of per_model; models not in per_model are left out
+    years: slice of years to average each model's ensemble mean over first, by default none
+    """
+    total = statistics.Accumulator()
+    for model in per_model if models is None else models:
+        if model in per_model:
+            mean = per_model[model].mean
+            total.add(mean if years is None else statistics.Accumulator.of(mean[years]).mean)
+    return total
+
+
+def rfmip_erf(path=RFMIP_ERF, columns=RFMIP_COLUMNS, models=RFMIP7_MODELS, length=branch_points.LENGTH):
+    """dict of experiment to year x model array of the RFMIP fixed-SST ERF of models.
+
+    columns: dict of experiment to the suffix of its columns in the CSV at path
+    """
+    frame = pd.read_csv(path)
+    return {
+        experiment: np.stack(
+            [frame['%s %s' % (model, suffix)].to_numpy()[:length] for model in models], axis=1)
+        for experiment, suffix in columns.items()
+    }
+
+
+def members(erf, experiment, model, runs):
+    """ImpliedERF of arrays of run x year of some runs of one model."""
+    names = erf.runs(experiment)[erf.models.index(model)]
+    slots = [list(names).index(run) for run in runs]
+    return implied_erf.ImpliedERF(*(values[erf.models.index(model), slots] for values in erf[experiment]))
+
+
+def consolidated_results(erf6, erf5, rfmip_path=RFMIP_ERF):
+    """Everything the multi-model figures and tables are drawn from, as a dict.
+
+    'CMIP6', 'CMIP6-RFMIP7' and 'CMIP5': dicts of experiment to MultiModel
+    'RFMIP': dict of experiment to year x model RFMIP ERF of RFMIP7_MODELS
+    'CanESM5': dict of experiment, with and without -cmip5, to ImpliedERF of run x year of CANESM5_RUNS
+    """
+    return {
+        'CMIP6': consolidate(erf6, CONSOLIDATED['CMIP6']),
+        'CMIP6-RFMIP7': consolidate(erf6, CONSOLIDATED['CMIP6'], RFMIP7_MODELS),
+        'CMIP5': consolidate(erf5, CONSOLIDATED['CMIP5']),
+        'RFMIP': rfmip_erf(rfmip_path),
+        'CanESM5': {
+            name: members(erf6, name, 'CanESM5', CANESM5_RUNS)
+            for experiment in CANESM5_EXPERIMENTS for name in [experiment, experiment + '-cmip5']
+        },
+    }
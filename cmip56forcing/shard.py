@@ -0,0 +1,75 @@
+"""Deterministic split of the extraction units between independent shards.
+
+A batch too large for one machine is run as N shards, each with
+``--shard i/N`` (i from 0 to N - 1), on as many nodes or side by side on one.
+Every shard plans the same units from the same catalogue and assigns them the
+same way, so no coordination is needed: the units of all the experiments asked
+for are taken largest first, by their catalogued input bytes, and each given
+to the shard with the fewest bytes so far (ties going to the lower shard and
+the unit with the lower key). Each shard records its units in a partial
+manifest (see ``manifest``), merged into the main one when all have finished::
+
+    for i in 0 1 2 3; do python -m cmip56forcing.extract historical --shard $i/4 & done; wait
+    python -m cmip56forcing.manifest merge
+"""
+
+import argparse
+import heapq
+
+
+def parse(spec):
+    """(index, count) from 'i/N'; for use as an argparse type."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected a shard as i/N, got %r' % spec) from None
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError('shard %r is not one of 0/%d to %d/%d' % (spec, count, count - 1, count))
+    return index, count
+
+
+def unit_bytes(filelists, catalogue):
+    """Catalogued size of a unit's input files."""
+    paths = [file for var in filelists for file in filelists[var]]
+    return sum(size for size, _ in catalogue.stat(paths).values())
+
+
+def assign(keys, sizes, count):
+    """Shard of each unit, balancing the sizes.
+
+    keys: distinct sortable keys of the units, to break ties
+    sizes: estimated cost of each unit
+
+    returns: list of the shard index of each unit
+    """
+    shards = [None] * len(keys)
+    loads = [(0, shard) for shard in range(count)]
+    for unit in sorted(range(len(keys)), key=lambda unit: (-sizes[unit], keys[unit])):
+        load, shard = heapq.heappop(loads)
+        shards[unit] = shard
+        heapq.heappush(loads, (load + sizes[unit], shard))
+    return shards
+
+
+def select(units, catalogue, index, count):
+    """The units of shard index of count.
+
+    units: dict of experiment to a list of (model, run, filelists)
+
+    returns: dict of experiment to the shard's (model, run, filelists), in their original order,
+    and the shard's and the total number of input bytes
+    """
+    keys = []
+    sizes = []
+    for experiment in units:
+        for model, run, filelists in units[experiment]:
+            keys.append((model, experiment, run))
+            sizes.append(unit_bytes(filelists, catalogue))
+    shards = assign(keys, sizes, count)
+    chosen = {}
+    position = 0
+    for experiment in units:
+        chosen[experiment] = [unit for unit, shard in zip(units[experiment], shards[position:]) if shard == index]
+        position = position + len(units[experiment])
+    nbytes = sum(size for size, shard in zip(sizes, shards) if shard == index)
+    return chosen, nbytes, sum(sizes)
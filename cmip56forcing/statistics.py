@@ -0,0 +1,96 @@
+"""Ensemble means and variances that are updated as members and models arrive.
+
+An Accumulator holds, element by element, the total weight of the values seen,
+their weighted mean and the weighted sum of squared deviations from it. A value
+is added with Welford's update, a batch by its own mean and deviations, and two
+accumulators, such as those of parallel workers, are merged with the pairwise
+update of Chan et al., so no array of all the values is kept. NaN values are
+skipped, so each element counts only the members that have it::
+
+    ensemble = statistics.Accumulator()
+    for series, weight in members:
+        ensemble.add(series, weight)
+    ensemble.mean, ensemble.std(), ensemble.count
+
+Weights are frequency weights: a member of weight 2 counts as two members of
+weight 1, and ``variance(ddof=1)`` divides by the total weight less one.
+"""
+
+import numpy as np
+
+
+class Accumulator:
+    """Weighted count, mean and sum of squared deviations of the arrays added, element by element.
+
+    count: total weight of the values of each element, 0 where there are none
+    mean: weighted mean of each element, NaN where there are no values
+    m2: weighted sum of the squared deviations of each element from its mean
+    """
+
+    def __init__(self, count=0.0, mean=np.nan, m2=0.0):
+        self.count = np.asarray(count, dtype=float)
+        self.mean = np.asarray(mean, dtype=float)
+        self.m2 = np.asarray(m2, dtype=float)
+
+    @classmethod
+    def of(cls, values, weights=None, axis=0):
+        """Accumulator of a batch of arrays along axis of values.
+
+        weights: weight of each array of the batch, by default 1
+        """
+        values = np.moveaxis(np.asarray(values, dtype=float), axis, 0)
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float)
+        weights = np.where(np.isnan(values), 0, weights.reshape((-1,) + (1,) * (values.ndim - 1)))
+        values = np.where(weights > 0, values, 0)
+        count = weights.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, (weights * values).sum(axis=0) / count, np.nan)
+        m2 = (weights * (values - np.where(count > 0, mean, 0)) ** 2).sum(axis=0)
+        return cls(count, mean, m2)
+
+    def add(self, values, weight=1.0):
+        """Add one array of values, of weight weight; NaN values are skipped."""
+        values = np.asarray(values, dtype=float)
+        weight = np.where(np.isnan(values), 0, weight)
+        count = self.count + weight
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # the first value of an element is its mean
+            previous = np.where(self.count > 0, self.mean, values)
+            delta = values - previous
+            mean = np.where(weight > 0, previous + weight * delta / count, self.mean)
+        self.m2 = self.m2 + np.where(weight > 0, weight * delta * (values - mean), 0)
+        self.count, self.mean = count, mean
+        return self
+
+    def update(self, values, weights=None, axis=0):
+        """Add a batch of arrays along axis of values, as Accumulator.of."""
+        return self.merge(Accumulator.of(values, weights, axis))
+
+    def merge(self, other):
+        """Add the values of another Accumulator."""
+        count = self.count + other.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            mean = np.where(other.count == 0, self.mean, np.where(
+                self.count == 0, other.mean, self.mean + delta * other.count / count))
+            m2 = np.where((self.count == 0) | (other.count == 0), self.m2 + other.m2,
+                          self.m2 + other.m2 + delta ** 2 * self.count * other.count / count)
+        self.count, self.mean, self.m2 = count, mean, m2
+        return self
+
+    def variance(self, ddof=0):
+        """Weighted variance of each element, NaN where the count is not more than ddof."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof=0):
+        """Weighted standard deviation of each element, NaN where the count is not more than ddof."""
+        return np.sqrt(self.variance(ddof))
+
+
+def combine(accumulators):
+    """One Accumulator of the values of all of accumulators."""
+    total = Accumulator()
+    for accumulator in accumulators:
+        total.merge(accumulator)
+    return total
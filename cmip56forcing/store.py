@@ -0,0 +1,217 @@
+"""Consolidated Parquet store of the extracted global annual means.
+
+The per-run CSV layout is thousands of small text files on NFS, each read
+back with its own ``pd.read_csv``. The store holds the same data in two
+tables, partitioned by experiment::
+
+    <store>/annual/experiment=<experiment>/part-*.parquet    model, run, year, time, rsdt, rsut, rlut, tas
+    <store>/meta/experiment=<experiment>/part-*.parquet      model, run, attributes (JSON)
+
+Years are integers, the variables float64 and ``time`` the date string the
+CSV files have, where the run was extracted with dates. Each extracted run is appended as a part file of its own, so
+worker processes never write to the same file; ``compact`` merges an
+experiment's parts into one. Where a run has been written more than once the
+latest part wins. The CSV layout can be written from the store with
+``export_csv``, and an existing CSV tree read into it with ``import_csv``.
+
+pyarrow is needed for the store only. Example::
+
+    python -m cmip56forcing.store import
+    python -m cmip56forcing.store export --output /tmp/csv
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+import uuid
+
+import pandas as pd
+
+from . import config
+
+STORE_DIR = 'cmip6_store'
+DEFAULT_PATH = os.path.join(config.DATA_OUTPUT, STORE_DIR)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('the consolidated store needs pyarrow (conda install pyarrow)') from None
+    return pyarrow
+
+
+class _Table:
+    """One table of the store, partitioned by experiment."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def partition(self, experiment):
+        return os.path.join(self.path, 'experiment=%s' % experiment)
+
+    def experiments(self):
+        return sorted(
+            os.path.basename(path).split('=', 1)[1] for path in glob.glob(os.path.join(self.path, 'experiment=*'))
+        )
+
+    def _parts(self, experiment):
+        # part-<time in ns>-<suffix>.parquet, oldest first
+        return sorted(
+            glob.glob(os.path.join(self.partition(experiment), 'part-*.parquet')),
+            key=lambda path: (int(os.path.basename(path).split('-')[1]), os.path.basename(path)),
+        )
+
+    def append(self, experiment, frame, written=None):
+        pyarrow = _pyarrow()
+        directory = self.partition(experiment)
+        os.makedirs(directory, exist_ok=True)
+        name = 'part-%d-%s.parquet' % (written or time.time_ns(), uuid.uuid4().hex)
+        tmp = os.path.join(directory, '.%s.tmp' % name)
+        pyarrow.parquet.write_table(pyarrow.Table.from_pandas(frame, preserve_index=False), tmp)
+        # parts only appear once complete
+        os.replace(tmp, os.path.join(directory, name))
+
+    def read(self, experiment, models=None, columns=None):
+        """All rows of an experiment, keeping only the latest part's rows for each (model, run)."""
+        pyarrow = _pyarrow()
+        frames = []
+        filters = None if models is None else [('model', 'in', list(models))]
+        for order, path in enumerate(self._parts(experiment)):
+            frame = pyarrow.parquet.read_table(path, columns=columns, filters=filters).to_pandas()
+            frame['_order'] = order
+            frames.append(frame)
+        if len(frames) == 0:
+            return pd.DataFrame(columns=columns)
+        frame = pd.concat(frames, ignore_index=True)
+        latest = frame.groupby(['model', 'run'])['_order'].transform('max')
+        return frame[frame['_order'] == latest].drop(columns='_order').reset_index(drop=True)
+
+    def compact(self, experiment):
+        """Merge an experiment's parts into one, dropping superseded rows."""
+        parts = self._parts(experiment)
+        if len(parts) < 2:
+            return
+        frame = self.read(experiment)
+        # named after the newest part merged so that parts written meanwhile still supersede it
+        newest = int(os.path.basename(parts[-1]).split('-')[1])
+        self.append(experiment, frame, written=newest)
+        for path in parts:
+            os.remove(path)
+
+
+class Store:
+    """The annual means and attributes tables under path."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.annual = _Table(os.path.join(path, 'annual'))
+        self.meta = _Table(os.path.join(path, 'meta'))
+
+    def append(self, experiment, model, run, frame, attributes=None):
+        """Add one run.
+
+        frame: DataFrame with time, year and variable columns
+        attributes: the run's attributes, as a JSON string, if any are kept for the experiment
+        """
+        frame = frame.copy()
+        frame.insert(0, 'run', run)
+        frame.insert(0, 'model', model)
+        frame['year'] = frame['year'].astype('int32')
+        if 'time' in frame:
+            frame['time'] = frame['time'].astype(str)
+        written = time.time_ns()
+        self.annual.append(experiment, frame, written)
+        if attributes is not None:
+            self.meta.append(experiment, pd.DataFrame({'model': [model], 'run': [run], 'attributes': [attributes]}), written)
+
+    def read(self, experiment, models=None, columns=None):
+        """Annual means of an experiment as one DataFrame, optionally for some models or columns only."""
+        if columns is not None:
+            columns = ['model', 'run'] + [column for column in columns if column not in ['model', 'run']]
+        return self.annual.read(experiment, models, columns)
+
+    def attributes(self, experiment, models=None):
+        """dict of (model, run) to the attributes recorded for an experiment."""
+        frame = self.meta.read(experiment, models)
+        return {(row.model, row.run): json.loads(row.attributes) for row in frame.itertuples()}
+
+    def experiments(self):
+        return self.annual.experiments()
+
+    def compact(self, experiment=None):
+        for name in [experiment] if experiment is not None else self.experiments():
+            self.annual.compact(name)
+            self.meta.compact(name)
+
+    def export_csv(self, output=config.DATA_OUTPUT, experiments=None):
+        """Write the per-run CSV and meta JSON layout, cmip6/<model>/<run>/<experiment>.csv under output."""
+        count = 0
+        for experiment in experiments or self.experiments():
+            frame = self.read(experiment)
+            for (model, run), rows in frame.groupby(['model', 'run'], sort=False):
+                directory = os.path.join(output, 'cmip6', model, run)
+                os.makedirs(directory, exist_ok=True)
+                # runs extracted with the integer year axis have no dates
+                axis = 'year' if 'time' not in rows or rows['time'].isna().all() else 'time'
+                dropped = ['model', 'run'] + [column for column in ['time', 'year'] if column != axis and column in rows]
+                rows.drop(columns=dropped).dropna(axis=1, how='all').to_csv(
+                    os.path.join(directory, '%s.csv' % experiment), index=False
+                )
+                count = count + 1
+            for row in self.meta.read(experiment).itertuples():
+                with open(os.path.join(output, 'cmip6', row.model, row.run, 'meta_%s.json' % experiment), 'w') as f:
+                    f.write(row.attributes)
+        return count
+
+    def import_csv(self, output=config.DATA_OUTPUT):
+        """Add every run of an existing CSV tree, one part per experiment."""
+        count = 0
+        for experiment in config.EXPERIMENTS:
+            frames = []
+            metas = []
+            for path in sorted(glob.glob(os.path.join(output, 'cmip6', '*', '*', '%s.csv' % experiment))):
+                run_dir = os.path.dirname(path)
+                model, run = os.path.basename(os.path.dirname(run_dir)), os.path.basename(run_dir)
+                frame = pd.read_csv(path, dtype={'time': str})
+                frame.insert(0, 'run', run)
+                frame.insert(0, 'model', model)
+                if 'year' not in frame:
+                    frame.insert(3, 'year', frame['time'].str.split('-').str[0].astype('int32'))
+                frames.append(frame)
+                meta = os.path.join(run_dir, 'meta_%s.json' % experiment)
+                if os.path.exists(meta):
+                    with open(meta) as f:
+                        metas.append({'model': model, 'run': run, 'attributes': f.read()})
+            if frames:
+                self.annual.append(experiment, pd.concat(frames, ignore_index=True))
+                count = count + len(frames)
+            if metas:
+                self.meta.append(experiment, pd.DataFrame(metas))
+        return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['import', 'export', 'compact'])
+    parser.add_argument('--store', default=DEFAULT_PATH)
+    parser.add_argument('--output', default=config.DATA_OUTPUT, help='top of the CSV tree to import or export')
+    parser.add_argument('--experiments', nargs='+')
+    args = parser.parse_args(argv)
+
+    store = Store(args.store)
+    if args.command == 'import':
+        print('imported %d runs' % store.import_csv(args.output))
+        store.compact()
+    elif args.command == 'export':
+        print('exported %d runs' % store.export_csv(args.output, args.experiments))
+    else:
+        for experiment in args.experiments or store.experiments():
+            store.compact(experiment)
+
+
+if __name__ == '__main__':
+    main()
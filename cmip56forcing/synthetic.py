@@ -0,0 +1,214 @@
+"""Write a synthetic archive shaped like the CMIP6 DRS for benchmarks and tests.
+
+Each model is written as <root>/<model>/<experiment>/<run>/Amon/<variable>/<version>/
+files of monthly (time, lat, lon) fields, split in time like the real archive.
+The models are named after real ones so that the fixes declared for those models
+in ``fixes.FIXES`` are exercised, and carry the quirks those fixes exist for:
+
+- calendars: 360_day, noleap and standard (gregorian)
+- no bounds on the time, latitude or longitude coordinates
+- time points and bounds stored as integers in some files and floats in others
+- latitude and longitude bounds that differ slightly between files
+- a latitude long_name that differs between files
+- global attributes (creation_date, tracking_id) that differ between every file
+
+The values are noise around a typical global mean, so the extracted means are
+not meaningful, only the time taken and memory used. Example::
+
+    python -m cmip56forcing.synthetic /tmp/archive --years 165 --control-years 500 --years-per-file 50
+"""
+
+import argparse
+import os
+import uuid
+import zlib
+
+import cftime
+import netCDF4
+import numpy as np
+
+from . import config
+
+STANDARD_NAMES = {
+    'rsdt': 'toa_incoming_shortwave_flux',
+    'rsut': 'toa_outgoing_shortwave_flux',
+    'rlut': 'toa_outgoing_longwave_flux',
+    'tas': 'air_temperature',
+}
+UNITS = {'rsdt': 'W m-2', 'rsut': 'W m-2', 'rlut': 'W m-2', 'tas': 'K'}
+TYPICAL = {'rsdt': 340.0, 'rsut': 100.0, 'rlut': 240.0, 'tas': 287.0}
+VERSION = 'v20190429'
+START = {'historical': 1850, 'piControl': 1850}
+
+
+class ModelSpec:
+    """A synthetic model.
+
+    calendar: CF calendar of the time axis
+    grid: (nlat, nlon)
+    quirks: dict of experiment to the quirks of that experiment's files; one or more of
+    'no-bounds', 'integer-time', 'grid-bounds-differ' and 'latitude-long-name'
+    """
+
+    def __init__(self, name, calendar, grid, member='r1i1p1f1', quirks=None):
+        self.name = name
+        self.calendar = calendar
+        self.grid = grid
+        self.member = member
+        self.quirks = quirks or {}
+
+    def quirks_for(self, experiment):
+        return set(self.quirks.get(experiment, ()))
+
+
+SPECS = [
+    ModelSpec('CanESM5', 'noleap', (64, 128)),
+    ModelSpec('UKESM1-0-LL', '360_day', (144, 192), member='r1i1p1f2'),
+    ModelSpec('GISS-E2-1-G', 'standard', (90, 144)),
+    ModelSpec('MIROC6', 'standard', (128, 256), quirks={'historical': ['no-bounds'], 'piControl': ['no-bounds']}),
+    ModelSpec('KACE-1-0-G', '360_day', (144, 192), quirks={'piControl': ['integer-time']}),
+    ModelSpec('NorESM2-LM', 'noleap', (96, 144), quirks={'piControl': ['grid-bounds-differ']}),
+    ModelSpec('AWI-CM-1-1-MR', 'standard', (192, 384), quirks={'historical': ['latitude-long-name']}),
+]
+
+
+def month_edges(calendar, start, years):
+    """Month boundaries from January of start, in days since start."""
+    dates = [cftime.datetime(start + month // 12, month % 12 + 1, 1, calendar=calendar) for month in range(12 * years + 1)]
+    return cftime.date2num(dates, 'days since %04d-01-01' % start, calendar=calendar)
+
+
+def write_file(path, var, spec, experiment, member, edges, part, quirks, seed):
+    """Write the months between edges of one variable to path, as the part'th file of the run."""
+    nlat, nlon = spec.grid
+    points = 0.5 * (edges[:-1] + edges[1:])
+    bounds = np.stack([edges[:-1], edges[1:]], 1)
+    time_type = 'f8'
+    if 'integer-time' in quirks and part % 2 == 1:
+        time_type = 'i4'
+        points = np.floor(points)
+    lat_edges = np.linspace(-90, 90, nlat + 1)
+    lon_edges = np.arange(nlon + 1) * 360 / nlon
+    lat_points = 0.5 * (lat_edges[1:] + lat_edges[:-1])
+    lon_points = 0.5 * (lon_edges[1:] + lon_edges[:-1])
+    if 'grid-bounds-differ' in quirks and part % 2 == 1:
+        lat_edges = lat_edges + np.r_[0, np.full(nlat - 1, 1e-3), 0]
+        lon_edges = lon_edges + 1e-3
+    with_bounds = 'no-bounds' not in quirks
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with netCDF4.Dataset(path, 'w') as ds:
+        ds.createDimension('time', None)
+        ds.createDimension('lat', nlat)
+        ds.createDimension('lon', nlon)
+        ds.createDimension('bnds', 2)
+        time = ds.createVariable('time', time_type, ('time',))
+        time.units = 'days since %04d-01-01' % START[experiment]
+        time.calendar = spec.calendar
+        time.standard_name = 'time'
+        time.axis = 'T'
+        time[:] = points
+        lat = ds.createVariable('lat', 'f8', ('lat',))
+        lat.units = 'degrees_north'
+        lat.standard_name = 'latitude'
+        lat.long_name = 'latitude' if 'latitude-long-name' not in quirks or part % 2 == 0 else 'Latitude'
+        lat[:] = lat_points
+        lon = ds.createVariable('lon', 'f8', ('lon',))
+        lon.units = 'degrees_east'
+        lon.standard_name = 'longitude'
+        lon[:] = lon_points
+        if with_bounds:
+            time.bounds = 'time_bnds'
+            ds.createVariable('time_bnds', time_type, ('time', 'bnds'))[:] = bounds
+            lat.bounds = 'lat_bnds'
+            ds.createVariable('lat_bnds', 'f8', ('lat', 'bnds'))[:] = np.stack([lat_edges[:-1], lat_edges[1:]], 1)
+            lon.bounds = 'lon_bnds'
+            ds.createVariable('lon_bnds', 'f8', ('lon', 'bnds'))[:] = np.stack([lon_edges[:-1], lon_edges[1:]], 1)
+        data = ds.createVariable(var, 'f4', ('time', 'lat', 'lon'))
+        data.units = UNITS[var]
+        data.standard_name = STANDARD_NAMES[var]
+        rng = np.random.default_rng(seed)
+        # a year at a time, to keep memory flat for large grids
+        for month in range(0, len(points), 12):
+            months = min(12, len(points) - month)
+            data[month:month + months] = TYPICAL[var] + rng.standard_normal((months, nlat, nlon), dtype=np.float32)
+
+        ds.source_id = spec.name
+        ds.experiment_id = experiment
+        ds.variant_label = member
+        ds.parent_experiment_id = 'piControl' if experiment != 'piControl' else 'piControl-spinup'
+        ds.branch_time_in_parent = 0.0
+        ds.branch_time_in_child = 0.0
+        ds.parent_time_units = 'days since %04d-01-01' % START['piControl']
+        ds.creation_date = '2019-04-29T00:00:%02dZ' % (part % 60)
+        ds.tracking_id = 'hdl:21.14100/%s' % uuid.UUID(int=seed)
+
+
+def write_run(root, spec, experiment, member, years, years_per_file, variables=config.VARIABLES):
+    """Write all files of one run; returns their paths."""
+    start = START[experiment]
+    quirks = spec.quirks_for(experiment)
+    edges = month_edges(spec.calendar, start, years)
+    paths = []
+    for var in variables:
+        for part, first in enumerate(range(0, years, years_per_file)):
+            last = min(years, first + years_per_file)
+            name = '%s_Amon_%s_%s_%s_gn_%04d01-%04d12.nc' % (var, spec.name, experiment, member, start + first, start + last - 1)
+            path = os.path.join(root, spec.name, experiment, member, 'Amon', var, VERSION, name)
+            seed = zlib.crc32(name.encode())
+            write_file(path, var, spec, experiment, member, edges[12 * first:12 * last + 1], part, quirks, seed)
+            paths.append(path)
+    return paths
+
+
+def write_archive(root, specs=SPECS, experiments=('historical', 'piControl'), years=20, control_years=30,
+                  years_per_file=10, members=1, grid=None, variables=config.VARIABLES):
+    """Write a synthetic archive under root.
+
+    years, control_years: length of the historical and piControl runs
+    members: number of historical runs per model; piControl has one
+    grid: (nlat, nlon) for all models instead of each model's own
+
+    returns: list of the paths written
+    """
+    paths = []
+    for spec in specs:
+        if grid is not None:
+            spec = ModelSpec(spec.name, spec.calendar, grid, spec.member, spec.quirks)
+        for experiment in experiments:
+            if experiment == 'piControl':
+                runs, length = [spec.member], control_years
+            else:
+                runs, length = [spec.member.replace('r1i', 'r%di' % (n + 1), 1) for n in range(members)], years
+            for member in runs:
+                paths.extend(write_run(root, spec, experiment, member, length, years_per_file, variables))
+    return paths
+
+
+def grid_size(text):
+    nlat, nlon = text.lower().split('x')
+    return int(nlat), int(nlon)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('root')
+    parser.add_argument('--models', nargs='+', choices=[spec.name for spec in SPECS])
+    parser.add_argument('--experiments', nargs='+', default=['historical', 'piControl'], choices=sorted(START))
+    parser.add_argument('--years', type=int, default=20, help='length of the historical runs')
+    parser.add_argument('--control-years', type=int, default=30, help='length of the piControl runs')
+    parser.add_argument('--years-per-file', type=int, default=10)
+    parser.add_argument('--members', type=int, default=1, help='historical runs per model')
+    parser.add_argument('--grid', type=grid_size, help='NLATxNLON for every model, e.g. 144x192')
+    args = parser.parse_args(argv)
+
+    specs = [spec for spec in SPECS if args.models is None or spec.name in args.models]
+    paths = write_archive(
+        args.root, specs, args.experiments, args.years, args.control_years, args.years_per_file, args.members,
+        args.grid,
+    )
+    print('wrote %d files, %.1f MB' % (len(paths), sum(os.path.getsize(path) for path in paths) / 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Cache of grid cell area weights keyed by the horizontal grid.
+
+All runs of a model, and all variables within a run, share one grid, so the
+2-D (latitude, longitude) weights are computed once per grid signature: a hash
+of the latitude and longitude points and bounds. Weights are held in memory and
+saved as ``<signature>.npy`` in the cache directory so that later extractions
+and the other worker processes pick them up from disk.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from . import config
+from .reduce import area_weights_2d
+
+
+def grid_signature(cube):
+    """Hash of the latitude and longitude points and bounds and their order in the cube."""
+    sha = hashlib.sha1()
+    for name in ['latitude', 'longitude']:
+        coord = cube.coord(name)
+        sha.update(('%s%s' % (name, cube.coord_dims(coord))).encode())
+        sha.update(np.ascontiguousarray(coord.points, dtype=np.float64).tobytes())
+        if coord.has_bounds():
+            sha.update(np.ascontiguousarray(coord.bounds, dtype=np.float64).tobytes())
+    return sha.hexdigest()
+
+
+class GridWeightsCache:
+    """In-memory and on-disk store of 2-D area weights.
+
+    directory: where the .npy files live; None keeps the cache in memory only
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._weights = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, signature):
+        return os.path.join(self.directory, '%s.npy' % signature)
+
+    def weights(self, cube):
+        """2-D area weights for the horizontal grid of a (time, latitude, longitude) cube.
+
+        Bounds must already be present (guessed if need be) on both coordinates.
+        """
+        signature = grid_signature(cube)
+        if signature in self._weights:
+            self.hits = self.hits + 1
+            return self._weights[signature]
+        if self.directory is not None and os.path.exists(self._path(signature)):
+            weights = np.load(self._path(signature))
+            self.hits = self.hits + 1
+            self.disk_hits = self.disk_hits + 1
+        else:
+            weights = area_weights_2d(cube)
+            self.misses = self.misses + 1
+            if self.directory is not None:
+                self._save(signature, weights)
+        self._weights[signature] = weights
+        return weights
+
+    def _save(self, signature, weights):
+        # write to a temporary file and rename so other workers never read a partial file
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.npy.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, weights)
+        os.replace(tmp, self._path(signature))
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses}
+
+
+_caches = {}
+
+
+def get_cache(directory=None):
+    """The cache for a directory, shared by everything in this process.
+
+    directory: defaults to cache/grid_weights in the repository
+    """
+    if directory is None:
+        directory = os.path.join(config.CACHE, 'grid_weights')
+    if directory not in _caches:
+        _caches[directory] = GridWeightsCache(directory)
+    return _caches[directory]
@@ -0,0 +1,115 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cmip56forcing import branch_points
+from cmip56forcing.branch_points import Control, find_branch_points
+
+
+def write_run(output, model, run, experiment, years=None, meta=None, year_axis=False):
+    directory = output / 'cmip6' / model / run
+    directory.mkdir(parents=True, exist_ok=True)
+    if years is not None:
+        if year_axis:
+            frame = pd.DataFrame({'year': years})
+        else:
+            frame = pd.DataFrame({'time': ['%04d-07-02 12:00:00' % year for year in years]})
+        frame['tas'] = 287.0
+        frame.to_csv(directory / ('%s.csv' % experiment), index=False)
+    if meta is not None:
+        (directory / ('meta_%s.json' % experiment)).write_text(json.dumps(meta))
+
+
+def test_control_lookup():
+    control = Control([5, 6, 7, 7, 9])
+    assert list(control.rows_of([5, 6, 7, 8, 9, 4, 10])) == [0, 1, -1, -1, 4, -1, -1]
+
+
+def test_branch_points(tmp_path):
+    # a 360-day control from year 1 and a noleap one from 1850, given as years
+    write_run(tmp_path, 'UKESM1-0-LL', 'r1i1p1f2', 'piControl', range(1, 501))
+    write_run(tmp_path, 'CanESM5', 'r1i1p1f1', 'piControl', range(1850, 2400), year_axis=True)
+    days = {'branch_time_in_parent': 360 * 100.0, 'parent_time_units': 'days since 0001-01-01'}
+    write_run(tmp_path, 'UKESM1-0-LL', 'r1i1p1f2', 'historical', meta=days)
+    # the calendar recorded at extraction wins over the one known for the model
+    write_run(tmp_path, 'UKESM1-0-LL', 'r2i1p1f2', 'historical', meta=dict(days, calendar='noleap'))
+    # too close to the end of the control
+    write_run(tmp_path, 'UKESM1-0-LL', 'r3i1p1f2', 'historical', meta=dict(days, branch_time_in_parent=360 * 400.0))
+    # not the variant used
+    write_run(tmp_path, 'UKESM1-0-LL', 'r1i1p1f3', 'historical', meta=days)
+    write_run(tmp_path, 'CanESM5', 'r1i1p1f1', 'historical',
+              meta={'branch_time_in_parent': 365 * 50.0, 'parent_time_units': 'days since 1850-01-01'})
+    # EC-Earth3's branch times are strings
+    write_run(tmp_path, 'EC-Earth3', 'r1i1p1f1', 'piControl', range(2259, 2760))
+    write_run(tmp_path, 'EC-Earth3', 'r1i1p1f1', 'historical',
+              meta={'branch_time_in_parent': '0.0D0', 'parent_time_units': 'days since 2259-01-01'})
+
+    results = find_branch_points(['historical', 'hist-nat'], output=tmp_path)
+    assert results['historical'] == {
+        'CanESM5': {'r1i1p1f1': 50},
+        'EC-Earth3': {'r1i1p1f1': 0},
+        'UKESM1-0-LL': {'r1i1p1f2': 100, 'r2i1p1f2': np.round(36000 / 365)},
+    }
+    assert results['hist-nat'] == {}
+
+
+def test_matches_the_published_branch_points():
+    published = branch_points.DEFAULT_PATH
+    with open(published) as f:
+        expected = json.load(f)
+    assert find_branch_points() == expected
+
+
+def test_update_reads_only_modified_meta(tmp_path):
+    output = tmp_path / 'output'
+    path = tmp_path / 'branch_points.json'
+    state = tmp_path / 'state.json'
+    corrections = tmp_path / 'corrections.json'
+    corrections.write_text('[]')
+    write_run(output, 'CanESM5', 'r1i1p1f1', 'piControl', range(1850, 2400))
+    meta = {'branch_time_in_parent': 0.0, 'parent_time_units': 'days since 1850-01-01'}
+    write_run(output, 'CanESM5', 'r1i1p1f1', 'historical', meta=meta)
+    write_run(output, 'CanESM5', 'r2i1p1f1', 'historical', meta=dict(meta, branch_time_in_parent=365 * 10.0))
+
+    def update(**kwargs):
+        return branch_points.update(str(path), str(output), str(corrections), str(state), **kwargs)
+
+    results, read = update()
+    assert read == 2
+    assert results['historical'] == {'CanESM5': {'r1i1p1f1': 0, 'r2i1p1f1': 10}}
+    assert update()[1] == 0
+
+    # a new member, and one gone
+    write_run(output, 'CanESM5', 'r3i1p1f1', 'historical', meta=dict(meta, branch_time_in_parent=365 * 20.0))
+    (output / 'cmip6' / 'CanESM5' / 'r1i1p1f1' / 'meta_historical.json').unlink()
+    results, read = update()
+    assert read == 1
+    assert json.loads(path.read_text()) == results
+    assert results['historical'] == {'CanESM5': {'r2i1p1f1': 10, 'r3i1p1f1': 20}}
+
+    # corrections that change are applied to every run
+    corrections.write_text(json.dumps([{'models': ['CanESM5'], 'runs': ['r3*'], 'add': {'branch_time_in_parent': 365}}]))
+    results, read = update()
+    assert read == 2
+    assert results['historical'] == {'CanESM5': {'r2i1p1f1': 10, 'r3i1p1f1': 21}}
+    assert update(full=True)[1] == 2
+
+
+def test_corrections():
+    corrections = branch_points.load_corrections()
+    meta = {'branch_time_in_parent': 100.0, 'parent_time_units': 'days since 1850-01-01'}
+    assert branch_points.apply_exceptions(dict(meta), 'CIESM', 'historical', 'r1i1p1f1', corrections)['branch_time_in_parent'] == -182400
+    for run, units in [('r1i1p1f2', 'days since 7550-1-1'), ('r1i1p1f1', 'days since 1850-01-01')]:
+        assert branch_points.apply_exceptions(dict(meta), 'GISS-E2-1-G', 'hist-nat', run, corrections)['parent_time_units'] == units
+    assert branch_points.apply_exceptions(dict(meta), 'GISS-E2-1-G', 'historical', 'r1i1p1f2', corrections) == meta
+
+
+def test_unknown_calendar_names_the_run():
+    meta = {'branch_time_in_parent': 3600.0, 'parent_time_units': 'days since 1850-01-01'}
+    assert list(branch_points.branch_years([dict(meta, calendar='360_day')], ['CanESM5'], ['r1i1p1f1'])) == [1860]
+    with pytest.raises(ValueError, match='calendar julian_ish of CanESM5 r1i1p1f1'):
+        branch_points.branch_years([dict(meta, calendar='julian_ish')], ['CanESM5'], ['r1i1p1f1'])
+    with pytest.raises(ValueError, match='no calendar recorded for NewModel r2i1p1f1'):
+        branch_points.branch_years([meta], ['NewModel'], ['r2i1p1f1'])
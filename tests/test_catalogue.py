@@ -0,0 +1,71 @@
+import os
+
+from cmip56forcing.catalogue import Catalogue
+
+
+def make_file(archive, model, experiment, member, variable, name, version='v20190429', table='Amon'):
+    directory = os.path.join(archive, model, experiment, member, table, variable, version)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write('x')
+    return path
+
+
+def test_scan_records_drs(tmp_path):
+    archive = str(tmp_path / 'archive')
+    tas = make_file(archive, 'CanESM5', 'historical', 'r1i1p1f1', 'tas', 'tas_185001-201412.nc')
+    make_file(archive, 'CanESM5', 'historical', 'r2i1p1f1', 'rlut', 'rlut_185001-201412.nc')
+    make_file(archive, 'CanESM5', 'historical', 'r2i1p1f1', 'rlut', 'notes.txt')
+    catalogue = Catalogue(archive, str(tmp_path / 'catalogue.sqlite'))
+    assert catalogue.is_empty()
+
+    stats = catalogue.scan()
+    assert stats['added'] == 2
+    assert catalogue.files('CanESM5', 'historical', 'tas') == [tas]
+    assert catalogue.files('CanESM5', 'historical', 'tas', 'r2i1p1f1') == []
+    assert catalogue.members('CanESM5', 'historical', ['tas', 'rlut']) == ['r1i1p1f1', 'r2i1p1f1']
+    assert catalogue.stat([tas]) == {tas: (1, os.stat(tas).st_mtime)}
+
+
+def test_rescan_lists_only_changed_directories(tmp_path):
+    archive = str(tmp_path / 'archive')
+    make_file(archive, 'CanESM5', 'historical', 'r1i1p1f1', 'tas', 'tas_185001-189912.nc')
+    make_file(archive, 'CanESM5', 'historical', 'r2i1p1f1', 'tas', 'tas_185001-201412.nc')
+    catalogue = Catalogue(archive, str(tmp_path / 'catalogue.sqlite'))
+    catalogue.scan()
+
+    stats = catalogue.scan()
+    assert stats['listed'] == 0
+    assert stats['added'] == stats['removed'] == 0
+
+    added = make_file(archive, 'CanESM5', 'historical', 'r1i1p1f1', 'tas', 'tas_190001-201412.nc')
+    stats = catalogue.scan()
+    assert stats['listed'] == 1
+    assert stats['added'] == 1
+    assert added in catalogue.files('CanESM5', 'historical', 'tas', 'r1i1p1f1')
+
+
+def test_rescan_forgets_removed_files_and_directories(tmp_path):
+    archive = str(tmp_path / 'archive')
+    first = make_file(archive, 'CanESM5', 'historical', 'r1i1p1f1', 'tas', 'tas_185001-189912.nc')
+    make_file(archive, 'CanESM5', 'historical', 'r1i1p1f1', 'tas', 'tas_190001-201412.nc')
+    removed = make_file(archive, 'CanESM5', 'historical', 'r2i1p1f1', 'tas', 'tas_185001-201412.nc')
+    catalogue = Catalogue(archive, str(tmp_path / 'catalogue.sqlite'))
+    catalogue.scan()
+
+    os.remove(first)
+    os.remove(removed)
+    os.removedirs(os.path.dirname(removed))
+    stats = catalogue.scan()
+    assert stats['removed'] == 2
+    assert catalogue.members('CanESM5', 'historical', ['tas']) == ['r1i1p1f1']
+    assert first not in catalogue.files('CanESM5', 'historical', 'tas')
+
+
+def test_full_scan_relists_everything(tmp_path):
+    archive = str(tmp_path / 'archive')
+    make_file(archive, 'CanESM5', 'historical', 'r1i1p1f1', 'tas', 'tas_185001-201412.nc')
+    catalogue = Catalogue(archive, str(tmp_path / 'catalogue.sqlite'))
+    first = catalogue.scan()
+    assert catalogue.scan(full=True)['listed'] == first['listed']
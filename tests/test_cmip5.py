@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pytest
+
+from cmip56forcing import cmip5
+
+pytest.importorskip('scipy')
+
+
+def notebook_means(monthly, model, first_time):
+    # the loop of produce_results.ipynb
+    first_index = int(first_time - 1850)
+    offset = 0
+    if model[:3] == 'Had':
+        offset = -11
+        first_index = first_index + 1
+    means = np.ones(156) * np.nan
+    for i in range(first_index, 156):
+        means[i] = np.mean(monthly[(i - first_index) * 12 + offset:12 + (i - first_index) * 12 + offset])
+    return means
+
+
+@pytest.mark.filterwarnings('ignore:Mean of empty slice', 'ignore:invalid value encountered')
+@pytest.mark.parametrize('model, first_time, months', [
+    ('CanESM2', 1850.04, 1872),
+    ('GISS-E2-R', 1861.04, 1735),
+    ('HadGEM2-ES', 1859.96, 1752),
+    ('HadGEM2-ES', 1859.96, 100),
+])
+def test_annual_means_align_as_the_notebook(model, first_time, months):
+    monthly = np.random.default_rng(months).normal(size=months).astype('>f4')
+    first, offset = cmip5.alignment(model, first_time)
+    np.testing.assert_array_equal(cmip5.annual_means(monthly, first, offset), notebook_means(monthly, model, first_time))
+
+
+@pytest.mark.filterwarnings('ignore:Mean of empty slice', 'ignore:invalid value encountered')
+def test_runs_read_through_the_cache(tmp_path):
+    from scipy.io import readsav
+
+    runs, controls = cmip5.load(models=['HadGEM2-ES'], cache_dir=str(tmp_path))
+    assert runs.models == ['HadGEM2-ES']
+    assert len(os.listdir(tmp_path)) == 4 * (runs.runs != '').sum()
+    e, m, k = runs.slot('historical', 'HadGEM2-ES', 'r1i1p1')
+    save = readsav(os.path.join(cmip5.DIRECTORY, 'tas_HadGEM2-ES_historical_r1i1p1.idlsave'))
+    tas = runs.variables.index('tas')
+    np.testing.assert_array_equal(runs.data[e, m, k, :, tas], notebook_means(save['tas'], 'HadGEM2-ES', save['time'][0]))
+    np.testing.assert_array_equal(controls.data[e, m, k, :, tas], notebook_means(save['ctrl'], 'HadGEM2-ES', save['time'][0]))
+    assert not runs.valid[e, m, k, :11].any() and runs.valid[e, m, k, 11:].all()
+
+    again, _ = cmip5.load(models=['HadGEM2-ES'], cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(again.data, runs.data)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from cmip56forcing.derived import ExperimentSet
+from cmip56forcing.implied_erf import ImpliedERF
+
+
+def make_set(definitions, wrap=lambda values: values):
+    runs = {
+        'a': np.array([['r1', 'r2', 'r3'], ['r1', '', '']]),
+        'b': np.array([['r3', 'r1', ''], ['r2', '', '']]),
+        'c': np.array([['r1', 'r3', 'r4'], ['r1', '', '']]),
+    }
+    values = {
+        experiment: wrap(np.array([[[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], [[7.0, 8.0], [0.0, 0.0], [0.0, 0.0]]]) * scale)
+        for experiment, scale in [('a', 1), ('b', 10), ('c', 100)]
+    }
+    return ExperimentSet(['M1', 'M2'], runs, values, definitions)
+
+
+def test_members_matched_by_run():
+    experiments = make_set({'d': {'a': 1, 'b': -1}, 'e': {'d': 2, 'c': 0.5}})
+    assert 'e' in experiments and 'f' not in experiments
+    assert experiments.runs('d').tolist() == [['r1', 'r3'], ['', '']]
+    d = experiments['d']
+    # a's r1 less b's r1, and a's r3 less b's r3
+    np.testing.assert_array_equal(d[0], [[1 - 30, 2 - 40], [5 - 10, 6 - 20]])
+    assert np.isnan(d[1]).all()
+    assert experiments['d'] is d
+    np.testing.assert_array_equal(experiments['e'][0], [[2 * -29 + 50, 2 * -38 + 100], [2 * -5 + 150, 2 * -14 + 200]])
+    with pytest.raises(KeyError):
+        experiments['f']
+
+
+def test_tuples_of_series():
+    experiments = make_set({'d': {'a': 1, 'c': -1}}, lambda values: ImpliedERF(values, -values, 2 * values))
+    d = experiments['d']
+    assert isinstance(d, ImpliedERF)
+    np.testing.assert_array_equal(d.delta_T, -d.delta_N)
+    np.testing.assert_array_equal(d.delta_N[1, 0], [7 - 700, 8 - 800])
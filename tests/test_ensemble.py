@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from cmip56forcing import ensemble
+
+
+def write_run(output, model, run, experiment, years, tas):
+    directory = output / 'cmip6' / model / run
+    directory.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({
+        'time': ['%04d-07-02 12:00:00' % year for year in years],
+        'rsdt': 340.0,
+        'rlut': 240.0,
+        'rsut': 100.0,
+        'tas': tas,
+    }).to_csv(directory / ('%s.csv' % experiment), index=False)
+
+
+def make_tree(tmp_path):
+    output = tmp_path / 'output'
+    write_run(output, 'CanESM5', 'r1i1p1f1', 'historical', range(1850, 1855), 1.0)
+    write_run(output, 'CanESM5', 'r2i1p1f1', 'historical', range(1850, 1853), 3.0)
+    write_run(output, 'CanESM5', 'r1i1p2f1', 'historical', range(1850, 1855), 5.0)
+    write_run(output, 'MIROC6', 'r1i1p1f1', 'historical', range(1850, 1854), 2.0)
+    write_run(output, 'MIROC6', 'r1i1p1f1', 'piControl', range(3200, 3210), 0.0)
+    write_run(output, 'CanESM5', 'r1i1p1f1', 'piControl', range(5201, 5206), 0.0)
+    path = tmp_path / 'branch_points.json'
+    path.write_text(json.dumps({'historical': {
+        'CanESM5': {'r1i1p1f1': 0, 'r2i1p1f1': 1, 'r1i1p2f1': 2},
+        'MIROC6': {'r1i1p1f1': 0},
+        'GFDL-CM4': {},
+    }}))
+    return output, path
+
+
+def test_load_and_mean(tmp_path):
+    output, path = make_tree(tmp_path)
+    runs = ensemble.load(['historical'], output=str(output), path=str(path))
+    assert runs.models == ['CanESM5', 'MIROC6']
+    assert runs.data.shape == (1, 2, 3, 5, 4)
+    assert list(runs.count()[0]) == [3, 1]
+    assert list(runs.valid[0, 1, 0]) == [True] * 4 + [False]
+    assert list(runs.runs[0, 1]) == ['r1i1p1f1', '', '']
+    np.testing.assert_allclose(runs.mean('tas')[0, 0], [3, 3, 3, 3, 3])
+    np.testing.assert_allclose(runs.mean('tas')[0, 1], [2, 2, 2, 2, np.nan])
+    assert list(runs.run('historical', 'MIROC6', 'r1i1p1f1')['tas']) == [2.0] * 4
+
+    controls = ensemble.load(['piControl'], output=str(output), length=3)
+    assert controls.models == ['CanESM5', 'MIROC6']
+    assert controls.years == 3
+    assert list(controls.first_year[0, :, 0]) == [5201, 3200]
+
+
+def test_select(tmp_path):
+    output, path = make_tree(tmp_path)
+    runs = ensemble.load(['historical'], output=str(output), path=str(path))
+    p1 = runs.select(models=['MIROC6', 'CanESM5'], runs='r*i1p1f1')
+    assert p1.models == ['MIROC6', 'CanESM5']
+    assert p1.runs.shape == (1, 2, 2)
+    assert list(p1.runs[0, 1]) == ['r1i1p1f1', 'r2i1p1f1']
+    np.testing.assert_allclose(p1.mean('tas')[0, 1], [2, 2, 2, 1, 1])
+    p2 = runs.select(runs=['r*i1p2f1'])
+    assert list(p2.runs[0, :, 0]) == ['r1i1p2f1', '']
+    assert list(p2.first_year[0, :, 0]) == [1850, -1]
+    assert np.isnan(p2.values('tas')[0, 1]).all() and not p2.valid[0, 1].any()
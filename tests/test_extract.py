@@ -0,0 +1,85 @@
+import json
+import os
+
+import cf_units
+import cftime
+import iris
+import iris.coords
+import iris.cube
+import numpy as np
+import pandas as pd
+
+from cmip56forcing import config, extract
+from cmip56forcing.catalogue import Catalogue
+
+# a constant field of each variable, so that its annual global means are known
+VALUES = {'rsdt': 340.0, 'rlut': 240.0, 'rsut': 100.0, 'tas': 287.0}
+
+
+def write_archive(archive, model='CanESM5', experiment='historical', run='r1i1p1f1', variables=VALUES, nyears=2):
+    """Monthly files of each variable in the DRS layout, split in two in time."""
+    units = cf_units.Unit('days since 1850-01-01', calendar='365_day')
+    edges = cftime.date2num(
+        [cftime.datetime(1850 + i // 12, i % 12 + 1, 1, calendar='365_day') for i in range(12 * nyears + 1)],
+        'days since 1850-01-01', calendar='365_day',
+    )
+    bounds = np.array([edges[:-1], edges[1:]]).T
+    for variable in variables:
+        time = iris.coords.DimCoord(bounds.mean(axis=1), 'time', units=units, bounds=bounds)
+        latitude = iris.coords.DimCoord(np.linspace(-60, 60, 3), 'latitude', units='degrees')
+        longitude = iris.coords.DimCoord(np.arange(0, 360, 90.0), 'longitude', units='degrees')
+        cube = iris.cube.Cube(
+            np.full((12 * nyears, 3, 4), VALUES[variable]), var_name=variable, units='1',
+            dim_coords_and_dims=[(time, 0), (latitude, 1), (longitude, 2)],
+            attributes={'branch_time_in_parent': 0.0, 'parent_time_units': 'days since 1850-01-01'},
+        )
+        directory = os.path.join(archive, model, experiment, run, 'Amon', variable, 'v20190429')
+        os.makedirs(directory, exist_ok=True)
+        for n, months in enumerate([slice(0, 12), slice(12, None)]):
+            iris.save(cube[months], os.path.join(directory, '%s_%d.nc' % (variable, n)))
+
+
+def plan(tmp_path, archive):
+    catalogue = Catalogue(archive, str(tmp_path / 'catalogue.sqlite'))
+    catalogue.scan()
+    return extract.plan_units('historical', catalogue, ['CanESM5'])
+
+
+def test_process_run_writes_annual_means(tmp_path):
+    archive, output = str(tmp_path / 'archive'), str(tmp_path / 'output')
+    write_archive(archive)
+    [(model, run, filelists)] = plan(tmp_path, archive)
+    assert (model, run) == ('CanESM5', 'r1i1p1f1')
+    assert [len(files) for files in filelists.values()] == [2, 2, 2, 2]
+
+    result = extract.process_run(
+        model, run, 'historical', filelists, output=output, cache_dir=str(tmp_path / 'weights')
+    )
+    assert result == ('CanESM5', 'r1i1p1f1', True, 'successful')
+    directory = os.path.join(output, 'cmip6', 'CanESM5', 'r1i1p1f1')
+    frame = pd.read_csv(os.path.join(directory, 'historical.csv'))
+    assert list(frame.columns) == ['time', 'rsdt', 'rsut', 'rlut', 'tas']
+    assert len(frame) == 2
+    for variable, value in VALUES.items():
+        np.testing.assert_allclose(frame[variable], value)
+    with open(os.path.join(directory, 'meta_historical.json')) as f:
+        assert json.load(f)['parent_time_units'] == 'days since 1850-01-01'
+
+
+def test_missing_variable_fails_the_run(tmp_path):
+    archive, output = str(tmp_path / 'archive'), str(tmp_path / 'output')
+    write_archive(archive, variables=['rsdt', 'rsut', 'tas'])
+    [(model, run, filelists)] = plan(tmp_path, archive)
+    result = extract.process_run(
+        model, run, 'historical', filelists, output=output, cache_dir=str(tmp_path / 'weights')
+    )
+    assert result == ('CanESM5', 'r1i1p1f1', False, 'no rlut variables found')
+    assert not os.path.exists(os.path.join(output, 'cmip6', 'CanESM5', 'r1i1p1f1', 'historical.csv'))
+
+
+def test_experiment_models_and_runs():
+    assert config.experiment_models('hist-GHG-cmip5') == ['CanESM5']
+    assert config.experiment_runs('abrupt-4xCO2', 'HadGEM3-GC31-LL') == ['r1i1p1f3']
+    assert config.experiment_runs('historical', 'CanESM5') is None
+    assert config.experiment_models('historical') == list(config.load_feedbacks()['CMIP6'])
+    assert not config.writes_meta('piControl-cmip5') and config.writes_meta('historical')
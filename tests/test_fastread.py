@@ -0,0 +1,153 @@
+import warnings
+
+import netCDF4
+import numpy as np
+import pytest
+
+from cmip56forcing import fastread
+from cmip56forcing.load import TimePlan, load_run
+from cmip56forcing.reduce import global_mean
+
+
+def write(path, var, start_year, nyears, units='days since 1850-01-01', calendar='noleap', bounds=True,
+          int_bounds=False, attributes=None, nlat=6, nlon=8, swap=False, lat_names=None):
+    """A monthly (time, lat, lon) file in the style of the CMIP6 archive.
+
+    swap: store the data as (time, lon, lat)
+    lat_names: (standard_name or None, units) of the latitude coordinate
+    """
+    with netCDF4.Dataset(path, 'w') as ds:
+        ds.createDimension('time', None)
+        ds.createDimension('lat', nlat)
+        ds.createDimension('lon', nlon)
+        ds.createDimension('bnds', 2)
+        starts = [
+            netCDF4.date2num(
+                netCDF4.num2date(0, 'days since %04d-01-01' % (start_year + i // 12), calendar).replace(month=i % 12 + 1),
+                units, calendar,
+            )
+            for i in range(12 * nyears + 1)
+        ]
+        time = ds.createVariable('time', 'f8', ('time',))
+        time.units = units
+        time.calendar = calendar
+        time.standard_name = 'time'
+        time[:] = 0.5 * (np.array(starts[:-1]) + np.array(starts[1:]))
+        if bounds:
+            time.bounds = 'time_bnds'
+            ds.createVariable('time_bnds', 'i4' if int_bounds else 'f8', ('time', 'bnds'))[:] = np.array(
+                [starts[:-1], starts[1:]]
+            ).T
+        lat = ds.createVariable('lat', 'f8', ('lat',))
+        standard_name, lat.units = lat_names or ('latitude', 'degrees_north')
+        if standard_name is not None:
+            lat.standard_name = standard_name
+        edges = np.linspace(-90, 90, nlat + 1)
+        lat[:] = 0.5 * (edges[1:] + edges[:-1])
+        lon = ds.createVariable('lon', 'f8', ('lon',))
+        lon.standard_name = 'longitude'
+        lon.units = 'degrees_east'
+        lon[:] = (np.arange(nlon) + 0.5) * 360 / nlon
+        if bounds:
+            lat.bounds = 'lat_bnds'
+            lon.bounds = 'lon_bnds'
+            ds.createVariable('lat_bnds', 'f8', ('lat', 'bnds'))[:] = np.array([edges[:-1], edges[1:]]).T
+            lon_edges = np.arange(nlon + 1) * 360 / nlon
+            ds.createVariable('lon_bnds', 'f8', ('lon', 'bnds'))[:] = np.array([lon_edges[:-1], lon_edges[1:]]).T
+        data = ds.createVariable(var, 'f4', ('time', 'lon', 'lat') if swap else ('time', 'lat', 'lon'), fill_value=1e20)
+        data.units = 'K'
+        data.standard_name = 'air_temperature'
+        data.long_name = 'Near-Surface Air Temperature'
+        data.cell_methods = 'area: time: mean'
+        data.comment = 'near-surface'
+        rng = np.random.default_rng(start_year)
+        values = np.ma.masked_array(rng.normal(288, 5, (12 * nyears, nlat, nlon)).astype('f4'))
+        values[::7, 0, :2] = np.ma.masked
+        data[:] = values.transpose(0, 2, 1) if swap else values
+        ds.branch_time_in_parent = 0.0
+        ds.parent_experiment_id = 'piControl'
+        for name, value in (attributes or {}).items():
+            ds.setncattr(name, value)
+    return str(path)
+
+
+def iris_annual(files):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        cubes = load_run({'tas': files}, 'CanESM5', 'historical')
+        plan = TimePlan(cubes['tas'].coord('time'))
+        return plan, plan.annual_mean(global_mean(cubes['tas'])), cubes['tas'].attributes
+
+
+def fast_annual(files, chunk_mb=None):
+    variable = fastread.open_run({'tas': files})['tas']
+    plan = TimePlan(variable.time)
+    return plan, plan.annual_mean(variable.global_mean(chunk_mb=chunk_mb)), variable.attributes
+
+
+@pytest.mark.parametrize('calendar', ['noleap', '360_day', 'standard'])
+def test_matches_iris(tmp_path, calendar):
+    files = [
+        write(tmp_path / 'a.nc', 'tas', 1850, 2, calendar=calendar, attributes={'creation_date': 'a'}),
+        # a different reference date in the second file
+        write(tmp_path / 'b.nc', 'tas', 1852, 3, units='days since 1852-01-01', calendar=calendar,
+              attributes={'creation_date': 'b'}),
+    ]
+    iris_plan, expected, iris_attributes = iris_annual(files)
+    for chunk_mb in [None, 0.0001]:
+        plan, annual, attributes = fast_annual(files, chunk_mb)
+        np.testing.assert_allclose(annual, expected, rtol=1e-12)
+        assert plan.dates == iris_plan.dates
+    assert attributes.keys() == dict(iris_attributes).keys()
+    assert 'creation_date' not in attributes and attributes['comment'] == 'near-surface'
+
+
+def test_integer_time_bounds_and_guessed_grid_bounds(tmp_path):
+    files = [write(tmp_path / 'a.nc', 'tas', 1850, 2, int_bounds=True)]
+    np.testing.assert_allclose(fast_annual(files)[1], iris_annual(files)[1], rtol=1e-12)
+
+    files = [write(tmp_path / 'b.nc', 'tas', 1850, 2, bounds=False)]
+    np.testing.assert_allclose(fast_annual(files)[1], iris_annual(files)[1], rtol=1e-12)
+
+
+def test_guess_bounds():
+    np.testing.assert_allclose(fastread.guess_bounds(np.array([-60.0, 0, 60])), [[-90, -30], [-30, 30], [30, 90]])
+    np.testing.assert_allclose(fastread.guess_bounds(np.array([-80.0, 0, 80]), clip=90.0)[0], [-90, -40])
+    np.testing.assert_allclose(
+        fastread.guess_bounds(np.array([0.0, 90, 180, 270]), circular=True), [[-45, 45], [45, 135], [135, 225], [225, 315]]
+    )
+
+
+def test_unsupported(tmp_path):
+    overlapping = [write(tmp_path / 'a.nc', 'tas', 1850, 2), write(tmp_path / 'b.nc', 'tas', 1851, 2)]
+    with pytest.raises(fastread.Unsupported, match='overlap'):
+        fastread.open_run({'tas': overlapping})
+
+    regrid = [write(tmp_path / 'c.nc', 'tas', 1850, 1), write(tmp_path / 'd.nc', 'tas', 1851, 1, nlat=12)]
+    with pytest.raises(fastread.Unsupported, match='grid'):
+        fastread.open_run({'tas': regrid})
+
+    with pytest.raises(fastread.Unsupported, match='rlut is not in'):
+        fastread.open_run({'rlut': [str(tmp_path / 'c.nc')]})
+
+
+def test_horizontal_coordinates_are_checked(tmp_path):
+    with pytest.raises(fastread.Unsupported, match='dimension lon is not latitude'):
+        fastread.open_run({'tas': [write(tmp_path / 'swapped.nc', 'tas', 1850, 1, swap=True)]})
+    with pytest.raises(fastread.Unsupported, match='dimension lat is not latitude'):
+        fastread.open_run({'tas': [write(tmp_path / 'east.nc', 'tas', 1850, 1, lat_names=(None, 'degrees_east'))]})
+    with pytest.raises(fastread.Unsupported, match='dimension lat is not latitude'):
+        fastread.open_run({'tas': [write(tmp_path / 'degrees.nc', 'tas', 1850, 1, lat_names=(None, 'degrees'))]})
+    # units alone identify a coordinate without a standard_name
+    fastread.open_run({'tas': [write(tmp_path / 'north.nc', 'tas', 1850, 1, lat_names=(None, 'degree_N'))]})
+
+
+def test_benchmark_applies_the_model_fixes(tmp_path, monkeypatch):
+    from cmip56forcing import fixes
+
+    fixed = []
+    monkeypatch.setattr(fixes, 'apply_netcdf_fixes', lambda variable, *unit: fixed.append((variable.var,) + unit))
+    files = {var: [write(tmp_path / ('%s.nc' % var), var, 1850, 1)] for var in ['tas', 'rsdt']}
+    annual = fastread._benchmark_fast(files, 'NorESM2-LM', 'piControl', None)
+    assert sorted(fixed) == [('rsdt', 'NorESM2-LM', 'piControl'), ('tas', 'NorESM2-LM', 'piControl')]
+    assert annual['tas'].shape == (1,)
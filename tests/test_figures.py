@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+
+from cmip56forcing import figures
+
+
+def line(bundle, color):
+    import matplotlib.pyplot as pl
+
+    fig, ax = pl.subplots()
+    ax.plot(bundle, color=color)
+    return fig
+
+
+def test_render_skips_current_figures(tmp_path, monkeypatch):
+    monkeypatch.setitem(figures.FIGURES, 'line', figures.Figure(line, 'series', ['line.png'], {'color': 'k'}))
+    directory, state_dir = str(tmp_path / 'plots'), str(tmp_path / 'state')
+
+    def render(series):
+        return figures.render({'series': series}, ['line'], directory, 2, state_dir, report=lambda message: None)
+
+    assert render(np.arange(3.0))['line'] is not None
+    assert os.path.exists(os.path.join(directory, 'line.png'))
+    assert render(np.arange(3.0))['line'] is None
+    # new data, a missing file or a new style draw it again
+    assert render(np.arange(4.0))['line'] is not None
+    os.remove(os.path.join(directory, 'line.png'))
+    assert render(np.arange(4.0))['line'] is not None
+    monkeypatch.setitem(figures.STYLE, 'font.size', 12)
+    assert render(np.arange(4.0))['line'] is not None
+
+
+def test_render_keeps_the_state_of_each_directory(tmp_path, monkeypatch):
+    monkeypatch.setitem(figures.FIGURES, 'line', figures.Figure(line, 'series', ['line.png'], {'color': 'k'}))
+    state_dir = str(tmp_path / 'state')
+
+    def render(directory):
+        return figures.render({'series': np.arange(3.0)}, ['line'], str(tmp_path / directory), 1, state_dir,
+                              report=lambda message: None)
+
+    assert render('a')['line'] is not None
+    assert render('b')['line'] is not None
+    # drawing into b leaves a current
+    assert render('a')['line'] is None
+    assert render('b')['line'] is None
+    assert len(os.listdir(state_dir)) == 2
+
+
+def test_figure_key_follows_called_functions():
+    sources = figures.code_source(figures.historical)
+    assert any('def _spread' in source for source in sources)
+    assert figures.figure_key('fig2', 1) != figures.figure_key('fig2_agu2021', 1)
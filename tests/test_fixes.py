@@ -0,0 +1,23 @@
+from cmip56forcing.fixes import FIXES, fixes_for
+
+
+def names(model, experiment):
+    return [fix.name for fix in fixes_for(model, experiment)]
+
+
+def test_control_fixes():
+    assert names('KACE-1-0-G', 'piControl') == ['integer-time-bounds', 'integer-time-points', 'control-time-attributes']
+    assert names('IPSL-CM6A-LR', 'piControl-cmip5') == ['integer-time-bounds', 'control-time-attributes']
+    assert names('NorESM2-LM', 'piControl') == ['guess-grid-bounds']
+    assert names('CanESM5', 'piControl') == []
+
+
+def test_other_experiments():
+    for model in ['AWI-CM-1-1-MR', 'KACE-1-0-G', 'NorESM2-LM']:
+        assert names(model, 'historical') == ['latitude-long-name', 'time-attributes']
+
+
+def test_names_are_unique_and_fixes_do_something():
+    assert len(set(fix.name for fix in FIXES)) == len(FIXES)
+    for fix in FIXES:
+        assert fix.cubes is not None or fix.netcdf is not None
@@ -0,0 +1,71 @@
+import numpy as np
+
+from cmip56forcing import implied_erf
+from cmip56forcing.config import VARIABLES
+
+
+def test_matches_a_loop_over_runs():
+    rng = np.random.default_rng(0)
+    models, members, years, control_years = 3, 4, 170, 400
+    runs = rng.normal(size=(models, members, years, len(VARIABLES))) + 300
+    controls = rng.normal(size=(models, control_years, len(VARIABLES))) + 300
+    starts = rng.integers(0, control_years - 165, size=(models, members))
+    starts[2, 3] = -1
+    feedback = np.array([-1.0, -0.8, -1.3])
+
+    for length in [165, 156]:
+        result = implied_erf.implied_erf(runs, controls[:, None], starts, feedback[:, None], length)
+        assert result.delta_F.shape == (models, members, length)
+        for m in range(models):
+            for k in range(members):
+                if starts[m, k] < 0:
+                    assert np.isnan(result.delta_F[m, k]).all()
+                    continue
+                run = dict(zip(VARIABLES, runs[m, k, :length].T))
+                control = dict(zip(VARIABLES, controls[m, starts[m, k]:starts[m, k] + length].T))
+                delta_N = (run['rsdt'] - run['rsut'] - run['rlut']) - (control['rsdt'] - control['rsut'] - control['rlut'])
+                delta_T = run['tas'] - control['tas']
+                np.testing.assert_array_equal(result.delta_N[m, k], delta_N)
+                np.testing.assert_array_equal(result.delta_T[m, k], delta_T)
+                np.testing.assert_array_equal(result.delta_F[m, k], delta_N - feedback[m] * delta_T)
+
+
+def test_windows_beyond_the_control_are_missing():
+    controls = np.arange(10.0)[None, :, None]
+    windows = implied_erf.control_windows(controls, np.array([0, 7, -1]), 4)[..., 0]
+    np.testing.assert_array_equal(windows[0], [0, 1, 2, 3])
+    np.testing.assert_array_equal(windows[1], [7, 8, 9, np.nan])
+    assert np.isnan(windows[2]).all()
+
+
+def test_ensemble_mean_skips_missing_members():
+    values = np.array([[[1.0, 2.0], [3.0, 4.0], [np.nan, np.nan]], [[np.nan] * 2] * 3])
+    runs = np.array([['r1', 'r2', ''], ['', '', '']])
+    means = implied_erf.ensemble_mean(values, runs)
+    np.testing.assert_array_equal(means[0], [2.0, 3.0])
+    assert np.isnan(means[1]).all()
+
+
+def test_drift_baselines_match_polyfit():
+    rng = np.random.default_rng(1)
+    years = np.arange(500.0)
+    controls = 300 + 0.002 * years[None, :, None] - 2e-6 * years[None, :, None] ** 2 + rng.normal(size=(3, 500, 4))
+    controls[1, 420:] = np.nan
+    controls[2, 2:] = np.nan
+    for degree in [1, 2]:
+        drift = implied_erf.control_drift(controls, degree)
+        for v in range(4):
+            expected = np.polyval(np.polyfit(years, controls[0, :, v], degree), years)
+            np.testing.assert_allclose(drift[0, :, v], expected, rtol=1e-10)
+            expected = np.polyval(np.polyfit(years[:420], controls[1, :420, v], degree), years[:420])
+            np.testing.assert_allclose(drift[1, :420, v], expected, rtol=1e-10)
+        assert np.isnan(drift[1, 420:]).all()
+    # two years are too few to fit a quadratic
+    assert np.isnan(implied_erf.control_drift(controls, 2)[2]).all()
+
+    runs = rng.normal(size=(3, 1, 170, 4)) + 300
+    starts = np.array([[10], [200], [-1]])
+    linear = implied_erf.implied_erf(runs, controls[:, None], starts, -1.0, 165, baseline='linear')
+    drift = implied_erf.control_drift(controls, 1)
+    np.testing.assert_allclose(linear.delta_T[0, 0], runs[0, 0, :165, 3] - drift[0, 10:175, 3])
+    assert np.isnan(linear.delta_T[2]).all()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from cmip56forcing import instrument
+from cmip56forcing.instrument import record, stage
+
+
+def test_stages_are_recorded_with_context(tmp_path):
+    events = tmp_path / 'events.jsonl'
+    with stage('ignored'):
+        pass
+    with record(str(events), model='CanESM5', experiment='historical'):
+        with record(str(events), run='r1i1p1f1'):
+            with stage('unit'):
+                with stage('read', variable='tas'):
+                    (tmp_path / 'data').write_bytes(b'x' * 4096)
+                    (tmp_path / 'data').read_bytes()
+                with pytest.raises(ValueError):
+                    with stage('reduce', variable='tas'):
+                        raise ValueError
+        with stage('catalogue'):
+            pass
+    assert not instrument.recording()
+
+    frame = instrument.read_events(events)
+    assert list(frame['stage']) == ['read', 'reduce', 'unit', 'catalogue']
+    assert list(frame['run'].fillna('')) == ['r1i1p1f1'] * 3 + ['']
+    assert (frame['model'] == 'CanESM5').all()
+    assert frame.loc[1, 'error'] == 'ValueError'
+    assert frame.loc[0, 'bytes_read'] >= 4096
+    assert frame.loc[2, 'seconds'] >= frame.loc[0, 'seconds'] + frame.loc[1, 'seconds']
+
+
+def test_traced_peak_covers_nested_stages(tmp_path):
+    events = tmp_path / 'events.jsonl'
+    with record(str(events), trace_memory=True):
+        with stage('outer'):
+            with stage('inner'):
+                block = np.ones(2**20)  # 8 MB
+                del block
+            small = np.ones(10)
+    del small
+    frame = instrument.read_events(events).set_index('stage')
+    assert frame.loc['inner', 'traced_peak_mb'] >= 8
+    assert frame.loc['outer', 'traced_peak_mb'] >= 8
+
+
+def test_summary_ranks_stages_and_models():
+    import pandas as pd
+
+    events = pd.DataFrame([
+        {'stage': 'unit', 'model': 'A', 'run': 'r1', 'experiment': 'historical', 'seconds': 10, 'bytes_read': 0, 'rss_peak_mb': 100},
+        {'stage': 'iris.load', 'model': 'A', 'run': 'r1', 'experiment': 'historical', 'seconds': 8, 'bytes_read': 10**9, 'rss_peak_mb': 90},
+        {'stage': 'write', 'model': 'A', 'run': 'r1', 'experiment': 'historical', 'seconds': 1, 'bytes_read': 0, 'rss_peak_mb': 100},
+        {'stage': 'unit', 'model': 'B', 'run': 'r1', 'experiment': 'historical', 'seconds': 3, 'bytes_read': 0, 'rss_peak_mb': 50},
+        {'stage': 'read', 'model': 'B', 'run': 'r1', 'experiment': 'historical', 'seconds': 2, 'bytes_read': 10**9, 'rss_peak_mb': 50},
+    ])
+    tables = instrument.summarise(events)
+    assert list(tables['stages'].index) == ['iris.load', 'read', 'write']
+    assert tables['stages'].loc['read', 'gb_per_s'] == 0.5
+    assert list(tables['models'].index) == ['A', 'B']
+    assert list(tables['models']['slowest_stage']) == ['iris.load', 'read']
+    assert list(tables['units']['seconds']) == [10, 3]
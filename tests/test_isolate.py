@@ -0,0 +1,57 @@
+import os
+import time
+
+from cmip56forcing.isolate import Isolated
+
+
+def square(x):
+    return x * x
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def die():
+    os._exit(3)
+
+
+def fail():
+    raise RuntimeError('length of rlut did not match tas')
+
+
+def run_all(running, calls):
+    outcomes = {}
+    calls = list(calls)
+    while calls or len(running):
+        while calls and not running.full():
+            key, function, args = calls.pop(0)
+            running.submit(key, function, *args)
+        for key, succeeded, result in running.poll():
+            outcomes[key] = (succeeded, result)
+    return outcomes
+
+
+def test_results_and_failures_are_kept_apart():
+    outcomes = run_all(Isolated(2), [('a', square, (3,)), ('b', die, ()), ('c', fail, ()), ('d', square, (4,))])
+    assert outcomes['a'] == (True, 9)
+    assert outcomes['d'] == (True, 16)
+    assert outcomes['b'] == (False, 'worker process died with exit code 3')
+    assert outcomes['c'] == (False, 'RuntimeError: length of rlut did not match tas')
+
+
+def test_timeout_kills_only_the_slow_call():
+    start = time.monotonic()
+    outcomes = run_all(Isolated(2, timeout=1), [('slow', sleep, (60,)), ('quick', sleep, (0,))])
+    assert time.monotonic() - start < 30
+    assert outcomes['quick'] == (True, 0)
+    assert outcomes['slow'] == (False, 'timed out after 1 s')
+
+
+def test_poll_without_blocking():
+    running = Isolated(1)
+    running.submit('slow', sleep, 0.5)
+    assert running.poll(block=False) == []
+    assert running.poll() == [('slow', True, 0.5)]
+    assert len(running) == 0
@@ -0,0 +1,96 @@
+import cf_units
+import cftime
+import iris
+import iris.analysis
+import iris.coord_categorisation
+import iris.coords
+import iris.cube
+import numpy as np
+import pytest
+from iris.analysis.cartography import area_weights
+
+from cmip56forcing.load import TimeMismatch, TimePlan
+from cmip56forcing.reduce import global_mean
+
+
+def monthly_cube(nyears=3, calendar='standard'):
+    """Synthetic (time, latitude, longitude) cube of monthly means with some masked points."""
+    units = cf_units.Unit('days since 1850-01-01', calendar=calendar)
+    starts = [cftime.datetime(1850 + i // 12, i % 12 + 1, 1, calendar=calendar) for i in range(12 * nyears + 1)]
+    edges = cftime.date2num(starts, 'days since 1850-01-01', calendar=calendar)
+    lower, upper = edges[:-1], edges[1:]
+    bounds = np.array([lower, upper]).T
+    time = iris.coords.DimCoord(bounds.mean(axis=1), 'time', units=units, bounds=bounds)
+    latitude = iris.coords.DimCoord(np.linspace(-75, 75, 6), 'latitude', units='degrees')
+    longitude = iris.coords.DimCoord(np.arange(0, 360, 45.0), 'longitude', units='degrees')
+    latitude.guess_bounds()
+    longitude.guess_bounds()
+    rng = np.random.default_rng(1)
+    data = np.ma.masked_array(rng.normal(288, 10, (12 * nyears, 6, 8)))
+    data[::5, 0, ::3] = np.ma.masked
+    return iris.cube.Cube(
+        data, var_name='tas', units='K', dim_coords_and_dims=[(time, 0), (latitude, 1), (longitude, 2)]
+    )
+
+
+@pytest.mark.parametrize('calendar', ['standard', '360_day'])
+@pytest.mark.parametrize('chunk_mb', [None, 0.001])
+def test_matches_iris_collapse_and_aggregation(calendar, chunk_mb):
+    cube = monthly_cube(calendar=calendar)
+    expected = cube.collapsed(['longitude', 'latitude'], iris.analysis.MEAN, weights=area_weights(cube))
+    iris.coord_categorisation.add_year(expected, 'time')
+    expected = expected.aggregated_by('year', iris.analysis.MEAN)
+
+    plan = TimePlan(cube.coord('time'))
+    annual = plan.annual_mean(global_mean(cube, chunk_mb=chunk_mb))
+    assert len(plan) == 3
+    np.testing.assert_allclose(annual, expected.data)
+    assert plan.dates == list(expected.coord('time').units.num2date(expected.coord('time').points))
+
+
+def test_check_rejects_mismatched_time_axes():
+    cube = monthly_cube()
+    plan = TimePlan(cube.coord('time'))
+    plan.check('rlut', cube.coord('time'))
+    with pytest.raises(TimeMismatch, match='length of rlut'):
+        plan.check('rlut', cube[:-1].coord('time'))
+    shifted = cube.coord('time').copy(cube.coord('time').points + 5)
+    with pytest.raises(TimeMismatch, match='time points of rlut'):
+        plan.check('rlut', shifted)
+
+
+def test_global_mean_requires_time_first():
+    cube = monthly_cube()
+    cube.transpose([1, 0, 2])
+    with pytest.raises(ValueError):
+        global_mean(cube)
+
+
+@pytest.mark.parametrize('calendar', ['standard', 'noleap', '360_day'])
+def test_years_without_a_date_per_step(calendar):
+    cube = monthly_cube(nyears=4, calendar=calendar)
+    time = cube.coord('time')
+    expected = [date.year for date in time.units.num2date(time.points)]
+    plan = TimePlan(time)
+    assert list(plan.years) == expected
+    assert list(plan.unique_years) == [1850, 1851, 1852, 1853]
+    assert plan.unique_years.dtype.kind == 'i'
+    # a step starting exactly on the first of January belongs to that year
+    assert list(TimePlan(time.copy(time.bounds[:, 0])).years) == expected
+
+
+def test_month_length_weights():
+    cube = monthly_cube(nyears=2, calendar='noleap')
+    monthly = np.arange(24.0)
+    days = np.tile([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], 2)
+    weighted = TimePlan(cube.coord('time'), month_weights=True)
+    np.testing.assert_allclose(weighted.annual_mean(monthly), [np.average(monthly[:12], weights=days[:12]),
+                                                               np.average(monthly[12:], weights=days[12:])])
+    np.testing.assert_allclose(TimePlan(cube.coord('time')).annual_mean(monthly), [5.5, 17.5])
+    # in a 360-day calendar every month is as long
+    cube = monthly_cube(nyears=2, calendar='360_day')
+    np.testing.assert_allclose(TimePlan(cube.coord('time'), month_weights=True).annual_mean(monthly), [5.5, 17.5])
+    # without bounds, weighted by the spacing of the points
+    time = cube.coord('time').copy()
+    time.bounds = None
+    np.testing.assert_allclose(TimePlan(time, month_weights=True).annual_mean(monthly), [5.5, 17.5])
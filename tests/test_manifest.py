@@ -0,0 +1,95 @@
+import os
+
+from cmip56forcing.manifest import Manifest, describe_inputs, merge
+
+
+def stat(paths):
+    return {path: (os.stat(path).st_size, os.stat(path).st_mtime) for path in paths}
+
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def setup(tmp_path, with_checksums=False):
+    tmp_path.mkdir(exist_ok=True)
+    inputs = [str(tmp_path / 'tas_1.nc'), str(tmp_path / 'tas_2.nc')]
+    for path in inputs:
+        write(path, 'data')
+    output = tmp_path / 'output'
+    output.mkdir()
+    write(str(output / 'historical.csv'), 'time,tas')
+    manifest = Manifest(str(tmp_path / 'manifest.json'))
+    manifest.record(
+        'CanESM5', 'r1i1p1f1', 'historical', True, describe_inputs(stat(inputs), with_checksums), ['historical.csv']
+    )
+    return manifest, inputs, str(output)
+
+
+def test_new_and_current(tmp_path):
+    manifest, inputs, output = setup(tmp_path)
+    assert manifest.status('CanESM5', 'r2i1p1f1', 'historical', stat(inputs), output) == 'new'
+    assert manifest.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'current'
+    # saved and read back
+    reloaded = Manifest(manifest.path)
+    assert reloaded.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'current'
+    assert reloaded.units['CanESM5/r1i1p1f1/historical']['attempts'] == 1
+
+
+def test_stale_when_inputs_or_outputs_change(tmp_path):
+    manifest, inputs, output = setup(tmp_path)
+    assert manifest.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs[:1]), output) == 'stale'
+    write(inputs[0], 'changed data')
+    assert manifest.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'stale'
+
+    manifest, inputs, output = setup(tmp_path / 'again')
+    os.remove(os.path.join(output, 'historical.csv'))
+    assert manifest.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'stale'
+
+
+def test_touched_file_is_current_with_checksums(tmp_path):
+    manifest, inputs, output = setup(tmp_path, with_checksums=True)
+    os.utime(inputs[0], (1, 1))
+    assert manifest.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'current'
+    # the new mtime is stored so the file is not checksummed again
+    assert Manifest(manifest.path).units['CanESM5/r1i1p1f1/historical']['inputs'][0]['mtime'] == 1
+
+    # same size, different content
+    write(inputs[0], 'atad')
+    assert manifest.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'stale'
+
+
+def test_touched_file_is_stale_without_checksums(tmp_path):
+    manifest, inputs, output = setup(tmp_path)
+    os.utime(inputs[0], (1, 1))
+    assert manifest.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'stale'
+
+
+def test_failed_until_inputs_change(tmp_path):
+    manifest, inputs, output = setup(tmp_path)
+    manifest.record('CanESM5', 'r1i1p1f1', 'historical', False, describe_inputs(stat(inputs)), error='length of rlut did not match tas')
+    assert manifest.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'failed'
+    assert manifest.failures() == {'CanESM5/r1i1p1f1/historical': 'length of rlut did not match tas'}
+    assert manifest.units['CanESM5/r1i1p1f1/historical']['attempts'] == 2
+
+    write(inputs[1], 'more data')
+    assert manifest.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'changed'
+
+
+def test_shards_read_the_main_manifest_and_merge_into_it(tmp_path):
+    manifest, inputs, output = setup(tmp_path)
+    first, second = manifest.shard(0, 2), manifest.shard(1, 2)
+    assert first.path.endswith('manifest.shard-0-of-2.json')
+    assert first.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'current'
+    first.record('CanESM5', 'r1i1p1f1', 'historical', False, describe_inputs(stat(inputs)), error='ValueError')
+    second.record('MIROC6', 'r1i1p1f1', 'historical', True, describe_inputs(stat(inputs)), ['historical.csv'])
+    assert first.units['CanESM5/r1i1p1f1/historical']['attempts'] == 2
+    # the main manifest is not written to until the merge
+    assert Manifest(manifest.path).units['CanESM5/r1i1p1f1/historical']['status'] == 'ok'
+
+    assert merge(manifest.path) == 2
+    merged = Manifest(manifest.path)
+    assert merged.status('CanESM5', 'r1i1p1f1', 'historical', stat(inputs), output) == 'failed'
+    assert merged.status('MIROC6', 'r1i1p1f1', 'historical', stat(inputs), output) == 'current'
+    assert not os.path.exists(first.path) and not os.path.exists(second.path)
@@ -0,0 +1,84 @@
+import os
+import time
+
+from cmip56forcing import pipeline
+from cmip56forcing.pipeline import Stage
+
+
+def log(directory, name):
+    with open(os.path.join(directory, 'log'), 'a') as f:
+        f.write(name + '\n')
+
+
+def ran(directory):
+    path = os.path.join(directory, 'log')
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return f.read().split()
+
+
+def source(directory, value):
+    log(directory, 'source')
+    return value
+
+
+def double(source, directory):
+    log(directory, 'double')
+    return 2 * source
+
+
+def add(double, directory, offset):
+    log(directory, 'add')
+    return double + offset
+
+
+def stages(directory, value=1, offset=10):
+    return [
+        Stage('source', source, params={'directory': directory, 'value': value}, always=True, local=True),
+        Stage('double', double, ('source',), params={'directory': directory}),
+        Stage('add', add, ('double',), params={'directory': directory, 'offset': offset}),
+    ]
+
+
+def test_only_stale_stages_rerun(tmp_path):
+    directory, cache = str(tmp_path), str(tmp_path / 'cache')
+    outcomes = pipeline.run(stages(directory), workers=2, cache_dir=cache, report=lambda message: None)
+    assert ran(directory) == ['source', 'double', 'add']
+    assert pipeline.load_output('add', outcomes['add'].key, cache) == 12
+
+    # the source runs every time, but its output is unchanged
+    outcomes = pipeline.run(stages(directory), workers=2, cache_dir=cache, report=lambda message: None)
+    assert ran(directory)[3:] == ['source']
+    assert not outcomes['double'].ran and not outcomes['add'].ran
+
+    # a parameter of the last stage reruns only that
+    outcomes = pipeline.run(stages(directory, offset=20), workers=2, cache_dir=cache, report=lambda message: None)
+    assert ran(directory)[4:] == ['source', 'add']
+    assert pipeline.load_output('add', outcomes['add'].key, cache) == 22
+    assert len(os.listdir(cache)) == 3
+
+    # a change of the source's output reruns everything after it
+    outcomes = pipeline.run(stages(directory, value=2), ['double'], 2, cache, report=lambda message: None)
+    assert ran(directory)[6:] == ['source', 'double']
+    assert 'add' not in outcomes
+
+
+def wait_for(directory, name, other):
+    # only finishes if the other stage runs at the same time
+    open(os.path.join(directory, name), 'w').close()
+    deadline = time.time() + 20
+    while not os.path.exists(os.path.join(directory, other)):
+        if time.time() > deadline:
+            raise TimeoutError(other)
+        time.sleep(0.01)
+    return name
+
+
+def test_independent_stages_run_at_once(tmp_path):
+    directory = str(tmp_path)
+    outcomes = pipeline.run([
+        Stage('a', wait_for, params={'directory': directory, 'name': 'a', 'other': 'b'}),
+        Stage('b', wait_for, params={'directory': directory, 'name': 'b', 'other': 'a'}),
+    ], workers=2, cache_dir=str(tmp_path / 'cache'), report=lambda message: None)
+    assert outcomes['a'].ran and outcomes['b'].ran
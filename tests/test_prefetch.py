@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from cmip56forcing.prefetch import Prefetcher
+
+
+def make_units(tmp_path, n, size=2**19):
+    units = []
+    for i in range(n):
+        files = []
+        for var in ['rsdt', 'tas']:
+            path = tmp_path / 'archive' / ('%s_r%di1p1f1.nc' % (var, i))
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(b'x' * size)
+            files.append(str(path))
+        units.append(('CanESM5', 'r%di1p1f1' % i, {'rsdt': files[:1], 'tas': files[1:]}))
+    return units
+
+
+def test_copies_in_order_and_release_deletes(tmp_path):
+    units = make_units(tmp_path, 3)
+    prefetcher = Prefetcher(str(tmp_path / 'scratch'), depth=1)
+    staged = []
+    for unit, local in prefetcher.stage(units):
+        staged.append(unit)
+        assert os.path.dirname(local['tas'][0]) == os.path.join(prefetcher.directory, 'CanESM5', unit[1])
+        assert open(local['tas'][0], 'rb').read() == open(unit[2]['tas'][0], 'rb').read()
+        prefetcher.release(unit[0], unit[1])
+        assert not os.path.exists(local['tas'][0])
+    assert staged == units
+    assert prefetcher.report()['bytes'] == 3 * 2**20
+    prefetcher.close()
+    assert os.listdir(str(tmp_path / 'scratch')) == []
+
+
+def test_prefetchers_sharing_scratch_keep_their_copies(tmp_path):
+    # as shards extracting the same run for different experiments would
+    units = make_units(tmp_path, 1)
+    first = Prefetcher(str(tmp_path / 'scratch'), experiment='historical')
+    second = Prefetcher(str(tmp_path / 'scratch'), experiment='hist-GHG')
+    (unit, local), = first.stage(units)
+    (_, other), = second.stage(units)
+    assert local['tas'] != other['tas']
+    first.release(unit[0], unit[1])
+    assert not os.path.exists(local['tas'][0])
+    assert open(other['tas'][0], 'rb').read() == open(unit[2]['tas'][0], 'rb').read()
+
+
+def test_budget_is_not_exceeded(tmp_path):
+    # each unit is 1 MB, so only one fits in 1.5 MB; the consumer collects in idle
+    units = make_units(tmp_path, 4)
+    prefetcher = Prefetcher(str(tmp_path / 'scratch'), depth=4, budget_mb=1.5)
+    held = []
+
+    def idle():
+        while held:
+            prefetcher.release(*held.pop())
+
+    for (model, run, filelists), local in prefetcher.stage(units, idle=idle, poll=0.01):
+        assert not isinstance(local, Exception)
+        assert len(os.listdir(os.path.join(prefetcher.directory, 'CanESM5'))) == 1
+        held.append((model, run))
+    assert prefetcher.report()['bytes'] == 4 * 2**20
+
+
+def test_errors_are_passed_to_the_consumer(tmp_path):
+    units = make_units(tmp_path, 1) + [('CanESM5', 'r9i1p1f1', {'tas': [str(tmp_path / 'missing.nc')]})]
+    prefetcher = Prefetcher(str(tmp_path / 'scratch'))
+    outcomes = [local for unit, local in prefetcher.stage(units)]
+    assert isinstance(outcomes[0], dict)
+    assert isinstance(outcomes[1], FileNotFoundError)
+
+    with pytest.raises(ValueError):
+        list(prefetcher.stage([('CanESM5', 'r1i1p1f1')]))
@@ -0,0 +1,42 @@
+import numpy as np
+from scipy.stats import linregress
+
+from cmip56forcing import regression
+
+
+def series(models=3, years=150):
+    rng = np.random.default_rng(1)
+    delta_T = 4 + np.cumsum(rng.normal(0.02, 0.1, (models, years)), axis=1)
+    delta_N = 7 - 0.9 * delta_T + rng.normal(0, 0.3, (models, years))
+    return delta_T, delta_N
+
+
+def test_window_fits_match_linregress():
+    delta_T, delta_N = series()
+    delta_N[1, 30] = np.nan
+    starts, stops = regression.all_windows(150)
+    fits = regression.window_fits(delta_T, delta_N, starts, stops)
+    assert fits.slope.shape == (3, len(starts))
+    for model in range(3):
+        for i in [0, 17, 2000, len(starts) - 1]:
+            x = delta_T[model, starts[i]:stops[i]]
+            y = delta_N[model, starts[i]:stops[i]]
+            valid = ~np.isnan(y)
+            expected = linregress(x[valid], y[valid])
+            assert fits.n[model, i] == valid.sum()
+            for field in ['slope', 'intercept', 'rvalue', 'stderr']:
+                assert np.isclose(getattr(fits, field)[model, i], getattr(expected, field), rtol=1e-8, atol=1e-10)
+
+
+def test_split_and_sliding_windows():
+    delta_T, delta_N = series()
+    early, late = regression.split_fits(delta_T, delta_N, regression.all_splits(150))
+    assert early.slope.shape == (3, 145)
+    split = 20 - 3
+    assert np.isclose(early.slope[0, split], linregress(delta_T[0, :20], delta_N[0, :20]).slope)
+    assert np.isclose(late.slope[0, split], linregress(delta_T[0, 20:], delta_N[0, 20:]).slope)
+
+    starts, stops = regression.sliding(150, 30)
+    assert len(starts) == 121 and np.all(stops - starts == 30)
+    # too few years to fit
+    assert np.isnan(regression.window_fits(delta_T, delta_N, 0, 2).slope).all()
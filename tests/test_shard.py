@@ -0,0 +1,47 @@
+import argparse
+
+import pytest
+
+from cmip56forcing import shard
+
+
+class Catalogue:
+    def __init__(self, sizes):
+        self.sizes = sizes
+
+    def stat(self, paths):
+        return {path: (self.sizes[path], 0.0) for path in paths if path in self.sizes}
+
+
+def test_parse():
+    assert shard.parse('0/4') == (0, 4)
+    assert shard.parse('3/4') == (3, 4)
+    for spec in ['4/4', '-1/4', '1/0', '1', 'a/b']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            shard.parse(spec)
+
+
+def test_assign_balances_and_is_deterministic():
+    keys = [('M%d' % n, 'historical', 'r1i1p1f1') for n in range(10)]
+    sizes = [100, 90, 80, 70, 60, 50, 40, 30, 20, 10]
+    shards = shard.assign(keys, sizes, 3)
+    loads = [sum(size for size, s in zip(sizes, shards) if s == n) for n in range(3)]
+    assert sorted(loads) == [180, 180, 190]
+    # the same whatever order the units are listed in
+    order = [3, 9, 0, 5, 1, 8, 2, 7, 4, 6]
+    assert [shard.assign([keys[n] for n in order], [sizes[n] for n in order], 3)[order.index(n)] for n in range(10)] == shards
+
+
+def test_select_covers_every_unit_once():
+    catalogue = Catalogue({'a': 5, 'b': 3, 'c': 3, 'd': 1})
+    units = {
+        'historical': [('A', 'r1', {'tas': ['a']}), ('B', 'r1', {'tas': ['b']})],
+        'piControl': [('A', 'r1', {'tas': ['c', 'd']}), ('C', 'r1', {'tas': []})],
+    }
+    chosen = [shard.select(units, catalogue, index, 2) for index in range(2)]
+    # 5 and 4 bytes go to different shards, 3 to the lighter and the empty unit to the other
+    assert [nbytes for _, nbytes, _ in chosen] == [5, 7]
+    assert all(total == 12 for _, _, total in chosen)
+    for experiment in units:
+        together = chosen[0][0][experiment] + chosen[1][0][experiment]
+        assert sorted(unit[:2] for unit in together) == sorted(unit[:2] for unit in units[experiment])
@@ -0,0 +1,54 @@
+import numpy as np
+
+from cmip56forcing import derived, implied_erf, results, statistics
+
+
+def test_streamed_merged_and_batched_agree_with_numpy():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(12, 30)) + 5
+    values[3, :10] = np.nan
+    values[:, 29] = np.nan
+
+    streamed = statistics.Accumulator()
+    for series in values:
+        streamed.add(series)
+    # as parallel workers would, in two parts
+    merged = statistics.combine([statistics.Accumulator.of(values[:5]), statistics.Accumulator.of(values[5:])])
+    for accumulator in [streamed, merged, statistics.Accumulator.of(values.T, axis=1)]:
+        np.testing.assert_allclose(accumulator.mean[:29], np.nanmean(values[:, :29], axis=0), rtol=1e-12)
+        np.testing.assert_allclose(accumulator.std(ddof=1)[:29], np.nanstd(values[:, :29], axis=0, ddof=1), rtol=1e-12)
+        np.testing.assert_array_equal(accumulator.count, (~np.isnan(values)).sum(axis=0))
+        assert np.isnan(accumulator.mean[29]) and np.isnan(accumulator.std()[29])
+
+
+def test_weights_count_as_repeated_members():
+    values = np.array([[1.0, 2.0], [3.0, np.nan], [6.0, 4.0]])
+    weighted = statistics.Accumulator()
+    for series, weight in zip(values, [2, 1, 3]):
+        weighted.add(series, weight)
+    repeated = np.repeat(values, [2, 1, 3], axis=0)
+    np.testing.assert_allclose(weighted.mean, np.nanmean(repeated, axis=0))
+    np.testing.assert_allclose(weighted.variance(), np.nanvar(repeated, axis=0))
+    np.testing.assert_allclose(statistics.Accumulator.of(values, [2, 1, 3]).variance(), weighted.variance())
+
+
+def test_multi_model_statistics_of_model_means():
+    runs = np.array([['r1', 'r2', ''], ['r1', '', ''], ['', '', '']])
+    delta_F = np.array([
+        [[1.0, 2.0], [3.0, 4.0], [np.nan, np.nan]],
+        [[5.0, 5.0], [np.nan, np.nan], [np.nan, np.nan]],
+        [[np.nan, np.nan]] * 3,
+    ])
+    erf = derived.ExperimentSet(['A', 'B', 'C'], {'historical': runs}, {
+        'historical': implied_erf.ImpliedERF(delta_F, delta_F, delta_F)})
+    per_model = results.model_statistics(erf, 'historical')
+    assert list(per_model) == ['A', 'B']
+    np.testing.assert_array_equal(per_model['A'].mean, [2.0, 3.0])
+
+    multi = results.multi_model_statistics(per_model)
+    np.testing.assert_array_equal(multi.mean, [3.5, 4.0])
+    np.testing.assert_array_equal(multi.std(), [1.5, 1.0])
+    np.testing.assert_array_equal(results.multi_model_statistics(per_model, ['B', 'C']).mean, [5.0, 5.0])
+    assert results.multi_model_statistics(per_model, years=slice(0, 2)).mean == 3.75
+    only_r2 = results.model_statistics(erf, 'historical', weights={'A': {'r2': 1.0}})
+    np.testing.assert_array_equal(only_r2['A'].mean, [3.0, 4.0])
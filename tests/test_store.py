@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from cmip56forcing.store import Store  # noqa: E402
+
+
+def annual(start, years, value):
+    return pd.DataFrame({
+        'time': ['%04d-07-02 12:00:00' % year for year in range(start, start + years)],
+        'year': np.arange(start, start + years),
+        'rsdt': np.full(years, value),
+        'tas': np.full(years, 287.0),
+    })
+
+
+def test_append_read_and_supersede(tmp_path):
+    store = Store(tmp_path / 'store')
+    store.append('historical', 'CanESM5', 'r1i1p1f1', annual(1850, 3, 340.0), json.dumps({'parent': 'piControl'}))
+    store.append('historical', 'UKESM1-0-LL', 'r1i1p1f2', annual(1850, 2, 341.0), '{}')
+    store.append('historical', 'CanESM5', 'r1i1p1f1', annual(1850, 4, 342.0), json.dumps({'parent': 'other'}))
+
+    frame = store.read('historical')
+    canesm = frame[frame['model'] == 'CanESM5']
+    assert list(canesm['year']) == [1850, 1851, 1852, 1853]
+    assert (canesm['rsdt'] == 342.0).all()
+    assert frame['year'].dtype == np.int32
+    assert len(frame) == 6
+    assert store.attributes('historical')[('CanESM5', 'r1i1p1f1')] == {'parent': 'other'}
+    assert list(store.read('historical', models=['UKESM1-0-LL'], columns=['tas']).columns) == ['model', 'run', 'tas']
+
+    store.compact()
+    assert len(list((tmp_path / 'store' / 'annual' / 'experiment=historical').glob('part-*'))) == 1
+    pd.testing.assert_frame_equal(store.read('historical'), frame)
+
+
+def test_csv_round_trip(tmp_path):
+    store = Store(tmp_path / 'store')
+    store.append('historical', 'CanESM5', 'r1i1p1f1', annual(1850, 3, 340.1234567891234), '{"a": 1}')
+    store.append('piControl', 'CanESM5', 'r1i1p1f1', annual(1, 2, 340.0))
+    assert store.export_csv(tmp_path / 'csv') == 2
+    run = tmp_path / 'csv' / 'cmip6' / 'CanESM5' / 'r1i1p1f1'
+    assert (run / 'meta_historical.json').read_text() == '{"a": 1}'
+    assert not (run / 'meta_piControl.json').exists()
+    assert list(pd.read_csv(run / 'historical.csv').columns) == ['time', 'rsdt', 'tas']
+
+    imported = Store(tmp_path / 'imported')
+    assert imported.import_csv(tmp_path / 'csv') == 2
+    for experiment in ['historical', 'piControl']:
+        pd.testing.assert_frame_equal(imported.read(experiment), store.read(experiment))
+    assert imported.attributes('historical') == {('CanESM5', 'r1i1p1f1'): {'a': 1}}
+
+
+def test_runs_with_the_year_axis_export_without_dates(tmp_path):
+    store = Store(tmp_path / 'store')
+    store.append('historical', 'CanESM5', 'r1i1p1f1', annual(1850, 2, 340.0))
+    store.append('historical', 'MIROC6', 'r1i1p1f1', annual(1850, 2, 341.0).drop(columns='time'))
+    store.export_csv(tmp_path / 'csv')
+    assert list(pd.read_csv(tmp_path / 'csv' / 'cmip6' / 'MIROC6' / 'r1i1p1f1' / 'historical.csv').columns) == ['year', 'rsdt', 'tas']
+    assert list(pd.read_csv(tmp_path / 'csv' / 'cmip6' / 'CanESM5' / 'r1i1p1f1' / 'historical.csv').columns) == ['time', 'rsdt', 'tas']
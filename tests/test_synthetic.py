@@ -0,0 +1,46 @@
+import glob
+import os
+
+import netCDF4
+import pandas as pd
+
+from cmip56forcing import synthetic
+from cmip56forcing.extract import process_run
+
+
+def files(root, model, experiment, var):
+    return sorted(glob.glob(os.path.join(root, model, experiment, '*', 'Amon', var, '*', '*.nc')))
+
+
+def test_archive_layout_and_quirks(tmp_path):
+    specs = [spec for spec in synthetic.SPECS if spec.name in ['UKESM1-0-LL', 'MIROC6', 'KACE-1-0-G']]
+    paths = synthetic.write_archive(tmp_path, specs, years=3, control_years=4, years_per_file=2, members=2, grid=(8, 16))
+    # 3 models, 2 historical runs and a piControl, 4 variables, 2 files each
+    assert len(paths) == 3 * 3 * 4 * 2
+    assert os.path.basename(paths[0]) == 'rsdt_Amon_UKESM1-0-LL_historical_r1i1p1f2_gn_185001-185112.nc'
+    assert os.path.isdir(tmp_path / 'UKESM1-0-LL' / 'historical' / 'r2i1p1f2')
+
+    with netCDF4.Dataset(files(tmp_path, 'UKESM1-0-LL', 'historical', 'tas')[0]) as ds:
+        assert ds['time'].calendar == '360_day'
+        assert list(ds['time_bnds'][0]) == [0, 30]
+        assert ds['tas'].shape == (24, 8, 16)
+    with netCDF4.Dataset(files(tmp_path, 'MIROC6', 'historical', 'tas')[0]) as ds:
+        assert 'time_bnds' not in ds.variables and 'lat_bnds' not in ds.variables
+    first, second = files(tmp_path, 'KACE-1-0-G', 'piControl', 'tas')
+    with netCDF4.Dataset(first) as a, netCDF4.Dataset(second) as b:
+        assert a['time_bnds'].dtype.kind == 'f' and b['time_bnds'].dtype.kind == 'i'
+        assert a.tracking_id != b.tracking_id
+
+
+def test_quirky_runs_extract_with_both_readers(tmp_path):
+    specs = [spec for spec in synthetic.SPECS if spec.name in ['NorESM2-LM', 'AWI-CM-1-1-MR']]
+    synthetic.write_archive(tmp_path / 'archive', specs, years=2, control_years=2, years_per_file=1, grid=(8, 16))
+    for model, experiment in [('NorESM2-LM', 'piControl'), ('AWI-CM-1-1-MR', 'historical')]:
+        filelists = {var: files(tmp_path / 'archive', model, experiment, var) for var in ['rsdt', 'rsut', 'rlut', 'tas']}
+        frames = []
+        for reader in ['auto', 'iris']:
+            output = tmp_path / reader
+            assert process_run(model, 'r1i1p1f1', experiment, filelists, output, reader=reader)[2]
+            frames.append(pd.read_csv(output / 'cmip6' / model / 'r1i1p1f1' / ('%s.csv' % experiment)))
+        assert len(frames[0]) == 2
+        pd.testing.assert_frame_equal(frames[0], frames[1], rtol=1e-12)
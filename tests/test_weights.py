@@ -0,0 +1,40 @@
+import iris.coords
+import iris.cube
+import numpy as np
+
+from cmip56forcing import weights
+from cmip56forcing.reduce import area_weights_2d
+
+
+def grid_cube(nlat=6, nlon=8):
+    """(time, latitude, longitude) cube of zeros on a regular grid with bounds."""
+    time = iris.coords.DimCoord(np.arange(2.0), 'time', units='days since 1850-01-01')
+    latitude = iris.coords.DimCoord(np.linspace(-75, 75, nlat), 'latitude', units='degrees')
+    longitude = iris.coords.DimCoord(np.arange(0, 360, 360 / nlon), 'longitude', units='degrees')
+    latitude.guess_bounds()
+    longitude.guess_bounds()
+    return iris.cube.Cube(np.zeros((2, nlat, nlon)), dim_coords_and_dims=[(time, 0), (latitude, 1), (longitude, 2)])
+
+
+def test_weights_are_computed_once_per_grid(tmp_path):
+    cache = weights.GridWeightsCache(str(tmp_path))
+    cube = grid_cube()
+    np.testing.assert_array_equal(cache.weights(cube), area_weights_2d(cube))
+    cache.weights(cube.copy(data=np.ones(cube.shape)))
+    cache.weights(grid_cube(nlat=3))
+    assert cache.stats() == {'hits': 1, 'disk_hits': 0, 'misses': 2}
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+
+    # as another worker would, from the files of the first
+    other = weights.GridWeightsCache(str(tmp_path))
+    np.testing.assert_array_equal(other.weights(cube), area_weights_2d(cube))
+    assert other.stats() == {'hits': 1, 'disk_hits': 1, 'misses': 0}
+
+
+def test_signature_follows_the_grid():
+    cube = grid_cube()
+    assert weights.grid_signature(cube) == weights.grid_signature(grid_cube())
+    shifted = cube.copy()
+    shifted.coord('longitude').points = shifted.coord('longitude').points + 1
+    assert weights.grid_signature(shifted) != weights.grid_signature(cube)
+    assert weights.grid_signature(grid_cube(nlon=4)) != weights.grid_signature(cube)